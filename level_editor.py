@@ -1,53 +1,461 @@
+import argparse
+import base64
+import cProfile
+import hashlib
+import html
+import io
+import json
+import marshal
+import mmap
 import os
 import random
 import re
+import sqlite3
 import struct
+import sys
+import tempfile
+import threading
+import time
 import tkinter as tk
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass, field
 from tkinter import filedialog, messagebox
 
 
-@dataclass
 class SpawnObject:
-    id: int
-    wave: int = 0
-    roll_index: int = 0
-    options: list = field(default_factory=list)  # [(spawn_id, weight), ...]
+    """One spawn record. options is a tuple of (spawn_id, weight) pairs so
+    identical random pools can be shared; see EntityStore."""
+    __slots__ = ("id", "wave", "roll_index", "options")
 
-    def __post_init__(self):
-        self.id &= 0xFFFF
-        self.wave &= 0xFF
-        self.roll_index &= 0xFF
-        cleaned = []
-        for pid, weight in self.options:
-            cleaned.append((int(pid) & 0xFFFF, int(weight) & 0xFFFF))
-        self.options = cleaned
+    def __init__(self, id, wave=0, roll_index=0, options=()):
+        self.id = id & 0xFFFF
+        self.wave = wave & 0xFF
+        self.roll_index = roll_index & 0xFF
+        self.options = tuple((int(pid) & 0xFFFF, int(weight) & 0xFFFF) for pid, weight in options)
+
+    def _key(self):
+        return (self.id, self.wave, self.roll_index, self.options)
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._key() == other._key()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"SpawnObject(id={self.id}, wave={self.wave}, roll_index={self.roll_index}, options={list(self.options)})"
 
     @property
     def is_random(self):
         return self.id == 0xFFFF
 
 
+class EntityStore:
+    """Level entities: a mapping of (x, y) -> [SpawnObject, ...] that keeps
+    indexes by spawn id, pool option id, wave and roll group up to date on
+    every write, so queries cost O(result) instead of a scan.
+
+    Assign or delete whole cell lists; mutating a list or record in place
+    bypasses the indexes.
+    """
+
+    def __init__(self, cells=None):
+        self._cells = {}
+        self._by_id = {}      # spawn id -> {cell: record count}
+        self._by_option = {}  # pool option spawn id -> {cell: record count}
+        self._by_wave = {}    # wave -> {cell: record count}
+        self._by_roll = {}    # nonzero roll_index of random records -> {cell: record count}
+        self._pools = {}      # options tuple -> shared instance
+        self.version = 0      # bumped on every write
+        for cell, ent_list in (cells or {}).items():
+            self[cell] = ent_list
+
+    def _index(self, cell, ent_list, delta):
+        def bump(index, key):
+            counts = index.setdefault(key, {})
+            n = counts.get(cell, 0) + delta
+            if n:
+                counts[cell] = n
+            else:
+                del counts[cell]
+                if not counts:
+                    del index[key]
+
+        for ent in ent_list:
+            bump(self._by_id, ent.id)
+            bump(self._by_wave, ent.wave)
+            if ent.is_random:
+                for pid in {pid for pid, _weight in ent.options}:
+                    bump(self._by_option, pid)
+                if ent.roll_index:
+                    bump(self._by_roll, ent.roll_index)
+
+    def __setitem__(self, cell, ent_list):
+        old = self._cells.get(cell)
+        if old is not None:
+            self._index(cell, old, -1)
+        for ent in ent_list:
+            if ent.options:
+                ent.options = self._pools.setdefault(ent.options, ent.options)
+        ent_list = list(ent_list)
+        self._cells[cell] = ent_list
+        self._index(cell, ent_list, 1)
+        self.version += 1
+
+    def __delitem__(self, cell):
+        self._index(cell, self._cells.pop(cell), -1)
+        self.version += 1
+
+    def append(self, cell, ent):
+        self[cell] = self._cells.get(cell, []) + [ent]
+
+    def pop(self, cell, *default):
+        if cell not in self._cells:
+            if default:
+                return default[0]
+            raise KeyError(cell)
+        ent_list = self._cells[cell]
+        del self[cell]
+        return ent_list
+
+    def __getitem__(self, cell):
+        return self._cells[cell]
+
+    def get(self, cell, default=None):
+        return self._cells.get(cell, default)
+
+    def __contains__(self, cell):
+        return cell in self._cells
+
+    def __iter__(self):
+        return iter(self._cells)
+
+    def __len__(self):
+        return len(self._cells)
+
+    def __eq__(self, other):
+        if isinstance(other, EntityStore):
+            return self._cells == other._cells
+        if isinstance(other, dict):
+            return self._cells == other
+        return NotImplemented
+
+    def keys(self):
+        return self._cells.keys()
+
+    def values(self):
+        return self._cells.values()
+
+    def copy(self):
+        """A store with the same cells; the (never mutated) cell lists are shared."""
+        other = EntityStore.__new__(EntityStore)
+        other._cells = dict(self._cells)
+        for name in ("_by_id", "_by_option", "_by_wave", "_by_roll"):
+            setattr(other, name, {key: dict(counts) for key, counts in getattr(self, name).items()})
+        other._pools = self._pools
+        other.version = self.version
+        return other
+
+    def record_count(self):
+        return sum(len(ent_list) for ent_list in self._cells.values())
+
+    def items(self):
+        return self._cells.items()
+
+    def cells_with_id(self, spawn_id, pools=True):
+        """Cells with a record of spawn_id, or (if pools) a random pool that can roll it."""
+        cells = set(self._by_id.get(spawn_id, ()))
+        if pools:
+            cells.update(self._by_option.get(spawn_id, ()))
+        return cells
+
+    def cells_in_wave(self, wave):
+        return set(self._by_wave.get(wave, ()))
+
+    def cells_in_roll_group(self, roll_index):
+        """Cells whose random records share roll_index (0 means independent rolls)."""
+        return set(self._by_roll.get(roll_index, ()))
+
+    def random_cells(self):
+        return self.cells_with_id(0xFFFF, pools=False)
+
+    def spawn_ids(self, pools=True):
+        """Every spawn id placed directly (and, if pools, reachable through a pool)."""
+        ids = set(self._by_id)
+        ids.discard(0xFFFF)
+        if pools:
+            ids.update(self._by_option)
+        return ids
+
+    def waves(self):
+        return set(self._by_wave)
+
+    def roll_groups(self):
+        return set(self._by_roll)
+
+    def replace_id(self, old_id, new_id):
+        """Replace old_id with new_id in fixed records and pool options; return the changed cells."""
+        old_id &= 0xFFFF
+        new_id &= 0xFFFF
+        changed = self.cells_with_id(old_id)
+        for cell in changed:
+            self[cell] = [
+                SpawnObject(
+                    id=new_id if ent.id == old_id else ent.id,
+                    wave=ent.wave,
+                    roll_index=ent.roll_index,
+                    options=[(new_id if pid == old_id else pid, weight) for pid, weight in ent.options],
+                )
+                for ent in self._cells[cell]
+            ]
+        return changed
+
+
+@dataclass
+class RandomTile:
+    roll_index: int = 0
+    options: list = field(default_factory=list)  # [(tile_id, weight), ...]
+
+    def __post_init__(self):
+        self.roll_index &= 0xFF
+        self.options = [(int(tid) & 0xFFFF, int(weight) & 0xFFFF) for tid, weight in self.options]
+
+    def resolved_id(self):
+        """The option the editor displays for this cell, picked by roll_index."""
+        return self.options[self.roll_index % len(self.options)][0] if self.options else 0
+
+
 class LevelData:
-    def __init__(self):
+    def __init__(self, width=10, height=10):
         self.path = None
         self.version = 2
-        self.width = 10
-        self.height = 10
+        self.width = width
+        self.height = height
         self.mode = 1
         self.spawn_file = "spawns.gon"
         self.tiles_file = "tiles.gon"
-        self.tiles = [0] * (self.width * self.height)
-        self.entities = {}  # (x,y) -> [SpawnObject, ...]
+        self.camera = (0, 0, self.width, self.height)  # x, y, w, h from the header
+        # One array('H') per tile layer, in editor row order (flipped from the
+        # file). Random tiles are 0xFFFF with their pool in random_tiles.
+        self.layers = [array("H", bytes(2 * width * height))]
+        self.random_tiles = {}  # (layer, index) -> RandomTile
+        self.raw_layers = []  # per-layer bytes as loaded; reused on save unless the layer is dirty
+        self.dirty_layers = set()
+        self.entities = EntityStore()  # (x,y) -> [SpawnObject, ...]
         self.raw_prefix = b""
-        self.raw_tiles = b""
+        self.raw_prefix_key = None  # the _prefix_key() fields raw_prefix encodes
         self.raw_spawns = b""
-        self.original_tiles = []
+        self.raw_spawns_key = None  # (EntityStore, version) raw_spawns encodes
         self.original_entities = []
         self.tail = b""
 
+    @property
+    def tiles(self):
+        """Layer 0, the layer the editor draws and paints."""
+        return self.layers[0]
+
+    def tile_at(self, x, y, layer=0):
+        """Tile id to show at (x, y); random tiles resolve through their pool."""
+        index = y * self.width + x
+        tile_id = self.layers[layer][index]
+        if tile_id == 0xFFFF:
+            random_tile = self.random_tiles.get((layer, index))
+            return random_tile.resolved_id() if random_tile else 0
+        return tile_id
+
+    def set_tile(self, x, y, tile_id, layer=0):
+        index = y * self.width + x
+        self.random_tiles.pop((layer, index), None)
+        self.layers[layer][index] = tile_id
+        self.dirty_layers.add(layer)
+
+
+_HEADER = struct.Struct("<9i")
+_I32 = struct.Struct("<i")
+_U16 = struct.Struct("<H")
+_POOL_HEAD = struct.Struct("<BB")
+_POOL_OPTION = struct.Struct("<HH")
+_SPAWN_HEAD = struct.Struct("<hhHBB")
+
+
+def _read_pool(buf, offset):
+    """Read a (count, roll_index, [(id, weight), ...]) random pool record."""
+    num_poss, roll_index = _POOL_HEAD.unpack_from(buf, offset)
+    offset += 2
+    end = offset + num_poss * 4
+    if end > len(buf):
+        raise struct.error(f"random pool at offset {offset - 2} runs past end of data")
+    poss = list(_POOL_OPTION.iter_unpack(buf[offset:end]))
+    return roll_index, poss, end
+
+
+def _decode_layer(buf, offset, tile_count):
+    """Decode one tile layer, returning (values, random_tiles, end_offset).
+
+    values keeps 0xFFFF for random tiles; random_tiles maps their index to
+    the RandomTile pool. Runs of plain uint16s between random tiles are
+    read in bulk; only the pool records are walked. The run length tried
+    after a pool follows the gap before it, so dense pools don't re-read
+    the rest of the layer each time.
+    """
+    values = array("H")
+    random_tiles = {}
+    index, run = 0, tile_count
+    while index < tile_count:
+        if offset + (tile_count - index) * 2 > len(buf):
+            raise struct.error(f"tile layer at offset {offset} runs past end of data")
+        if buf[offset:offset + 2] == b"\xff\xff":
+            values.append(0xFFFF)
+            roll_index, poss, offset = _read_pool(buf, offset + 2)
+            random_tiles[index] = RandomTile(roll_index, poss)
+            index += 1
+            continue
+        count = min(tile_count - index, run)
+        end = offset + count * 2
+        chunk = array("H")
+        chunk.frombytes(buf[offset:end])
+        if sys.byteorder != "little":
+            chunk.byteswap()
+        try:
+            stop = chunk.index(0xFFFF)
+        except ValueError:
+            values.extend(chunk)
+            index, offset, run = index + count, end, run * 2
+            continue
+        values.extend(chunk[:stop + 1])
+        index += stop + 1
+        roll_index, poss, offset = _read_pool(buf, offset + (stop + 1) * 2)
+        random_tiles[index - 1] = RandomTile(roll_index, poss)
+        run = max(16, stop * 2)
+    return values, random_tiles, offset
+
+
+def _flip_rows(values, width, height):
+    """Reverse the row order of a width x height array('H') (file <-> editor)."""
+    out = array("H")
+    for y in range(height - 1, -1, -1):
+        out.extend(values[y * width:(y + 1) * width])
+    return out
+
+
+def _encode_layer(values, random_tiles, width, height):
+    """Encode one editor-order layer in file order; random_tiles maps cell
+    index -> RandomTile for the 0xFFFF cells."""
+    out = _flip_rows(values, width, height)
+    if 0xFFFF not in out:
+        if sys.byteorder != "little":
+            out.byteswap()
+        return out.tobytes()
+    chunks = []
+    for index, tile_id in enumerate(out):
+        chunks.append(_U16.pack(tile_id))
+        if tile_id == 0xFFFF:
+            editor_index = (height - 1 - index // width) * width + index % width
+            random_tile = random_tiles.get(editor_index) or RandomTile()
+            if len(random_tile.options) > 255:
+                raise ValueError("Random tile has more than 255 options.")
+            chunks.append(_POOL_HEAD.pack(len(random_tile.options), random_tile.roll_index))
+            chunks.extend(_POOL_OPTION.pack(tid, weight) for tid, weight in random_tile.options)
+    return b"".join(chunks)
+
+
+def decode_level(data):
+    """Decode a level from any bytes-like object without copying its sections."""
+    buf = memoryview(data)
+    # Original LevelResource layout:
+    # version,width,height,nlayers,nspawns,camx,camy,camw,camh
+    version, width, height, nlayers, entity_count, camx, camy, camw, camh = _HEADER.unpack_from(buf, 0)
+    # Entity positions are int16, so no real level is larger than this.
+    if not (0 <= width <= 0x7FFF and 0 <= height <= 0x7FFF):
+        raise ValueError(f"Invalid level size {width}x{height}.")
+
+    offset = _HEADER.size
+    spawn_name_len = max(0, _I32.unpack_from(buf, offset)[0])
+    offset += 4
+    spawn_file = buf[offset:offset + spawn_name_len]
+    offset += spawn_name_len
+
+    tiles_name_len = max(0, _I32.unpack_from(buf, offset)[0])
+    offset += 4
+    tiles_file = buf[offset:offset + tiles_name_len]
+    offset += tiles_name_len
+
+    # Two reserved int32s.
+    offset += 8
+
+    tiles_start = offset
+
+    layers = []
+    layer_spans = []
+    random_tiles = {}  # (layer, index) -> RandomTile
+    tile_count = width * height
+    # An empty grid has empty layers; don't walk billions of them.
+    for layer_idx in range(max(0, nlayers) if tile_count else 0):
+        layer_start = offset
+        values, layer_random, offset = _decode_layer(buf, offset, tile_count)
+        layers.append(values)
+        layer_spans.append(buf[layer_start:offset])
+        random_tiles.update(((layer_idx, index), tile) for index, tile in layer_random.items())
+
+    # tile_grid is layer 0 with random tiles resolved, as the editor shows it.
+    tile_grid = layers[0].tolist() if layers else [0] * tile_count
+    for (layer_idx, index), tile in random_tiles.items():
+        if layer_idx == 0:
+            tile_grid[index] = tile.resolved_id()
+
+    spawns_start = offset
+    entities = []
+    unpack_head = _SPAWN_HEAD.unpack_from
+    for _ in range(max(0, entity_count)):
+        x, y, id_, wave, _reserved = unpack_head(buf, offset)
+        offset += 8
+        if id_ == 0xFFFF:
+            roll_index, options, offset = _read_pool(buf, offset)
+            record = SpawnObject(id=id_, wave=wave, roll_index=roll_index, options=options)
+        else:
+            record = SpawnObject(id=id_, wave=wave)
+        entities.append((x, y, record))
+
+    spawns_end = offset
+    return {
+        "data": data,
+        "version": version,
+        "width": width,
+        "height": height,
+        "mode": nlayers,
+        "entity_count": entity_count,
+        "tiles_start": tiles_start,
+        "spawns_start": spawns_start,
+        "spawns_end": spawns_end,
+        "tile_grid": tile_grid,
+        "layers": layers,
+        "raw_layers": layer_spans,
+        "random_tiles": random_tiles,
+        "entities": entities,
+        "spawn_file": str(spawn_file, "utf-8", errors="ignore"),
+        "tiles_file": str(tiles_file, "utf-8", errors="ignore"),
+        "raw_tiles": buf[tiles_start:spawns_start],
+        "raw_spawns": buf[spawns_start:spawns_end],
+        "tail": buf[spawns_end:],
+    }
+
 
 def load_level_file(path):
+    member = split_bundle_path(path)
+    if member is not None:
+        return decode_level(open_bundle(member[0]).data(member[1]))
+    with open(path, "rb") as f:
+        data = f.read()
+    return decode_level(data)
+
+
+def _load_level_file_reference(path):
+    """Original per-field loader, kept as the baseline for `bench`."""
     with open(path, "rb") as f:
         data = f.read()
 
@@ -104,8 +512,7 @@ def load_level_file(path):
         offset += 6
         wave = struct.unpack_from("<B", data, offset)[0]
         offset += 1
-        _reserved = struct.unpack_from("<B", data, offset)[0]
-        offset += 1
+        offset += 1  # reserved byte
 
         record = SpawnObject(id=id_, wave=wave)
         if id_ == 0xFFFF:
@@ -171,16 +578,14 @@ def _parse_gon_value(val):
     return val
 
 
-def _parse_gon(path):
-    """Parse a .gon file capturing all editor-block fields into {id: {key: value}}."""
-    if not os.path.exists(path):
-        return {}
+def _parse_gon_text_reference(text):
+    """Original line-based editor-block parser, kept as the baseline for `bench`."""
     defs = {}
     current_id = None
     depth = 0
     in_editor = False
     entry = {}
-    with open(path, "r", encoding="utf-8") as f:
+    with io.StringIO(text, newline=None) as f:
         for line in f:
             s = line.strip()
             if not s or s.startswith("//"):
@@ -221,277 +626,2665 @@ def _parse_gon(path):
     return defs
 
 
-def load_defs(tiles_path, spawns_path):
-    return {
-        "tiles": _parse_gon(tiles_path),
-        "spawns": _parse_gon(spawns_path),
-    }
+# One-pass GON scanner. Each match is, after optional whitespace, one of: a
+# comment; a key followed by `{`, a "string", a [list] or a bare word; a lone
+# brace; or a stray string. m.lastindex identifies which.
+_GON_SCAN = re.compile(
+    r'\s*(?://[^\n]*|#(?=\s)[^\n]*'
+    r'|([^\s{}\[\]"]+)\s*(?:"((?:[^"\\\n]|\\.)*)"|(\[(?:[^\[\]]|\[[^\[\]]*\])*\])|([^\s{}\[\]"]+)|(\{))'
+    r'|([{}])'
+    r'|"(?:[^"\\\n]|\\.)*")'
+)
+_GON_QUOTED, _GON_LIST, _GON_WORD, _GON_OPEN, _GON_BRACE = 2, 3, 4, 5, 6
+_GON_ITEM = re.compile(r'"((?:[^"\\\n]|\\.)*)"|(\[[^\]]*\])|([^\s,\[\]"]+)')
+_GON_TOKEN = re.compile(r'"((?:[^"\\\n]|\\.)*)"|([{}\[\]])|//[^\n]*|#(?=\s)[^\n]*|([^\s{}\[\]",]+)')
 
 
-class LevelEditor(tk.Tk):
-    def __init__(self):
-        super().__init__()
-        self.title("Level Editor")
-        self.resizable(True, True)
+class GonList(list):
+    """A GON [ ... ] list that remembers its source span."""
+    __slots__ = ("start", "end")
 
-        self.level = LevelData()
-        self.base_dir = os.path.dirname(os.path.abspath(__file__))
-        self._load_defs(
-            self._resolve_local_path("tiles.gon"),
-            self._resolve_local_path("spawns.gon"),
-        )
 
-        self.cell_size = 32
-        self.grid_origin = (10, 10)
-        self.canvas_size = self.cell_size * 10 + 20
-        self._icon_raw_cache = {}    # stem -> PhotoImage (full-size, color-keyed)
-        self._icon_tinted_cache = {} # (stem, tint) -> PhotoImage (full-size, tinted)
-        self._icon_cache = {}        # (stem, tint, cell_size) -> PhotoImage (subsampled)
+class GonBlock:
+    """A GON { ... } block: ordered (key, value) entries plus its source span.
 
-        self._build_ui()
-        self._on_mode_change()
-        self._on_spawn_type_change()
-        self._draw_grid()
+    Values are str, GonList or GonBlock. Keys may repeat; lookups return the
+    first match, as the editor always has.
+    """
+    __slots__ = ("entries", "start", "end")
 
-    def _build_ui(self):
-        top = tk.Frame(self)
-        top.pack(fill="x", padx=8, pady=6)
+    def __init__(self, start, end):
+        self.entries = []
+        self.start = start
+        self.end = end
 
-        tk.Label(top, text="File:").pack(side="left")
-        self.path_var = tk.StringVar(value="")
-        path_entry = tk.Entry(top, textvariable=self.path_var, width=40)
-        path_entry.pack(side="left", padx=6)
+    def get(self, key, default=None):
+        for k, v in self.entries:
+            if k == key:
+                return v
+        return default
 
-        tk.Button(top, text="Browse", command=self._browse).pack(side="left")
-        tk.Button(top, text="Create", command=self._create_room).pack(side="left", padx=4)
-        tk.Button(top, text="Load", command=self._load).pack(side="left", padx=4)
-        tk.Button(top, text="Save", command=self._save).pack(side="left", padx=4)
-        tk.Button(top, text="Save As", command=self._save_as).pack(side="left")
+    def get_all(self, key):
+        return [v for k, v in self.entries if k == key]
 
-        controls = tk.Frame(self)
-        controls.pack(fill="x", padx=8, pady=6)
+    def __contains__(self, key):
+        return any(k == key for k, _v in self.entries)
 
-        self.mode_var = tk.StringVar(value="tile")
-        tk.Label(controls, text="Mode:").pack(side="left")
-        tk.Radiobutton(controls, text="Tile", variable=self.mode_var, value="tile", command=self._on_mode_change).pack(side="left")
-        tk.Radiobutton(controls, text="Entity", variable=self.mode_var, value="entity", command=self._on_mode_change).pack(side="left")
+    def __iter__(self):
+        return (k for k, _v in self.entries)
 
-        def_row = tk.Frame(self)
-        def_row.pack(fill="x", padx=8, pady=(0, 4))
-        self.def_file_var = tk.StringVar(value=self.level.tiles_file)
-        tk.Entry(def_row, textvariable=self.def_file_var, width=20, state="readonly").pack(side="left", padx=(0, 6))
-        tk.Button(def_row, text="Change", command=self._change_def_file).pack(side="left")
+    def items(self):
+        return list(self.entries)
 
-        self.tile_var = tk.IntVar(value=0)
-        self.entity_id_var = tk.StringVar(value="")
-        self.entity_extra_var = tk.StringVar(value="0")
-        self.entity_spawn_type_var = tk.StringVar(value="fixed")
-        self.entity_roll_index_var = tk.StringVar(value="0")
-        self.pool_weight_var = tk.StringVar(value="1")
-        self.random_pool = []
-        self.preview_active = False
-        self.preview_map = {}
+    def __repr__(self):
+        return f"GonBlock({self.entries!r})"
 
-        self.entity_controls = tk.Frame(self)
-        self.entity_controls.pack(fill="x", padx=8, pady=(0, 6))
-        tk.Label(self.entity_controls, text="ID").pack(side="left")
-        tk.Entry(self.entity_controls, textvariable=self.entity_id_var, width=8).pack(side="left", padx=(4, 10))
-        tk.Label(self.entity_controls, text="Wave").pack(side="left")
-        tk.Entry(self.entity_controls, textvariable=self.entity_extra_var, width=5).pack(side="left", padx=(4, 10))
-        tk.Radiobutton(
-            self.entity_controls,
-            text="Fixed",
-            variable=self.entity_spawn_type_var,
-            value="fixed",
-            command=self._on_spawn_type_change,
-        ).pack(side="left")
-        tk.Radiobutton(
-            self.entity_controls,
-            text="Random",
-            variable=self.entity_spawn_type_var,
-            value="random",
-            command=self._on_spawn_type_change,
-        ).pack(side="left", padx=(4, 10))
 
-        self.random_controls = tk.Frame(self)
-        self.random_controls.pack(fill="x", padx=8, pady=(0, 6))
-        tk.Label(self.random_controls, text="Roll Index").pack(side="left")
-        tk.Entry(self.random_controls, textvariable=self.entity_roll_index_var, width=5).pack(side="left", padx=(4, 10))
-        tk.Label(self.random_controls, text="Weight").pack(side="left")
-        tk.Entry(self.random_controls, textvariable=self.pool_weight_var, width=6).pack(side="left", padx=(4, 10))
-        tk.Button(self.random_controls, text="Add", command=self._pool_add).pack(side="left")
-        tk.Button(self.random_controls, text="Remove", command=self._pool_remove).pack(side="left", padx=(4, 0))
-        tk.Button(self.random_controls, text="Clear", command=self._pool_clear).pack(side="left", padx=(4, 0))
+def _gon_list_items(raw):
+    """Split the inside of a flat list the way the editor expects (nested lists stay raw)."""
+    return [q or n or w for q, n, w in _GON_ITEM.findall(raw)]
 
-        self.pool_list = tk.Listbox(self, height=5, exportselection=False)
-        self.pool_list.pack(fill="x", padx=8, pady=(0, 6))
 
-        self.random_tools = tk.Frame(self)
-        self.random_tools.pack(fill="x", padx=8, pady=(0, 6))
-        tk.Button(self.random_tools, text="Preview Randomization", command=self._preview_randomization).pack(side="left", padx=(8, 0))
-        tk.Button(self.random_tools, text="Reset Preview", command=self._reset_preview).pack(side="left", padx=(4, 0))
+def _finish_editor_fields(entry):
+    """Derive the lowercase icon stem list ("images") from an editor block's image field."""
+    if "images" not in entry and "image" in entry:
+        v = entry["image"]
+        entry["images"] = [os.path.splitext(f)[0].lower() for f in (v if isinstance(v, list) else [v])]
+    elif "images" in entry:
+        entry["images"] = [os.path.splitext(f)[0].lower() for f in entry["images"]]
+    return entry
 
-        content = tk.Frame(self)
-        content.pack(fill="both", expand=True, padx=8, pady=6)
 
-        sidebar = tk.Frame(content)
-        sidebar.pack(side="left", fill="y", padx=(0, 8))
-        self.sidebar_title = tk.Label(sidebar, text="Tiles")
-        self.sidebar_title.pack(anchor="w")
+class GonDocument:
+    """A .gon source indexed in one scan.
 
-        self.sidebar_search_var = tk.StringVar()
-        sidebar_search = tk.Entry(sidebar, textvariable=self.sidebar_search_var, width=24)
-        sidebar_search.pack(fill="x", pady=(4, 6))
-        sidebar_search.bind("<KeyRelease>", self._on_sidebar_search)
+    The scan records the span of every numeric top-level block and of each of
+    its named child blocks (`editor`, `tile`, ...), and collects the flat
+    editor fields on the way. Full trees are only built when an id is looked
+    up, by re-tokenizing that id's span.
+    """
 
-        self.sidebar_listbox = tk.Listbox(sidebar, width=26, height=16, exportselection=False)
-        sidebar_scroll = tk.Scrollbar(sidebar, orient="vertical", command=self.sidebar_listbox.yview)
-        self.sidebar_listbox.configure(yscrollcommand=sidebar_scroll.set)
-        self.sidebar_listbox.pack(side="left", fill="y")
-        sidebar_scroll.pack(side="left", fill="y")
+    def __init__(self, text):
+        self.text = text
+        self.blocks = {}  # id -> (start, end, {child_key: (start, end)})
+        self._editor = {}  # id -> {key: value}
+        self._trees = {}
+        self.duplicates = False  # an id occurs more than once; the last one wins
+        self._index()
 
-        self._populate_sidebar_list()
-        self.sidebar_listbox.bind("<<ListboxSelect>>", self._on_sidebar_select)
+    def _index(self, pos=0, sync=()):
+        """Scan the text from pos, a top-level offset. If a top-level block
+        closes at one of the offsets in sync, stop there and return it;
+        otherwise scan to the end and return None."""
+        stack = []  # (key, start) per open block
+        children = {}
+        entry = None  # editor fields of the current id while inside its editor block
+        for m in _GON_SCAN.finditer(self.text, pos):
+            kind = m.lastindex
+            if kind is None:  # comment or stray string
+                continue
+            if kind == _GON_BRACE and m.group(kind) == "}":
+                if not stack:
+                    continue
+                block_key, start = stack.pop()
+                depth = len(stack)
+                if depth == 1:
+                    children.setdefault(block_key, (start, m.end()))
+                    if entry is not None and block_key == "editor":
+                        parent_key = stack[0][0]
+                        if parent_key.isdigit():
+                            self._editor[int(parent_key)] = _finish_editor_fields(entry)
+                        entry = None
+                elif depth == 0:
+                    if block_key.isdigit():
+                        def_id = int(block_key)
+                        self.duplicates |= def_id in self.blocks
+                        self.blocks[def_id] = (start, m.end(), children)
+                    if m.end() in sync:
+                        return m.end()
+            elif kind >= _GON_OPEN:
+                depth = len(stack)
+                block_key = m.group(1) if kind == _GON_OPEN else ""
+                if depth == 0:
+                    children = {}
+                elif depth == 1 and block_key == "editor":
+                    entry = {}
+                stack.append((block_key, m.end() - 1))
+            elif entry is not None:
+                key = m.group(1)
+                if key not in entry:
+                    if kind == _GON_LIST:
+                        entry[key] = _gon_list_items(m.group(kind)[1:-1])
+                    else:
+                        entry[key] = m.group(kind)
+        return None
 
-        self.canvas = tk.Canvas(content, width=self.canvas_size, height=self.canvas_size, bg="#f8fafc")
-        self.canvas.pack(side="left", fill="both", expand=True)
-        self.canvas.bind("<Button-1>", self._on_left_click)
-        self.canvas.bind("<Button-3>", self._on_right_click)
-        self.canvas.bind("<Button-2>", self._pick_from_cell)
-        self.canvas.bind("<Shift-Button-1>", self._pick_from_cell)
-        self.canvas.bind("<Configure>", self._on_canvas_resize)
+    def edited(self, text):
+        """Return (GonDocument of text, ids whose block was added, removed or
+        changed), treating text as an edit of this document.
 
-        self.status_var = tk.StringVar(value="")
-        status = tk.Label(self, textvariable=self.status_var, anchor="w")
-        status.pack(fill="x", padx=8, pady=(6, 6))
+        Only the top-level blocks around the edited span (between the common
+        prefix and suffix of the two texts) are re-scanned; blocks before it
+        are reused as they are and blocks after it are shifted, with their
+        editor fields. The scan resumes at the end of an unchanged block and
+        stops at the first old block end past the edit, where the scanner is
+        back in the state the old scan had.
 
-    def _load_defs(self, tiles_path, spawns_path):
-        defs = load_defs(tiles_path, spawns_path)
-        self.tile_defs = defs["tiles"]
-        self.spawn_defs = defs["spawns"]
-        self.tile_names = {k: v.get("name", f"Tile {k}") for k, v in self.tile_defs.items()}
-        self.spawn_names = {k: v.get("name", str(k)) for k, v in self.spawn_defs.items()}
+        A failed string or list match can look past where it started, so the
+        scan resumes before the edited line, and only where every `[` before
+        it is closed. Otherwise, or with duplicate ids (where an earlier
+        block is hidden by a later one), the whole text is scanned again.
+        """
+        old = self.text
+        if text == old:
+            return self, set()
+        if self.duplicates:
+            return self._rescanned(text)
+        prefix, suffix = _common_affixes(old, text)
+        delta = len(text) - len(old)
+        edit_end = len(old) - suffix
+        spans = sorted((start, end, def_id) for def_id, (start, end, _children) in self.blocks.items())
+        line_start = old.rfind("\n", 0, prefix)
+        pos = max((end for _start, end, _id in spans if end <= line_start), default=0)
+        if _open_brackets(old, pos):
+            return self._rescanned(text)
+        sync = {end + delta for start, end, _id in spans if start >= edit_end}
 
-    def _resolve_local_path(self, filename):
-        local = os.path.join(self.base_dir, filename)
-        return local if os.path.exists(local) else filename
+        doc = GonDocument.__new__(GonDocument)
+        doc.text = text
+        doc.blocks = {}
+        doc._editor = {}
+        doc._trees = {}
+        doc.duplicates = False
+        stop = doc._index(pos, sync)
+        stop = len(old) if stop is None else stop - delta
+        before = [def_id for _start, end, def_id in spans if end <= pos]
+        after = [def_id for start, end, def_id in spans if end > stop]
+        region = doc.blocks
+        if len(set(before) | set(after) | set(region)) != len(before) + len(after) + len(region):
+            return self._rescanned(text)
 
-    def _icons_dir(self):
-        return os.path.join(self.base_dir, "editor_icons")
+        blocks, editor = {}, {}
+        for def_id in before:
+            blocks[def_id] = self.blocks[def_id]
+            if def_id in self._editor:
+                editor[def_id] = self._editor[def_id]
+            if def_id in self._trees:
+                doc._trees[def_id] = self._trees[def_id]
+        blocks.update(region)
+        editor.update(doc._editor)
+        for def_id in after:
+            start, end, children = self.blocks[def_id]
+            blocks[def_id] = (start + delta, end + delta, {
+                key: (child_start + delta, child_end + delta) for key, (child_start, child_end) in children.items()
+            })
+            if def_id in self._editor:
+                editor[def_id] = self._editor[def_id]
+        doc.blocks = blocks
+        doc._editor = editor
+        replaced = {def_id for _start, end, def_id in spans if pos < end <= stop}
+        changed = {
+            def_id for def_id in replaced | region.keys()
+            if def_id not in self.blocks or def_id not in region or self.source(def_id) != doc.source(def_id)
+        }
+        return doc, changed
 
-    def _icon_pairs(self, data, fallback_stem=None):
-        """Return [(stem, tint_str_or_None), ...] for a def entry."""
-        images = data.get("images", [fallback_stem] if fallback_stem else [])
-        tints = data.get("image_tint", [])
-        return [(stem, tints[i] if i < len(tints) else None) for i, stem in enumerate(images)]
+    def _rescanned(self, text):
+        doc = GonDocument(text)
+        changed = {
+            def_id for def_id in self.blocks.keys() | doc.blocks.keys()
+            if def_id not in self.blocks or def_id not in doc.blocks or self.source(def_id) != doc.source(def_id)
+        }
+        return doc, changed
 
-    def _icon_stems_for_tile(self, tile_id):
-        return self._icon_pairs(self.tile_defs.get(tile_id, {}), str(tile_id))
+    def __contains__(self, def_id):
+        return def_id in self.blocks
 
-    def _icon_stems_for_entity(self, ent_id):
-        return self._icon_pairs(self.spawn_defs.get(ent_id, {}))
+    def __iter__(self):
+        return iter(self.blocks)
 
-    def _parse_tint_color(self, tint_str):
-        """Convert a tint string to an (r, g, b) tuple 0-255, or None."""
-        if not tint_str or tint_str.lower() == "none":
-            return None
-        tint_str = tint_str.strip()
-        if tint_str.startswith("["):
-            nums = re.findall(r"[\d.]+", tint_str)
-            if len(nums) >= 3:
-                return tuple(int(float(n) * 255) for n in nums[:3])
-            return None
-        try:
-            r16, g16, b16 = self.winfo_rgb(tint_str)
-            return (r16 // 256, g16 // 256, b16 // 256)
-        except Exception:
-            return None
+    def source(self, node):
+        """Return the source text of a GonBlock/GonList, or of a whole id."""
+        if isinstance(node, int):
+            start, end, _children = self.blocks[node]
+            return self.text[start:end]
+        return self.text[node.start:node.end]
 
-    def _tint_image(self, img, tint_rgb):
-        """Return a tinted copy of img using multiplicative blending."""
-        tr, tg, tb = tint_rgb
-        copy = img.copy()
-        w, h = copy.width(), copy.height()
-        for py in range(h):
-            for px in range(w):
-                if copy.transparency_get(px, py):
-                    continue
-                color = copy.get(px, py)
-                if isinstance(color, str):
-                    parts = color.split()
-                    r, g, b = int(parts[0]), int(parts[1]), int(parts[2])
-                else:
-                    r, g, b = color[0], color[1], color[2]
-                    
-                copy.put(f"#{r*tr//255:02x}{g*tg//255:02x}{b*tb//255:02x}", (px, py))
-                
-        return copy
-
-    def _apply_color_key(self, img):
-        """Make all pixels matching _COLOR_KEY transparent."""
-        kr, kg, kb = self._TRANSPARENT
-        w, h = img.width(), img.height()
-        pixels = []
-        for py in range(h):
-            for px in range(w):
-                color = img.get(px, py)
-                if isinstance(color, str):
-                    parts = color.split()
-                    r, g, b = int(parts[0]), int(parts[1]), int(parts[2])
-                else:
-                    r, g, b = color[0], color[1], color[2]
-                if r == kr and g == kg and b == kb:
-                    pixels.append((px, py))
-        for px, py in pixels:
-            img.transparency_set(px, py, True)
+    def tree(self, def_id):
+        """Return the full GonBlock for def_id, or None."""
+        tree = self._trees.get(def_id)
+        if tree is None and def_id in self.blocks:
+            start, end, _children = self.blocks[def_id]
+            tokens = _GON_TOKEN.finditer(self.text, start + 1, end - 1)
+            tree = self._trees[def_id] = self._parse_block(tokens, start, end)
+        return tree
 
-    def _get_raw_icon(self, stem):
-        """Return the full-size color-keyed PhotoImage for stem, or None."""
-        if stem in self._icon_raw_cache:
-            return self._icon_raw_cache[stem]
-        path = os.path.join(self._icons_dir(), f"{stem}.png")
-        if not os.path.exists(path):
-            self._icon_raw_cache[stem] = None
-            return None
-        try:
-            raw = tk.PhotoImage(file=path)
-            self._apply_color_key(raw)
-        except Exception:
-            self._icon_raw_cache[stem] = None
-            return None
-        self._icon_raw_cache[stem] = raw
-        return raw
-
-    def _get_icon(self, stem, tint_str=None):
-        """Return a subsampled PhotoImage for stem+tint at the current cell_size, or None."""
-        tint_key = tint_str if (tint_str and tint_str.lower() != "none") else None
-        key = (stem, tint_key, self.cell_size)
-        if key in self._icon_cache:
-            return self._icon_cache[key]
-        raw = self._get_raw_icon(stem)
-        if raw is None:
-            self._icon_cache[key] = None
-            return None
-        source = raw
-        if tint_key:
-            tc = (stem, tint_key)
-            if tc not in self._icon_tinted_cache:
-                tint_rgb = self._parse_tint_color(tint_key)
-                self._icon_tinted_cache[tc] = self._tint_image(raw, tint_rgb) if tint_rgb else raw
-            source = self._icon_tinted_cache[tc]
-        try:
-            factor = self._ICON_SIZE // self.cell_size
+    def _parse_block(self, tokens, start, end):
+        block = GonBlock(start, end)
+        key = None
+        for m in tokens:
+            quoted, punct, word = m.groups()
+            if punct == "}":
+                block.end = m.end()
+                return block
+            if key is None:
+                if punct is None:
+                    key = quoted if quoted is not None else word
+                continue
+            if punct == "{":
+                value = self._parse_block(tokens, m.start(), end)
+            elif punct == "[":
+                value = self._parse_list(tokens, m.start())
+            elif punct == "]":
+                continue
+            else:
+                value = quoted if quoted is not None else word
+            block.entries.append((key, value))
+            key = None
+        return block
+
+    def _parse_list(self, tokens, start):
+        items = GonList()
+        items.start = start
+        items.end = start
+        for m in tokens:
+            quoted, punct, word = m.groups()
+            if punct == "]":
+                items.end = m.end()
+                break
+            if punct == "[":
+                items.append(self._parse_list(tokens, m.start()))
+            elif punct == "{":
+                items.append(self._parse_block(tokens, m.start(), items.start))
+            elif punct is None:
+                items.append(quoted if quoted is not None else word)
+        return items
+
+    def get(self, def_id, *path, default=None):
+        """Look up a nested value, e.g. doc.get(11, "value") or doc.get(1, "editor", "name")."""
+        node = self.tree(def_id)
+        for key in path:
+            if not isinstance(node, GonBlock):
+                return default
+            node = node.get(key)
+        return default if node is None else node
+
+    def weighted(self, def_id, key):
+        """Return [(name, weight), ...] for a weighted table like `tile { GrassTile 80 ... }`.
+
+        A plain `tile WaterTile` entry is treated as a single option of weight 1.
+        """
+        node = self.get(def_id, key)
+        if node is None:
+            return []
+        if isinstance(node, str):
+            return [(node, 1)]
+        if isinstance(node, GonBlock):
+            pairs = node.entries
+        else:
+            pairs = zip(node[::2], node[1::2])
+        table = []
+        for name, weight in pairs:
+            try:
+                table.append((name, int(float(weight))))
+            except (TypeError, ValueError):
+                continue
+        return table
+
+    def editor_fields(self, def_id):
+        """Return the editor-block fields of def_id as a flat {key: value} dict."""
+        if def_id not in self.blocks:
+            raise KeyError(def_id)
+        return self._editor.get(def_id, {})
+
+    def editor_defs(self):
+        """Return {id: editor fields} for every id, the shape load_defs has always produced."""
+        return {def_id: self._editor.get(def_id, {}) for def_id in self.blocks}
+
+
+_GON_BRACKETS = re.compile(r"[\[\]]")
+
+
+def _open_brackets(text, end):
+    """Count the `[` in text[:end] left unclosed, ignoring stray `]`."""
+    depth = 0
+    for m in _GON_BRACKETS.finditer(text, 0, end):
+        if m.group() == "[":
+            depth += 1
+        elif depth:
+            depth -= 1
+    return depth
+
+
+def _common_affixes(a, b, chunk=4096):
+    """Return the lengths of the common prefix of a and b and of their common
+    suffix in what remains. Whole chunks are compared until one differs,
+    then that chunk is bisected."""
+    limit = min(len(a), len(b))
+    prefix = 0
+    while prefix < limit and a[prefix:prefix + chunk] == b[prefix:prefix + chunk]:
+        prefix += chunk
+    lo, hi = prefix, min(prefix + chunk, limit)
+    if prefix >= limit:
+        lo = limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    prefix = lo
+    limit -= prefix
+    na, nb = len(a), len(b)
+    suffix = 0
+    while suffix < limit and a[na - min(suffix + chunk, limit):na - suffix] == b[nb - min(suffix + chunk, limit):nb - suffix]:
+        suffix = min(suffix + chunk, limit)
+    lo, hi = suffix, min(suffix + chunk, limit)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[na - mid:na - lo] == b[nb - mid:nb - lo]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return prefix, lo
+
+
+_GON_DOCS = {}  # abspath -> ((size, mtime_ns), GonDocument)
+
+
+def load_gon(path):
+    """Return the GonDocument for path, parsing each version of a file once per process."""
+    abspath = os.path.abspath(path)
+    st = os.stat(abspath)
+    hit = _GON_DOCS.get(abspath)
+    if hit and hit[0] == (st.st_size, st.st_mtime_ns):
+        return hit[1]
+    with open(abspath, "rb") as f:
+        text = f.read().decode("utf-8")
+    return _remember_gon(abspath, st, text)
+
+
+def reload_gon(path):
+    """Re-read path if it changed since load_gon() last parsed it.
+
+    Returns (GonDocument, changed ids): the ids whose block was added,
+    removed or edited, found with GonDocument.edited(), or an empty set if
+    the file is unchanged. changed is None if there was no earlier document
+    to compare with. Raises OSError/ValueError for a missing or undecodable
+    (for example half-written) file.
+    """
+    abspath = os.path.abspath(path)
+    st = os.stat(abspath)
+    hit = _GON_DOCS.get(abspath)
+    if hit and hit[0] == (st.st_size, st.st_mtime_ns):
+        return hit[1], set()
+    with open(abspath, "rb") as f:
+        text = f.read().decode("utf-8")
+    if hit is None:
+        return _remember_gon(abspath, st, text), None
+    doc, changed = hit[1].edited(text)
+    _GON_DOCS[abspath] = ((st.st_size, st.st_mtime_ns), doc)
+    return doc, changed
+
+
+def _file_stamp(path):
+    """Return (size, mtime_ns) of path, or None if it cannot be stat'ed."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+def _remember_gon(abspath, st, text):
+    doc = GonDocument(text)
+    _GON_DOCS[abspath] = ((st.st_size, st.st_mtime_ns), doc)
+    return doc
+
+
+_DEFS_CACHE_VERSION = 3
+
+
+def _cache_dir(*parts):
+    """Return a directory under the per-user editor cache, creating it on demand."""
+    root = os.environ.get("MEW_EDITOR_CACHE_DIR")
+    if not root:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        root = os.path.join(base, "mew-editor")
+    path = os.path.join(root, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _env_number(name, default):
+    """Return $name as a non-negative number, or default if it is unset. A
+    value that is not one is reported on stderr and ignored, so a typo never
+    stops the editor or the command line tools."""
+    value = os.environ.get(name, "").strip()
+    if not value:
+        return default
+    try:
+        number = float(value)
+    except ValueError:
+        number = None
+    if number is None or not 0 <= number < float("inf"):
+        print(f"Ignoring ${name}={value!r}: expected a number >= 0, using {default}", file=sys.stderr)
+        return default
+    return number
+
+
+def _atomic_write(path, data, durable=False):
+    """Replace path with data (bytes or a list of chunks) via a temp file and
+    rename, so readers never see a partial file. With durable, the data and
+    the rename are fsynced and an existing file's permissions are kept."""
+    chunks = [data] if isinstance(data, (bytes, bytearray, memoryview)) else data
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.writelines(chunks)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        if durable and os.path.exists(path):
+            os.chmod(tmp, os.stat(path).st_mode & 0o7777)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    if durable and os.name == "posix":
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def _parse_gon(path):
+    """Parse a .gon file, reusing the on-disk cache when the file is unchanged.
+
+    Cache entries are keyed by absolute path, size, mtime and a content hash, so
+    any edit to the file invalidates them.
+    """
+    return _parse_gon_entry(path)[0]
+
+
+def _parse_gon_entry(path):
+    """Return (editor defs, palette search terms) for a .gon file; both come
+    from the same cache entry, so a warm start parses nothing."""
+    if not os.path.exists(path):
+        return {}, ({}, {})
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        raw = f.read()
+    abspath = os.path.abspath(path)
+    key = (_DEFS_CACHE_VERSION, abspath, st.st_size, st.st_mtime_ns, hashlib.blake2b(raw, digest_size=16).digest())
+
+    cache_path = None
+    try:
+        name = hashlib.blake2b(abspath.encode("utf-8"), digest_size=12).hexdigest()
+        cache_path = os.path.join(_cache_dir("defs"), f"{name}.marshal")
+        with open(cache_path, "rb") as f:
+            cached_key, cached_defs, cached_terms = marshal.loads(f.read())
+        if cached_key == key:
+            return cached_defs, cached_terms
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    doc = _remember_gon(abspath, st, raw.decode("utf-8"))
+    defs, terms = doc.editor_defs(), def_search_terms(doc)
+    if cache_path:
+        try:
+            _atomic_write(cache_path, marshal.dumps((key, defs, terms)))
+        except OSError:
+            pass
+    return defs, terms
+
+
+def load_defs(tiles_path, spawns_path):
+    return {
+        "tiles": _parse_gon(tiles_path),
+        "spawns": _parse_gon(spawns_path),
+    }
+
+
+def resolve_def_path(level_dir, filename, base_dir):
+    """Find a def file next to the level, falling back to the editor directory."""
+    p = os.path.join(level_dir, filename)
+    if os.path.exists(p):
+        return p
+    local = os.path.join(base_dir, filename)
+    return local if os.path.exists(local) else filename
+
+
+_GON_OBJECT_FIELD = re.compile(r'^[ \t]*(?:object|utility|tile)[ \t]+(?:\{([^}]*)\}|"([^"]*)"|([^\s{}\[\]",]+))', re.M)
+_GON_CATEGORY_NOTE = re.compile(r"^//\s*(-?\d+)\s*:\s*(.+?)\s*$", re.M)
+
+
+def def_search_terms(doc):
+    """Return ({id: [object/tile/utility names]}, {category: name}) for a
+    parsed .gon document, for the palette search. Category names come from
+    `//3: basic enemies` notes like the header of spawns.gon."""
+    objects = {}
+    for def_id, (start, end, _children) in doc.blocks.items():
+        names = []
+        for m in _GON_OBJECT_FIELD.finditer(doc.text, start, end):
+            if m.group(1) is not None:
+                names.extend(w for w in m.group(1).split() if not w.replace(".", "").isdigit())
+            else:
+                names.append(m.group(2) if m.group(2) is not None else m.group(3))
+        if names:
+            objects[def_id] = names
+    categories = {int(m.group(1)): m.group(2) for m in _GON_CATEGORY_NOTE.finditer(doc.text)}
+    return objects, categories
+
+
+class SearchIndex:
+    """Substring search over a fixed, ordered list of palette entries.
+
+    Every 1-3 character gram of an entry's search text (name, id, category,
+    object names) maps to the rows containing it, so a query only checks the
+    rows in the intersection of its trigram postings; queries of three
+    characters or fewer are a single lookup. Results are row numbers in
+    display order. The previous query's rows are kept, so typing further
+    only re-checks what already matched.
+    """
+    __slots__ = ("keys", "labels", "groups", "rows_by_key", "_texts", "_grams", "_last")
+
+    def __init__(self, entries):
+        """entries: (key, label, group, search terms) tuples in display order,
+        with each group's entries contiguous."""
+        self.keys = []
+        self.labels = []
+        self.groups = []
+        self._texts = []
+        self._grams = {}
+        for row, (key, label, group, terms) in enumerate(entries):
+            text = "\n".join(str(term).lower() for term in terms if term not in (None, ""))
+            self.keys.append(key)
+            self.labels.append(label)
+            self.groups.append(group)
+            self._texts.append(text)
+            for n in (1, 2, 3):
+                for i in range(len(text) - n + 1):
+                    gram = text[i:i + n]
+                    if "\n" not in gram:
+                        self._grams.setdefault(gram, set()).add(row)
+        self.rows_by_key = {key: row for row, key in enumerate(self.keys)}
+        self._last = ("", list(range(len(self.keys))))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def search(self, query):
+        """Return the sorted rows whose search text contains query (case-insensitive)."""
+        query = query.strip().lower()
+        if not query:
+            return list(range(len(self.keys)))
+        last_query, last_rows = self._last
+        if last_query and last_query in query:
+            rows = [row for row in last_rows if query in self._texts[row]]
+        elif len(query) <= 3:
+            rows = sorted(self._grams.get(query, ()))
+        else:
+            postings = sorted((self._grams.get(query[i:i + 3], set()) for i in range(len(query) - 2)), key=len)
+            candidates = set.intersection(*postings) if postings[0] else set()
+            rows = sorted(row for row in candidates if query in self._texts[row])
+        self._last = (query, rows)
+        return rows
+
+
+def load_level_data(path):
+    lvl_data = load_level_file(path)
+
+    if lvl_data["width"] <= 0 or lvl_data["height"] <= 0:
+        raise ValueError(f"Invalid level size {lvl_data['width']}x{lvl_data['height']}.")
+
+    data = LevelData()
+    data.path = path
+    data.version = lvl_data["version"]
+    data.width = lvl_data["width"]
+    data.height = lvl_data["height"]
+    data.mode = lvl_data["mode"]
+    data.camera = _HEADER.unpack_from(lvl_data["data"], 0)[5:9]
+    data.spawn_file = lvl_data.get("spawn_file", "spawns.gon") or "spawns.gon"
+    data.tiles_file = lvl_data.get("tiles_file", "tiles.gon") or "tiles.gon"
+    # Flip vertically to match editor origin (0,0 at bottom-left).
+    width, height = data.width, data.height
+    data.layers = [_flip_rows(layer, width, height) for layer in lvl_data["layers"]]
+    data.raw_layers = lvl_data["raw_layers"]
+    data.random_tiles = {
+        (layer, (height - 1 - index // width) * width + index % width): tile
+        for (layer, index), tile in lvl_data["random_tiles"].items()
+    }
+    if not data.layers:
+        data.layers = [array("H", bytes(2 * width * height))]
+        data.dirty_layers.add(0)
+    data.tail = lvl_data["tail"]
+    data.raw_prefix = lvl_data["data"][:lvl_data["tiles_start"]]
+    data.raw_prefix_key = _prefix_key(data, nlayers=lvl_data["mode"])
+    data.raw_spawns = lvl_data["raw_spawns"]
+
+    # Flip entities vertically to match editor origin (0,0 at bottom-left).
+    ent_map = {}
+    for x, y, spawn in lvl_data["entities"]:
+        ny = data.height - 1 - y
+        ent_map.setdefault((x, ny), []).append(spawn)
+    data.entities = EntityStore(ent_map)
+    data.raw_spawns_key = (data.entities, data.entities.version)
+    data.original_entities = []
+    return data
+
+
+def _prefix_key(level, nlayers=None):
+    """The LevelData fields the header and def-file names encode."""
+    return (
+        int(level.version), int(level.width), int(level.height),
+        len(level.layers) if nlayers is None else nlayers,
+        tuple(int(v) for v in level.camera), level.spawn_file, level.tiles_file,
+    )
+
+
+def _build_default_prefix(level, reserved=bytes(8)):
+    spawn_file = (level.spawn_file or "spawns.gon").encode("utf-8", errors="ignore")
+    tiles_file = (level.tiles_file or "tiles.gon").encode("utf-8", errors="ignore")
+    header = struct.pack(
+        "<9i",
+        int(level.version),
+        int(level.width),
+        int(level.height),
+        len(level.layers),  # nlayers
+        0,  # entity count, patched later
+        *(int(v) for v in level.camera),  # cam x, y, w, h
+    )
+    return (
+        header
+        + struct.pack("<i", len(spawn_file))
+        + spawn_file
+        + struct.pack("<i", len(tiles_file))
+        + tiles_file
+        + reserved
+    )
+
+
+def _encode_spawns(level):
+    chunks = []
+    height = level.height
+    for (x, y) in sorted(level.entities.keys(), key=lambda p: (p[1], p[0])):
+        ny = height - 1 - y
+        for ent in level.entities[(x, y)]:
+            chunks.append(_SPAWN_HEAD.pack(x, ny, ent.id, ent.wave & 0xFF, 0))
+            if ent.is_random:
+                options = ent.options
+                if len(options) > 255:
+                    raise ValueError("Random spawn has more than 255 options.")
+                chunks.append(_POOL_HEAD.pack(len(options), ent.roll_index & 0xFF))
+                chunks.extend(_POOL_OPTION.pack(pid & 0xFFFF, weight & 0xFFFF) for pid, weight in options)
+    return b"".join(chunks)
+
+
+def encode_level_parts(level):
+    """Serialize a LevelData into its .lvl sections: [header, layer..., spawns,
+    tail]. Writing or joining them in order gives the file.
+
+    Sections unchanged since the level was loaded (or last saved with
+    save_level) are the original bytes: the header while none of its fields
+    changed (only the entity count is patched), layers not in dirty_layers,
+    and the spawn list while the EntityStore has not been written to. A
+    rebuilt header keeps the original reserved ints.
+    """
+    width, height = level.width, level.height
+    for layer in level.layers:
+        if len(layer) != width * height:
+            raise ValueError(f"Tile grid must be {width}x{height}.")
+
+    if level.raw_prefix and _prefix_key(level) == level.raw_prefix_key:
+        prefix = bytearray(level.raw_prefix)
+    else:
+        reserved = bytes(level.raw_prefix[-8:]) if level.raw_prefix else bytes(8)
+        prefix = bytearray(_build_default_prefix(level, reserved))
+    struct.pack_into("<I", prefix, 16, level.entities.record_count())
+    parts = [prefix]
+
+    for layer_idx, layer in enumerate(level.layers):
+        if layer_idx not in level.dirty_layers and layer_idx < len(level.raw_layers):
+            parts.append(level.raw_layers[layer_idx])
+            continue
+        random_tiles = {index: tile for (li, index), tile in level.random_tiles.items() if li == layer_idx}
+        parts.append(_encode_layer(layer, random_tiles, width, height))
+
+    spawns_key = level.raw_spawns_key
+    if spawns_key and spawns_key[0] is level.entities and spawns_key[1] == level.entities.version:
+        parts.append(level.raw_spawns)
+    else:
+        parts.append(_encode_spawns(level))
+    parts.append(level.tail)
+    return parts
+
+
+def encode_level(level):
+    """Serialize a LevelData into the .lvl byte layout."""
+    return b"".join(encode_level_parts(level))
+
+
+def save_level(level, path):
+    """Write level to path atomically and durably (temp file, fsync, rename).
+
+    The sections written become the level's raw bytes, so the next save
+    re-encodes only what is edited after this one.
+    """
+    parts = encode_level_parts(level)
+    _atomic_write(path, parts, durable=True)
+    layer_count = len(level.layers)
+    level.raw_prefix = bytes(parts[0])
+    level.raw_prefix_key = _prefix_key(level)
+    level.raw_layers = parts[1:1 + layer_count]
+    level.dirty_layers.clear()
+    level.raw_spawns = parts[1 + layer_count]
+    level.raw_spawns_key = (level.entities, level.entities.version)
+
+
+# Level bundles (.lvlpack): many .lvl blobs in one file, so scanning a mod
+# is one open and an mmap instead of a syscall round trip per room.
+#
+#   header   "MEWLVLPK", u32 version, u32 entry count
+#   index    per entry: u64 offset, u64 length, 16-byte blake2b digest,
+#            u16 name length, name (utf-8, "/"-separated, relative to levels/)
+#   blobs    each level's bytes exactly as in its .lvl file
+_BUNDLE_MAGIC = b"MEWLVLPK"
+_BUNDLE_VERSION = 1
+_BUNDLE_EXT = ".lvlpack"
+_BUNDLE_HEAD = struct.Struct("<8sII")
+_BUNDLE_ENTRY = struct.Struct("<QQ16sH")
+
+
+def _level_digest(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def pack_levels(levels_dir, bundle_path):
+    """Pack every .lvl under levels_dir into bundle_path (written atomically).
+    Returns the number of levels packed."""
+    paths = _find_levels([levels_dir])
+    blobs = []
+    for path in paths:
+        with open(path, "rb") as f:
+            blobs.append(f.read())
+    names = [os.path.relpath(path, levels_dir).replace(os.sep, "/").encode("utf-8") for path in paths]
+    offset = _BUNDLE_HEAD.size + sum(_BUNDLE_ENTRY.size + len(name) for name in names)
+    chunks = [_BUNDLE_HEAD.pack(_BUNDLE_MAGIC, _BUNDLE_VERSION, len(paths))]
+    for name, blob in zip(names, blobs):
+        chunks.append(_BUNDLE_ENTRY.pack(offset, len(blob), _level_digest(blob), len(name)))
+        chunks.append(name)
+        offset += len(blob)
+    chunks.extend(blobs)
+    _atomic_write(bundle_path, chunks, durable=True)
+    return len(paths)
+
+
+class LevelBundle:
+    """A .lvlpack opened read-only through mmap.
+
+    data() hands out memoryview slices of the mapping, so decode_level()
+    parses a member without copying it; levels loaded this way keep the
+    mapping alive through their raw sections. Use open_bundle() to share
+    one mapping per file (close_bundle() drops it), or `with LevelBundle(path)`
+    for a private one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty file
+                raise ValueError(f"{path} is not a level bundle") from None
+        view = memoryview(self._map)
+        if len(view) < _BUNDLE_HEAD.size:
+            raise ValueError(f"{path} is not a level bundle")
+        magic, version, count = _BUNDLE_HEAD.unpack_from(view, 0)
+        if magic != _BUNDLE_MAGIC:
+            raise ValueError(f"{path} is not a level bundle")
+        if version != _BUNDLE_VERSION:
+            raise ValueError(f"{path}: unsupported bundle version {version}")
+        self.entries = {}  # name -> (offset, length, digest)
+        pos = _BUNDLE_HEAD.size
+        for _ in range(count):
+            offset, length, digest, name_len = _BUNDLE_ENTRY.unpack_from(view, pos)
+            pos += _BUNDLE_ENTRY.size
+            name = str(view[pos:pos + name_len], "utf-8")
+            pos += name_len
+            if offset + length > len(view):
+                raise ValueError(f"{path}: entry {name} runs past the end of the bundle")
+            self.entries[name] = (offset, length, digest)
+        self._view = view
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def data(self, name):
+        """Return the member's bytes as a memoryview into the mapping."""
+        offset, length, _digest = self.entries[name]
+        return self._view[offset:offset + length]
+
+    def digest(self, name):
+        return self.entries[name][2]
+
+    def member_path(self, name):
+        """The path load_level_data() accepts for a member, e.g. mod/levels.lvlpack/alley/easy/a.lvl."""
+        return os.path.join(self.path, *name.split("/"))
+
+    def verify(self):
+        """Return the names whose data no longer matches the digest in the index."""
+        return [name for name in self.entries if _level_digest(self.data(name)) != self.digest(name)]
+
+    def unpack(self, out_dir):
+        """Write every member under out_dir; returns the number written."""
+        root = os.path.abspath(out_dir)
+        for name in self.entries:
+            path = os.path.abspath(os.path.join(root, *name.split("/")))
+            if not path.startswith(root + os.sep):
+                raise ValueError(f"{self.path}: member name {name!r} escapes the output directory")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _atomic_write(path, self.data(name))
+        return len(self.entries)
+
+    def close(self):
+        """Unmap the bundle; it can't be read afterwards. Raises BufferError,
+        and stays open, while levels loaded from it still view the mapping."""
+        if self._map.closed:
+            return
+        self._view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            self._view = memoryview(self._map)
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_BUNDLES = {}  # abspath -> ((size, mtime_ns), LevelBundle)
+
+
+def open_bundle(path):
+    """Return the shared LevelBundle for path, reopening it if the file was replaced."""
+    abspath = os.path.abspath(path)
+    stamp = _file_stamp(abspath)
+    hit = _BUNDLES.get(abspath)
+    if hit and hit[0] == stamp:
+        return hit[1]
+    # A replaced bundle's old mapping stays valid (levels may still view it)
+    # and is released when the last of them goes.
+    bundle = LevelBundle(abspath)
+    _BUNDLES[abspath] = (stamp, bundle)
+    return bundle
+
+
+def close_bundle(path):
+    """Drop path's shared bundle from open_bundle() and unmap it. If levels
+    loaded from it still view the mapping, it is unmapped when they go."""
+    hit = _BUNDLES.pop(os.path.abspath(path), None)
+    if hit is not None:
+        try:
+            hit[1].close()
+        except BufferError:
+            pass
+
+
+def close_bundles():
+    """close_bundle() every bundle open_bundle() has shared."""
+    for path in list(_BUNDLES):
+        close_bundle(path)
+
+
+def level_digest(path):
+    """blake2b-128 of a level's bytes; bundle members use their index digest."""
+    member = split_bundle_path(path)
+    if member is not None:
+        return open_bundle(member[0]).digest(member[1])
+    with open(path, "rb") as f:
+        return _level_digest(f.read())
+
+
+def split_bundle_path(path):
+    """Return (bundle path, member name) if path points inside a bundle, else None."""
+    marker = _BUNDLE_EXT + os.sep
+    index = path.find(marker)
+    if index < 0:
+        return None
+    bundle = path[:index + len(_BUNDLE_EXT)]
+    if not os.path.isfile(bundle):
+        return None
+    return bundle, path[index + len(marker):].replace(os.sep, "/")
+
+
+def validate_level(level, tile_defs, spawn_defs):
+    """Return (errors, warnings) lists describing problems with a level."""
+    errors = []
+    warnings = []
+    used_tiles = set()
+    for layer_idx, layer in enumerate(level.layers):
+        if len(layer) != level.width * level.height:
+            errors.append(f"tile layer {layer_idx} has {len(layer)} cells, expected {level.width * level.height}")
+        used_tiles.update(layer)
+    used_tiles.discard(0xFFFF)
+    for (layer_idx, index), tile in level.random_tiles.items():
+        if not tile.options:
+            warnings.append(f"random tile at layer {layer_idx} cell {index} has no options")
+        used_tiles.update(tid for tid, _weight in tile.options)
+    unknown_tiles = sorted(t for t in used_tiles if t not in tile_defs)
+    if unknown_tiles:
+        warnings.append(f"unknown tile id(s): {unknown_tiles}")
+    for x, y in level.entities:
+        if not (0 <= x < level.width and 0 <= y < level.height):
+            warnings.append(f"entity at ({x}, {y}) is outside the {level.width}x{level.height} grid")
+    for x, y in sorted(level.entities.random_cells()):
+        for ent in level.entities[(x, y)]:
+            if not ent.is_random:
+                continue
+            if not ent.options:
+                warnings.append(f"random spawn at ({x}, {y}) has no options")
+            elif len(ent.options) > 255:
+                errors.append(f"random spawn at ({x}, {y}) has more than 255 options")
+            elif sum(weight for _pid, weight in ent.options) <= 0:
+                warnings.append(f"random spawn at ({x}, {y}) has zero total weight")
+    unknown_spawns = {sid for sid in level.entities.spawn_ids() if sid not in spawn_defs}
+    if unknown_spawns:
+        warnings.append(f"unknown spawn id(s): {sorted(unknown_spawns)}")
+    return errors, warnings
+
+
+class RollTable:
+    """Cumulative weights of one random pool. pick(u) returns the same id as
+    LevelEditor._roll_from_options always has for roll value u, via bisect
+    instead of re-summing and scanning the options.
+
+    Built once per distinct options tuple; use roll_table() to get the
+    shared instance.
+    """
+    __slots__ = ("ids", "cumulative", "total")
+
+    def __init__(self, options):
+        self.ids = [pid for pid, _weight in options]
+        self.cumulative = []
+        running = 0
+        for _pid, weight in options:
+            running += max(0, weight)
+            self.cumulative.append(running)
+        self.total = running
+
+    def pick(self, u):
+        if not self.ids:
+            return 0
+        if self.total <= 0:
+            return self.ids[0]
+        if u < 0.0:
+            u = 0.0
+        if u >= 1.0:
+            u = 0.999999
+        i = bisect_right(self.cumulative, u * self.total)
+        return self.ids[i] if i < len(self.ids) else self.ids[-1]
+
+    def indices(self, draws):
+        """Option indices for a batch of uniforms in [0, 1); needs total > 0."""
+        cumulative, total = self.cumulative, self.total
+        return [bisect_right(cumulative, u * total) for u in draws]
+
+
+_ROLL_TABLES = OrderedDict()  # options tuple -> RollTable, least recently used first
+_ROLL_TABLE_LIMIT = 4096
+
+
+def roll_table(options):
+    """Return the cached RollTable for an options list, keyed by its contents.
+    The least recently used tables are dropped past _ROLL_TABLE_LIMIT."""
+    key = tuple(options)
+    table = _ROLL_TABLES.get(key)
+    if table is None:
+        table = _ROLL_TABLES[key] = RollTable(key)
+        if len(_ROLL_TABLES) > _ROLL_TABLE_LIMIT:
+            _ROLL_TABLES.popitem(last=False)
+    else:
+        _ROLL_TABLES.move_to_end(key)
+    return table
+
+
+def new_roll_seed():
+    """A fresh seed to show designers so a roll can be reproduced."""
+    return random.randrange(1 << 31)
+
+
+def resolve_random_spawns(entities, seed):
+    """Resolve every random spawn once: {(x, y, record index): spawn id}.
+
+    Records sharing a nonzero roll_index use one roll; roll_index 0 rolls on
+    its own. Cells are visited in sorted order, so the same seed and level
+    always give the same result.
+    """
+    rng = random.Random(seed)
+    shared_rolls = {}
+    resolved = {}
+    for cell in sorted(entities.keys()):
+        for idx, ent in enumerate(entities[cell]):
+            if not ent.is_random:
+                continue
+            if ent.roll_index:
+                if ent.roll_index not in shared_rolls:
+                    shared_rolls[ent.roll_index] = rng.random()
+                roll_value = shared_rolls[ent.roll_index]
+            else:
+                roll_value = rng.random()
+            resolved[(cell[0], cell[1], idx)] = roll_table(ent.options).pick(roll_value)
+    return resolved
+
+
+def spawn_values(spawns_path):
+    """Return {spawn id: value} from the `value` field of each spawns.gon block."""
+    doc = load_gon(spawns_path)
+    values = {}
+    for spawn_id in doc.blocks:
+        raw = doc.get(spawn_id, "value")
+        if isinstance(raw, str):
+            try:
+                number = float(raw)
+            except ValueError:
+                continue
+            values[spawn_id] = int(number) if number.is_integer() else number
+    return values
+
+
+_SIM_RUNS = 100000
+
+
+def simulate_spawns(entities, values=None, runs=_SIM_RUNS, seed=None, batch=4096):
+    """Resolve every random spawn `runs` times and summarize the outcomes.
+
+    Shared rolls follow resolve_random_spawns: records with the same nonzero
+    roll_index use one draw per run; roll_index 0 rolls independently.
+    Draws are made a batch at a time per record (or per shared group) and
+    mapped through cached RollTables. Without a seed one is picked and
+    reported, so any run can be reproduced.
+
+    Returns a dict with per-cell and per-wave expected counts
+    ({cell: {spawn_id: n}}, {wave: {spawn_id: n}}; a lone record's count is
+    its probability) and the distribution of the level's total value.
+    """
+    values = values or {}
+    if seed is None:
+        seed = new_roll_seed()
+    rng = random.Random(seed)
+    rand = rng.random
+    fixed_value = 0
+    cells = {}
+    waves = {}
+    records = []  # (cell, wave, table, roll_index)
+    for cell in sorted(entities.keys()):
+        for ent in entities[cell]:
+            table = roll_table(ent.options) if ent.is_random else None
+            if table is None or len(table.ids) < 2 or table.total <= 0:
+                spawn_id = table.pick(0.0) if table else ent.id
+                cell_counts = cells.setdefault(cell, {})
+                cell_counts[spawn_id] = cell_counts.get(spawn_id, 0) + 1
+                wave_counts = waves.setdefault(ent.wave, {})
+                wave_counts[spawn_id] = wave_counts.get(spawn_id, 0) + 1
+                fixed_value += values.get(spawn_id, 0)
+                continue
+            records.append((cell, ent.wave, table, ent.roll_index))
+
+    picks = [[0] * len(table.ids) for _cell, _wave, table, _roll in records]
+    rec_values = [[values.get(pid, 0) for pid in table.ids] for _cell, _wave, table, _roll in records]
+    groups = sorted({roll for _cell, _wave, _table, roll in records if roll})
+    totals = {}
+    done = 0
+    while done < runs:
+        count = min(batch, runs - done)
+        group_draws = {roll: [rand() for _ in range(count)] for roll in groups}
+        value_columns = []
+        for (_cell, _wave, table, roll), counts, vals in zip(records, picks, rec_values):
+            draws = group_draws[roll] if roll else [rand() for _ in range(count)]
+            indices = table.indices(draws)
+            for i, n in Counter(indices).items():
+                counts[i] += n
+            if any(vals):
+                value_columns.append([vals[i] for i in indices])
+        if value_columns:
+            for total_value in map(sum, zip(*value_columns)):
+                total_value += fixed_value
+                totals[total_value] = totals.get(total_value, 0) + 1
+        else:
+            totals[fixed_value] = totals.get(fixed_value, 0) + count
+        done += count
+
+    for (cell, wave, table, _roll), counts in zip(records, picks):
+        cell_counts = cells.setdefault(cell, {})
+        wave_counts = waves.setdefault(wave, {})
+        for pid, n in zip(table.ids, counts):
+            if n:
+                cell_counts[pid] = cell_counts.get(pid, 0) + n / runs
+                wave_counts[pid] = wave_counts.get(pid, 0) + n / runs
+    distribution = {value: n / runs for value, n in sorted(totals.items())}
+    return {
+        "runs": runs,
+        "seed": seed,
+        "random_records": len(records),
+        "cells": cells,
+        "waves": waves,
+        "value": {
+            "mean": sum(value * p for value, p in distribution.items()),
+            "min": min(distribution) if distribution else fixed_value,
+            "max": max(distribution) if distribution else fixed_value,
+            "distribution": distribution,
+        },
+    }
+
+
+def simulation_heat(result, spawn_id=None, values=None):
+    """Map each cell of a simulate_spawns result to 0..1: the chance of
+    spawn_id there, or (without one) its expected value relative to the max."""
+    if spawn_id is not None:
+        return {cell: min(1.0, counts.get(spawn_id, 0)) for cell, counts in result["cells"].items()}
+    values = values or {}
+    expected = {
+        cell: sum(values.get(pid, 0) * n for pid, n in counts.items())
+        for cell, counts in result["cells"].items()
+    }
+    peak = max(expected.values(), default=0)
+    return {cell: (v / peak if peak > 0 else 0.0) for cell, v in expected.items()}
+
+
+_ICON_SIZE = 128
+_VALID_CELL_SIZES = [16, 32, 64]  # 128 // 8, 128 // 4, 128 // 2
+_TRANSPARENT = (255, 0, 255)  # magenta background used in all editor icons
+
+# Tk's (X11) values for the color names used by image_tint, so tints can be
+# resolved without a Tk interpreter.
+_TINT_COLORS = {
+    "black": (0, 0, 0),
+    "blue": (0, 0, 255),
+    "brown": (165, 42, 42),
+    "cyan": (0, 255, 255),
+    "gray": (190, 190, 190),
+    "green": (0, 255, 0),
+    "grey": (190, 190, 190),
+    "magenta": (255, 0, 255),
+    "orange": (255, 165, 0),
+    "pink": (255, 192, 203),
+    "purple": (160, 32, 240),
+    "red": (255, 0, 0),
+    "white": (255, 255, 255),
+    "yellow": (255, 255, 0),
+}
+
+
+def _tint_key(tint_str):
+    """Normalize an image_tint entry: None for no tint, else the string itself."""
+    return tint_str if (tint_str and tint_str.lower() != "none") else None
+
+
+def parse_tint_rgb(tint_str):
+    """Convert a tint string to an (r, g, b) tuple 0-255 without Tk, or None."""
+    if not _tint_key(tint_str):
+        return None
+    tint_str = tint_str.strip()
+    if tint_str.startswith("["):
+        nums = re.findall(r"[\d.]+", tint_str)
+        if len(nums) >= 3:
+            return tuple(int(float(n) * 255) for n in nums[:3])
+        return None
+    if re.fullmatch(r"#[0-9a-fA-F]{6}", tint_str):
+        return tuple(int(tint_str[i:i + 2], 16) for i in (1, 3, 5))
+    return _TINT_COLORS.get(tint_str.lower())
+
+
+def icon_pairs(data, fallback_stem=None):
+    """Return [(stem, tint_str_or_None), ...] for a def entry."""
+    images = data.get("images", [fallback_stem] if fallback_stem else [])
+    tints = data.get("image_tint", [])
+    return [(stem, tints[i] if i < len(tints) else None) for i, stem in enumerate(images)]
+
+
+def icon_pairs_for_defs(tile_defs, spawn_defs):
+    """Return the set of (stem, tint_key) pairs any tile or spawn can draw."""
+    pairs = set()
+    for tile_id, data in tile_defs.items():
+        pairs.update((stem, _tint_key(tint)) for stem, tint in icon_pairs(data, str(tile_id)))
+    for data in spawn_defs.values():
+        pairs.update((stem, _tint_key(tint)) for stem, tint in icon_pairs(data))
+    return pairs
+
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def _bytes_add(a, b, high, low):
+    """Add two big ints bytewise modulo 256 (no carries between bytes)."""
+    return ((a & low) + (b & low)) ^ ((a ^ b) & high)
+
+
+def _png_unfilter(raw, width, height, bpp):
+    """Undo PNG scanline filters. Sub and Up rows are reconstructed with
+    whole-row integer arithmetic; Average and Paeth fall back to a byte loop."""
+    stride = width * bpp
+    out = bytearray(stride * height)
+    high = int.from_bytes(b"\x80" * stride, "big")
+    low = int.from_bytes(b"\x7f" * stride, "big")
+    prev = bytes(stride)
+    pos = 0
+    for y in range(height):
+        ftype = raw[pos]
+        line = raw[pos + 1:pos + 1 + stride]
+        pos += 1 + stride
+        if ftype == 0:
+            cur = line
+        elif ftype == 1:
+            x = int.from_bytes(line, "big")
+            shift = 8 * bpp
+            while shift < 8 * stride:
+                x = _bytes_add(x, x >> shift, high, low)
+                shift *= 2
+            cur = x.to_bytes(stride, "big")
+        elif ftype == 2:
+            cur = _bytes_add(int.from_bytes(line, "big"), int.from_bytes(prev, "big"), high, low).to_bytes(stride, "big")
+        elif ftype == 3:
+            cur = bytearray(line)
+            for i in range(stride):
+                left = cur[i - bpp] if i >= bpp else 0
+                cur[i] = (cur[i] + ((left + prev[i]) >> 1)) & 0xFF
+        elif ftype == 4:
+            cur = bytearray(line)
+            for i in range(stride):
+                a = cur[i - bpp] if i >= bpp else 0
+                b = prev[i]
+                c = prev[i - bpp] if i >= bpp else 0
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                pred = a if pa <= pb and pa <= pc else (b if pb <= pc else c)
+                cur[i] = (cur[i] + pred) & 0xFF
+        else:
+            raise ValueError(f"Unknown PNG filter type {ftype}")
+        out[y * stride:(y + 1) * stride] = cur
+        prev = cur
+    return out
+
+
+def png_read_rgba(path):
+    """Decode an 8-bit, non-interlaced PNG file into (width, height, RGBA bytearray)."""
+    with open(path, "rb") as f:
+        return png_decode_rgba(f.read(), path)
+
+
+def png_decode_rgba(data, path="<data>"):
+    """Decode 8-bit, non-interlaced PNG bytes into (width, height, RGBA bytearray)."""
+    if data[:8] != _PNG_SIGNATURE:
+        raise ValueError(f"{path}: not a PNG file")
+    pos = 8
+    idat = []
+    palette = trns = None
+    width = height = depth = color = interlace = None
+    while pos + 8 <= len(data):
+        length, ctype = struct.unpack_from(">I4s", data, pos)
+        body = data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+        if ctype == b"IHDR":
+            width, height, depth, color, _comp, _filt, interlace = struct.unpack(">IIBBBBB", body)
+        elif ctype == b"PLTE":
+            palette = body
+        elif ctype == b"tRNS":
+            trns = body
+        elif ctype == b"IDAT":
+            idat.append(body)
+        elif ctype == b"IEND":
+            break
+    if width is None:
+        raise ValueError(f"{path}: missing IHDR")
+    channels = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}.get(color)
+    if depth != 8 or interlace or channels is None:
+        raise ValueError(f"{path}: unsupported PNG (bit depth {depth}, color type {color}, interlace {interlace})")
+    pixels = _png_unfilter(zlib.decompress(b"".join(idat)), width, height, channels)
+
+    n = width * height
+    if color == 6:
+        return width, height, pixels
+    rgba = bytearray(n * 4)
+    if color == 2:
+        for ch in range(3):
+            rgba[ch::4] = pixels[ch::3]
+        rgba[3::4] = b"\xff" * n
+    elif color == 3:
+        pal = (palette or b"").ljust(768, b"\x00")
+        alpha = (trns or b"").ljust(256, b"\xff")[:256]
+        for ch in range(3):
+            rgba[ch::4] = pixels.translate(pal[ch::3])
+        rgba[3::4] = pixels.translate(alpha)
+    else:
+        gray = pixels[0::channels]
+        for ch in range(3):
+            rgba[ch::4] = gray
+        rgba[3::4] = pixels[1::2] if color == 4 else b"\xff" * n
+    return width, height, rgba
+
+
+def png_encode_rgba(width, height, rgba):
+    """Encode an RGBA buffer as a PNG (filter type 0 rows, zlib-compressed)."""
+    stride = width * 4
+    view = memoryview(rgba)
+    raw = b"".join(b"\x00" + view[y * stride:(y + 1) * stride] for y in range(height))
+
+    def chunk(tag, body):
+        return struct.pack(">I", len(body)) + tag + body + struct.pack(">I", zlib.crc32(tag + body) & 0xFFFFFFFF)
+
+    return (
+        _PNG_SIGNATURE
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw, 6))
+        + chunk(b"IEND", b"")
+    )
+
+
+def _byte_table(fn):
+    return bytes(fn(v) for v in range(256))
+
+
+_VISIBLE_TO_OPAQUE = _byte_table(lambda v: 255 if v else 0)
+
+
+def rgba_subsample(width, height, rgba, factor):
+    """Keep every factor-th pixel in both directions, like PhotoImage.subsample()."""
+    if factor <= 1:
+        return width, height, rgba
+    px = memoryview(rgba).cast("I")
+    out = bytearray()
+    for y in range(0, height, factor):
+        out += px[y * width:(y + 1) * width:factor].tobytes()
+    return (width + factor - 1) // factor, (height + factor - 1) // factor, out
+
+
+def rgba_color_key(rgba, key=_TRANSPARENT):
+    """Clear alpha in place on every pixel whose RGB equals key."""
+    n = len(rgba) // 4
+    mask = -1
+    for ch, value in enumerate(key):
+        mask &= int.from_bytes(rgba[ch::4].translate(_byte_table(lambda v, k=value: 255 if v == k else 0)), "big")
+    if mask:
+        alpha = int.from_bytes(rgba[3::4], "big") & ~mask
+        rgba[3::4] = alpha.to_bytes(n, "big")
+    return rgba
+
+
+def rgba_tint(rgba, tint_rgb):
+    """Return a multiplicatively tinted copy; visible pixels become fully opaque,
+    matching what PhotoImage.put() does in the Tk tint path."""
+    out = bytearray(rgba)
+    for ch, t in enumerate(tint_rgb):
+        out[ch::4] = rgba[ch::4].translate(_byte_table(lambda v, t=t: v * t // 255))
+    out[3::4] = rgba[3::4].translate(_VISIBLE_TO_OPAQUE)
+    return out
+
+
+def photo_pixels(img):
+    """Read a PhotoImage's pixels as (width, height, RGBA bytearray) with a single Tcl call."""
+    data = img.tk.call(img, "data", "-format", "png")
+    if isinstance(data, str):
+        data = base64.b64decode(data)
+    return png_decode_rgba(data)
+
+
+def photo_from_pixels(width, height, rgba, img=None):
+    """Write RGBA pixels, alpha included, into img (or a new PhotoImage) with one put."""
+    if img is None:
+        img = tk.PhotoImage(width=width, height=height)
+    data = base64.b64encode(png_encode_rgba(width, height, rgba)).decode("ascii")
+    img.tk.call(img, "put", data, "-format", "png")
+    return img
+
+
+def tint_photo(img, tint_rgb, pixels=None):
+    """Return a tinted copy of img using multiplicative blending.
+
+    pixels is img's (width, height, RGBA) if the caller already has it;
+    otherwise it is read back from Tk once.
+    """
+    w, h, rgba = pixels or photo_pixels(img)
+    return photo_from_pixels(w, h, rgba_tint(rgba, tint_rgb))
+
+
+def color_key_photo(img):
+    """Make all pixels of img matching _TRANSPARENT transparent."""
+    w, h, rgba = photo_pixels(img)
+    photo_from_pixels(w, h, rgba_color_key(rgba), img)
+
+
+def _tint_image_reference(img, tint_rgb):
+    """Original per-pixel Tk tint, kept as the baseline for `bench`."""
+    tr, tg, tb = tint_rgb
+    copy = img.copy()
+    w, h = copy.width(), copy.height()
+    for py in range(h):
+        for px in range(w):
+            if copy.transparency_get(px, py):
+                continue
+            color = copy.get(px, py)
+            if isinstance(color, str):
+                parts = color.split()
+                r, g, b = int(parts[0]), int(parts[1]), int(parts[2])
+            else:
+                r, g, b = color[0], color[1], color[2]
+            copy.put(f"#{r*tr//255:02x}{g*tg//255:02x}{b*tb//255:02x}", (px, py))
+    return copy
+
+
+def _apply_color_key_reference(img):
+    """Original per-pixel Tk color key, kept as the baseline for `bench`."""
+    kr, kg, kb = _TRANSPARENT
+    w, h = img.width(), img.height()
+    pixels = []
+    for py in range(h):
+        for px in range(w):
+            color = img.get(px, py)
+            if isinstance(color, str):
+                parts = color.split()
+                r, g, b = int(parts[0]), int(parts[1]), int(parts[2])
+            else:
+                r, g, b = color[0], color[1], color[2]
+            if r == kr and g == kg and b == kb:
+                pixels.append((px, py))
+    for px, py in pixels:
+        img.transparency_set(px, py, True)
+
+
+_ATLAS_VERSION = 1
+_ATLAS_WIDTH = 2048
+
+
+def _icons_signature(icons_dir):
+    """Hash of the name, size and mtime of every PNG in icons_dir."""
+    h = hashlib.blake2b(digest_size=16)
+    try:
+        names = sorted(n for n in os.listdir(icons_dir) if n.lower().endswith(".png"))
+    except OSError:
+        names = []
+    for name in names:
+        st = os.stat(os.path.join(icons_dir, name))
+        h.update(f"{name}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def atlas_paths(icons_dir):
+    """Return (png_path, index_path) of the cached atlas for icons_dir."""
+    name = hashlib.blake2b(os.path.abspath(icons_dir).encode("utf-8"), digest_size=12).hexdigest()
+    base = os.path.join(_cache_dir("atlas"), name)
+    return f"{base}.png", f"{base}.json"
+
+
+def _atlas_sprite_key(stem, tint_key, size):
+    return f"{stem}|{tint_key or ''}|{size}"
+
+
+def load_atlas_index(icons_dir, pairs=None):
+    """Return the atlas index for icons_dir if it is current and covers pairs, else None."""
+    png_path, index_path = atlas_paths(icons_dir)
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get("version") != _ATLAS_VERSION or not os.path.exists(png_path):
+        return None
+    if index.get("icons") != _icons_signature(icons_dir):
+        return None
+    if pairs is not None:
+        covered = {(stem, tint or None) for stem, tint in index.get("pairs", [])}
+        if not set(pairs) <= covered:
+            return None
+    index["png"] = png_path
+    return index
+
+
+def build_icon_atlas(icons_dir, pairs, sizes=_VALID_CELL_SIZES):
+    """Bake color-keyed, tinted, subsampled icons for every pair into one PNG.
+
+    Writes <cache>/atlas/<hash>.png and a JSON index mapping
+    "stem|tint|size" to [x, y, w, h]. Stems without a PNG are listed under
+    "missing" so the editor can skip them; tints that cannot be resolved
+    without Tk are left out and drawn through the runtime path.
+    """
+    pairs = sorted(pairs, key=lambda p: (p[0], p[1] or ""))
+    sprites = []  # (key, w, h, rgba)
+    missing = set()
+    keyed = {}
+    for stem, tint_key in pairs:
+        if stem in missing:
+            continue
+        if stem not in keyed:
+            path = os.path.join(icons_dir, f"{stem}.png")
+            try:
+                w, h, rgba = png_read_rgba(path)
+            except (OSError, ValueError, zlib.error):
+                missing.add(stem)
+                continue
+            keyed[stem] = (w, h, rgba_color_key(rgba))
+        tint_rgb = parse_tint_rgb(tint_key) if tint_key else None
+        if tint_key and tint_rgb is None:
+            continue
+        w, h, rgba = keyed[stem]
+        for size in sizes:
+            sw, sh, small = rgba_subsample(w, h, rgba, max(1, _ICON_SIZE // size))
+            if tint_rgb:
+                small = rgba_tint(small, tint_rgb)
+            sprites.append((_atlas_sprite_key(stem, tint_key, size), sw, sh, small))
+
+    # Shelf packing, tallest sprites first.
+    sprites.sort(key=lambda s: (-s[2], s[0]))
+    rects = {}
+    x = y = shelf_h = 0
+    for key, w, h, _rgba in sprites:
+        if x + w > _ATLAS_WIDTH:
+            x, y, shelf_h = 0, y + shelf_h, 0
+        rects[key] = [x, y, w, h]
+        x += w
+        shelf_h = max(shelf_h, h)
+    atlas_h = max(1, y + shelf_h)
+
+    atlas = bytearray(_ATLAS_WIDTH * atlas_h * 4)
+    for key, w, h, rgba in sprites:
+        ax, ay = rects[key][0], rects[key][1]
+        row = w * 4
+        for sy in range(h):
+            dst = ((ay + sy) * _ATLAS_WIDTH + ax) * 4
+            atlas[dst:dst + row] = rgba[sy * row:(sy + 1) * row]
+
+    png_path, index_path = atlas_paths(icons_dir)
+    _atomic_write(png_path, png_encode_rgba(_ATLAS_WIDTH, atlas_h, atlas))
+    index = {
+        "version": _ATLAS_VERSION,
+        "icons": _icons_signature(icons_dir),
+        "pairs": [[stem, tint_key or ""] for stem, tint_key in pairs],
+        "missing": sorted(missing),
+        "sprites": rects,
+        "width": _ATLAS_WIDTH,
+        "height": atlas_h,
+    }
+    _atomic_write(index_path, json.dumps(index).encode("utf-8"))
+    index["png"] = png_path
+    return index
+
+
+_UNDO_BUDGET_MB = 16  # $MEW_EDITOR_UNDO_MB overrides
+
+
+class EditJournal:
+    """Undo/redo history made of minimal level deltas.
+
+    A tile delta is ("tile", layer, index, old, new) where old/new are
+    (tile_id, RandomTile or None); an entity delta is ("ent", cell, old, new)
+    with None for an empty cell. Deltas recorded between begin() and commit()
+    form one entry, so a whole drag stroke undoes in one step. The oldest
+    entries are dropped once the history exceeds max_bytes.
+
+    changes counts committed entries, undos and redos; mark_saved() records
+    where the level last matched the file on disk.
+    """
+
+    def __init__(self, max_bytes=None):
+        if max_bytes is None:
+            max_bytes = int(_env_number("MEW_EDITOR_UNDO_MB", _UNDO_BUDGET_MB) * (1 << 20))
+        self.max_bytes = max_bytes
+        self.used = 0
+        self._undo = deque()  # (deltas, nbytes)
+        self._redo = []
+        self._group = None
+        self.changes = 0
+        self.saved_changes = 0
+        self._saved_depth = 0  # len(_undo) at the last mark_saved()
+
+    @property
+    def can_undo(self):
+        return bool(self._undo)
+
+    @property
+    def can_redo(self):
+        return bool(self._redo)
+
+    @property
+    def modified(self):
+        """True if there are edits since the last mark_saved() (or clear())."""
+        return self.changes != self.saved_changes
+
+    def clear(self):
+        self._undo.clear()
+        self._redo.clear()
+        self._group = None
+        self.used = 0
+        self.changes = self.saved_changes = self._saved_depth = 0
+
+    def mark_saved(self):
+        self.saved_changes = self.changes
+        self._saved_depth = len(self._undo)
+
+    def unsaved_entries(self):
+        """Undo entries made since mark_saved(), packed for marshal."""
+        entries = list(self._undo)[self._saved_depth:]
+        return [[_pack_delta(delta) for delta in group] for group, _nbytes in entries]
+
+    def restore_entries(self, packed):
+        """Push entries from unsaved_entries() back onto the undo stack. The
+        level must already contain their changes; it counts as unsaved."""
+        for group in packed:
+            self._record_group([_unpack_delta(delta) for delta in group])
+        self.changes += 1
+
+    def begin(self):
+        if self._group is None:
+            self._group = []
+
+    def commit(self):
+        group, self._group = self._group, None
+        if not group:
+            return
+        self._record_group(group)
+        self._redo.clear()
+        self.changes += 1
+
+    def _record_group(self, group):
+        nbytes = sum(_delta_bytes(delta) for delta in group)
+        self._undo.append((group, nbytes))
+        self.used += nbytes
+        while self.used > self.max_bytes and len(self._undo) > 1:
+            self.used -= self._undo.popleft()[1]
+            self._saved_depth = max(0, self._saved_depth - 1)
+
+    def _record(self, delta):
+        if self._group is None:
+            self._group = [delta]
+            self.commit()
+        else:
+            self._group.append(delta)
+
+    def set_tile(self, level, x, y, tile_id, layer=0):
+        """Set a tile through the journal; returns False if nothing changed."""
+        index = y * level.width + x
+        old = (level.layers[layer][index], level.random_tiles.get((layer, index)))
+        if old == (tile_id, None):
+            return False
+        level.set_tile(x, y, tile_id, layer)
+        self._record(("tile", layer, index, old, (tile_id, None)))
+        return True
+
+    def set_entities(self, level, cell, ent_list):
+        """Replace (or with None, clear) a cell's entities through the journal."""
+        old = level.entities.get(cell)
+        if old == ent_list:
+            return False
+        if ent_list is None:
+            del level.entities[cell]
+        else:
+            level.entities[cell] = ent_list
+        self._record(("ent", cell, old, level.entities.get(cell)))
+        return True
+
+    def undo(self, level):
+        """Revert the newest entry; returns the affected (x, y) cells, or None."""
+        self.commit()
+        if not self._undo:
+            return None
+        group, nbytes = self._undo.pop()
+        self.used -= nbytes
+        self._redo.append((group, nbytes))
+        self._saved_depth = min(self._saved_depth, len(self._undo))
+        self.changes += 1
+        return {_apply_delta(level, delta, forward=False) for delta in reversed(group)}
+
+    def redo(self, level):
+        self.commit()
+        if not self._redo:
+            return None
+        group, nbytes = self._redo.pop()
+        self._undo.append((group, nbytes))
+        self.used += nbytes
+        self.changes += 1
+        return {_apply_delta(level, delta, forward=True) for delta in group}
+
+
+def _delta_bytes(delta):
+    """Rough memory cost of a journal delta."""
+    if delta[0] == "tile":
+        return 96 + sum(16 * len(tile.options) for _tid, tile in delta[3:] if tile is not None)
+    return 96 + sum(72 + 16 * len(ent.options) for ent_list in delta[2:] if ent_list for ent in ent_list)
+
+
+def _apply_delta(level, delta, forward):
+    """Apply one side of a delta to level and return the (x, y) cell it touched."""
+    if delta[0] == "tile":
+        _kind, layer, index, old, new = delta
+        tile_id, random_tile = new if forward else old
+        x, y = index % level.width, index // level.width
+        level.set_tile(x, y, tile_id, layer)
+        if random_tile is not None:
+            level.random_tiles[(layer, index)] = random_tile
+        return x, y
+    _kind, cell, old, new = delta
+    ent_list = new if forward else old
+    if ent_list is None:
+        level.entities.pop(cell, None)
+    else:
+        level.entities[cell] = ent_list
+    return cell
+
+
+def _pack_delta(delta):
+    """A journal delta as plain tuples, for marshal."""
+    if delta[0] == "tile":
+        _kind, layer, index, old, new = delta
+        return ("tile", layer, index) + tuple(
+            (tile_id, None if tile is None else (tile.roll_index, tuple(tile.options)))
+            for tile_id, tile in (old, new)
+        )
+    _kind, cell, old, new = delta
+    return ("ent", cell) + tuple(
+        None if ent_list is None else tuple((ent.id, ent.wave, ent.roll_index, ent.options) for ent in ent_list)
+        for ent_list in (old, new)
+    )
+
+
+def _unpack_delta(packed):
+    if packed[0] == "tile":
+        _kind, layer, index, old, new = packed
+        return ("tile", layer, index) + tuple(
+            (tile_id, None if tile is None else RandomTile(tile[0], list(tile[1])))
+            for tile_id, tile in (old, new)
+        )
+    _kind, cell, old, new = packed
+    return ("ent", tuple(cell)) + tuple(
+        None if records is None else [
+            SpawnObject(id=id_, wave=wave, roll_index=roll_index, options=options)
+            for id_, wave, roll_index, options in records
+        ]
+        for records in (old, new)
+    )
+
+
+def level_snapshot(level):
+    """Copy a LevelData for serializing on another thread.
+
+    Tile layers are copied (a memcpy per array); everything else is shared
+    or shallow-copied, which is safe because the editor replaces entity
+    lists, RandomTiles and raw sections instead of mutating them.
+    """
+    snap = LevelData.__new__(LevelData)
+    snap.__dict__.update(level.__dict__)
+    snap.layers = [array("H", layer) for layer in level.layers]
+    snap.random_tiles = dict(level.random_tiles)
+    snap.raw_layers = list(level.raw_layers)
+    snap.dirty_layers = set(level.dirty_layers)
+    snap.entities = level.entities.copy()
+    key = level.raw_spawns_key
+    if key and key[0] is level.entities and key[1] == level.entities.version:
+        snap.raw_spawns_key = (snap.entities, snap.entities.version)
+    return snap
+
+
+_AUTOSAVE_INTERVAL = 30  # seconds; $MEW_EDITOR_AUTOSAVE_S overrides, 0 disables
+
+
+class Autosaver:
+    """Writes crash-recovery files on a background thread.
+
+    A recovery is `<name>.lvl` (the level in the normal binary layout) plus
+    `<name>.meta`, a marshal of {"path", "pid", "time", "entries"} where
+    entries are the journal's unsaved undo entries. The .meta is written
+    last and removed first, so only complete recoveries are listed.
+
+    save() and discard() only queue work; per name only the newest request
+    is kept, so a slow disk never builds a backlog.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.error = None
+        self._jobs = OrderedDict()  # name -> (snapshot, meta) to write, or None to delete
+        self._cond = threading.Condition()
+        self._closing = False
+        self._thread = threading.Thread(target=self._run, name="autosave", daemon=True)
+        self._thread.start()
+
+    def save(self, name, snapshot, meta):
+        self._queue(name, (snapshot, meta))
+
+    def discard(self, name):
+        self._queue(name, None)
+
+    def _queue(self, name, job):
+        with self._cond:
+            self._jobs.pop(name, None)
+            self._jobs[name] = job
+            self._cond.notify()
+
+    def close(self, timeout=5.0):
+        """Finish queued work and stop the thread."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._jobs and not self._closing:
+                    self._cond.wait()
+                if not self._jobs:
+                    return
+                name, job = self._jobs.popitem(last=False)
+            base = os.path.join(self.directory, name)
+            try:
+                if job is None:
+                    for path in (f"{base}.meta", f"{base}.lvl"):
+                        if os.path.exists(path):
+                            os.remove(path)
+                else:
+                    snapshot, meta = job
+                    _atomic_write(f"{base}.lvl", encode_level_parts(snapshot), durable=True)
+                    _atomic_write(f"{base}.meta", marshal.dumps(meta), durable=True)
+                self.error = None
+            except Exception as exc:
+                self.error = exc
+
+
+def _pid_alive(pid):
+    """Whether process pid is still running. Unknown is treated as alive, so
+    another session's recovery is never offered (or deleted) while in use."""
+    if os.name == "nt":
+        import ctypes
+        from ctypes import wintypes
+
+        kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        kernel32.OpenProcess.argtypes = (wintypes.DWORD, wintypes.BOOL, wintypes.DWORD)
+        kernel32.OpenProcess.restype = wintypes.HANDLE
+        kernel32.GetExitCodeProcess.argtypes = (wintypes.HANDLE, ctypes.POINTER(wintypes.DWORD))
+        kernel32.CloseHandle.argtypes = (wintypes.HANDLE,)
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return ctypes.get_last_error() != 87  # ERROR_INVALID_PARAMETER: no such process
+        try:
+            code = wintypes.DWORD()
+            if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+                return True
+            return code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    if os.name != "posix":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def list_recoveries(directory):
+    """Recoveries left by editor sessions that are no longer running, newest
+    first: their .meta dicts plus "name" and "lvl" (the recovered level)."""
+    found = []
+    for entry in os.listdir(directory):
+        if not entry.endswith(".meta"):
+            continue
+        name = entry[:-len(".meta")]
+        lvl = os.path.join(directory, f"{name}.lvl")
+        try:
+            with open(os.path.join(directory, entry), "rb") as f:
+                meta = marshal.loads(f.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            continue
+        if not os.path.exists(lvl) or meta.get("pid") == os.getpid() or _pid_alive(meta.get("pid", 0)):
+            continue
+        found.append(dict(meta, name=name, lvl=lvl))
+    found.sort(key=lambda meta: meta.get("time", 0), reverse=True)
+    return found
+
+
+def _grid_line(start, end):
+    """Return the cells on a straight line from start to end (Bresenham), inclusive."""
+    (x0, y0), (x1, y1) = start, end
+    dx, dy = abs(x1 - x0), -abs(y1 - y0)
+    sx = 1 if x1 > x0 else -1
+    sy = 1 if y1 > y0 else -1
+    err = dx + dy
+    cells = [(x0, y0)]
+    while (x0, y0) != (x1, y1):
+        e2 = 2 * err
+        if e2 >= dy:
+            err += dy
+            x0 += sx
+        if e2 <= dx:
+            err += dx
+            y0 += sy
+        cells.append((x0, y0))
+    return cells
+
+
+_NOT_CACHED = object()
+_ICON_CACHE_MB = 256  # $MEW_EDITOR_ICON_CACHE_MB overrides
+
+
+def _image_bytes(value):
+    """Approximate memory held by a cached icon: 4 bytes per pixel for Tk
+    images, plus any RGBA buffers kept alongside them."""
+    if value is None:
+        return 0
+    if isinstance(value, tuple):
+        return sum(_image_bytes(v) for v in value)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, int):
+        return 0
+    return value.width() * value.height() * 4
+
+
+class IconCache:
+    """LRU cache of icon images bounded by an approximate byte budget.
+
+    None is a valid cached value (a known-missing icon); use get() with a
+    default to tell it apart from a miss. Images shown on the canvas are
+    referenced by their cells as well, so evicting them is safe.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (value, nbytes)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value):
+        nbytes = _image_bytes(value)
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.used -= old[1]
+        self._entries[key] = (value, nbytes)
+        self.used += nbytes
+        while self.used > self.budget and len(self._entries) > 1:
+            _key, (_value, freed) = self._entries.popitem(last=False)
+            self.used -= freed
+            self.evictions += 1
+        return value
+
+    def clear(self):
+        self._entries.clear()
+        self.used = 0
+
+    def evict(self, match):
+        """Drop the entries whose key satisfies match(key); return how many."""
+        keys = [key for key in self._entries if match(key)]
+        for key in keys:
+            self.used -= self._entries.pop(key)[1]
+        return len(keys)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.used,
+            "budget": self.budget,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class Profiler:
+    """Opt-in timing of editor hot paths (`level_editor.py --profile`).
+
+    wrap() returns a function that times each call with perf_counter into
+    per-name totals. Calls of the frame functions (the ones that redraw)
+    also count as one frame each; nested frame calls fold into the
+    outermost. window() returns the stats since its previous call for the
+    status bar overlay.
+
+    With a trace path, every call and each window() summary are written to
+    it as JSON lines; a path ending in .prof instead records a cProfile
+    session and dumps its stats on close(). wrap_globals() rebinds module
+    functions to timed wrappers until close() puts the originals back.
+    """
+
+    FRAMES = frozenset(("_draw_grid", "_update_viewport", "_flush_redraws", "_update_palette", "_replay"))
+
+    def __init__(self, trace_path=None):
+        self.start = time.perf_counter()
+        self.totals = {}  # name -> [calls, seconds, max seconds], whole session
+        self._window = {}
+        self._frames = []  # frame durations since the last window()
+        self._frame_depth = 0
+        self.trace_path = trace_path
+        self._trace = None
+        self._pending = []
+        self._cprofile = None
+        self._patched = []  # (namespace, name, original function) from wrap_globals()
+        if trace_path and trace_path.endswith(".prof"):
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        elif trace_path:
+            self._trace = open(trace_path, "a", encoding="utf-8")
+
+    def wrap(self, name, fn):
+        is_frame = name in self.FRAMES
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            if is_frame:
+                self._frame_depth += 1
+            t0 = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - t0
+                self.add(name, elapsed, t0)
+                if is_frame:
+                    self._frame_depth -= 1
+                    if not self._frame_depth:
+                        self._frames.append(elapsed)
+
+        timed.__wrapped__ = fn
+        return timed
+
+    def wrap_globals(self, namespace, names):
+        """Time calls of the functions bound to names in namespace (a module's
+        globals()) until close(). Names another profiler already wraps are left alone."""
+        for name in names:
+            fn = namespace[name]
+            if not hasattr(fn, "__wrapped__"):
+                namespace[name] = self.wrap(name, fn)
+                self._patched.append((namespace, name, fn))
+
+    def add(self, name, elapsed, t0=None):
+        for table in (self.totals, self._window):
+            entry = table.get(name)
+            if entry is None:
+                table[name] = [1, elapsed, elapsed]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+                if elapsed > entry[2]:
+                    entry[2] = elapsed
+        if self._trace is not None:
+            start = (t0 if t0 is not None else time.perf_counter() - elapsed) - self.start
+            self._pending.append({"t": round(start, 6), "name": name, "ms": round(elapsed * 1e3, 4)})
+
+    def window(self, extra=None):
+        """Return and reset {"frames": [...], "calls": {name: [calls, s, max s]}};
+        extra (cache stats, item counts) is added to it and to the trace."""
+        frames, self._frames = self._frames, []
+        calls, self._window = self._window, {}
+        result = {"frames": frames, "calls": calls, **(extra or {})}
+        if self._trace is not None:
+            self._pending.append({
+                "t": round(time.perf_counter() - self.start, 6),
+                "name": "window",
+                "frames_ms": [round(f * 1e3, 3) for f in frames],
+                **(extra or {}),
+            })
+            self.flush()
+        return result
+
+    def flush(self):
+        if self._trace is not None and self._pending:
+            self._trace.writelines(json.dumps(record, sort_keys=True) + "\n" for record in self._pending)
+            self._trace.flush()
+            self._pending = []
+
+    def close(self):
+        for namespace, name, fn in reversed(self._patched):
+            if getattr(namespace[name], "__wrapped__", None) is fn:
+                namespace[name] = fn
+        self._patched = []
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.trace_path)
+            self._cprofile = None
+        if self._trace is not None:
+            self._pending.append({"t": round(time.perf_counter() - self.start, 6), "name": "totals", "totals": {
+                name: {"calls": calls, "ms": round(total * 1e3, 3), "max_ms": round(worst * 1e3, 3)}
+                for name, (calls, total, worst) in self.totals.items()
+            }})
+            self.flush()
+            self._trace.close()
+            self._trace = None
+
+
+# Editor methods and module functions timed under --profile.
+_PROFILED_METHODS = (
+    "_draw_grid", "_update_viewport", "_redraw_cells", "_flush_redraws", "_replay", "_update_palette",
+    "_get_icon", "_get_raw_icon", "_load_defs", "_apply_def_changes", "_refresh_icon_atlas", "_load_level",
+    "_save_level",
+)
+_PROFILED_FUNCTIONS = ("_parse_gon_entry", "reload_gon", "png_read_rgba", "tint_photo", "photo_from_pixels", "encode_level_parts")
+_PROFILE_REFRESH_MS = 500
+
+
+_SEARCH_DEBOUNCE_MS = 150
+_DEF_WATCH_MS = 500
+_PALETTE_ROW = 22
+_PALETTE_ICON = 16  # one of _VALID_CELL_SIZES, so thumbnails come from the atlas
+_PALETTE_FONT = ("TkDefaultFont", 9)
+_PALETTE_HEADER_FONT = ("TkDefaultFont", 9, "bold")
+
+
+class LevelEditor(tk.Tk):
+    def __init__(self, profiler=None):
+        super().__init__()
+        self.title("Level Editor")
+        self.resizable(True, True)
+        self.profiler = profiler
+        if profiler is not None:
+            self._instrument()
+
+        self.level = LevelData()
+        self.base_dir = os.path.dirname(os.path.abspath(__file__))
+        self._load_defs(
+            self._resolve_local_path("tiles.gon"),
+            self._resolve_local_path("spawns.gon"),
+        )
+
+        self.cell_size = 32
+        self.grid_origin = (10, 10)
+        self.canvas_size = self.cell_size * 10 + 20
+        # Split of the icon cache budget: full-size sources are the expensive
+        # ones to rebuild, so they get most of it.
+        budget = int(_env_number("MEW_EDITOR_ICON_CACHE_MB", _ICON_CACHE_MB) * (1 << 20))
+        self._icon_raw_cache = IconCache(budget * 3 // 8)     # stem -> (PhotoImage, w, h, RGBA), color-keyed
+        self._icon_tinted_cache = IconCache(budget * 3 // 8)  # (stem, tint) -> PhotoImage (full-size, tinted)
+        self._icon_cache = IconCache(budget // 4)             # (stem, tint, cell_size) -> PhotoImage (subsampled)
+        self._atlas_photo = None     # prebuilt sprite sheet, see build_icon_atlas()
+        self._atlas_index = None
+        self._atlas_build = None     # (thread, result) while a rebuild runs
+        self._cell_items = {}        # (x, y) -> {"tile": [ids], "ent": [ids], "text": id, "images": [...]}, visible cells only
+        self._viewport = None        # (x0, x1, y0, y1) cell range that currently has items
+        self._viewport_job = None
+        self._pending_cells = set()  # cells waiting for the next idle redraw
+        self._redraw_job = None
+        self._stroke = None          # (brush, last_cell) while a mouse button is held
+        self.journal = EditJournal()
+        self._heatmap = None         # (x, y) -> 0..1 from the last simulation
+        self._simulation = None      # (thread, result) while a simulation runs
+        self._catalog_scan = None    # catalog update thread while one runs
+        self._search_job = None      # pending debounced sidebar search
+        self._palette_slots = []     # pooled canvas items, one per palette line in view
+        self._palette_job = None
+        self._thumb_queue = OrderedDict()  # (stem, tint) palette thumbnails waiting to load
+        self._thumb_job = None
+        self._autosave_interval = _env_number("MEW_EDITOR_AUTOSAVE_S", _AUTOSAVE_INTERVAL)
+        self.autosaver = Autosaver(_cache_dir("recovery")) if self._autosave_interval > 0 else None
+        self._recovery_name = None   # recovery file of the current level, once written
+        self._autosaved_changes = 0  # journal.changes at the last autosave
+        self._autosave_error = None  # last Autosaver.error shown in the status bar
+        self._refresh_icon_atlas()
+
+        self._build_ui()
+        self._on_mode_change()
+        self._on_spawn_type_change()
+        self._draw_grid()
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+        self.after(_DEF_WATCH_MS, self._watch_defs)
+        if self.autosaver is not None:
+            self.after(int(self._autosave_interval * 1000), self._autosave_tick)
+            self.after_idle(self._offer_recovery)
+
+    def _build_ui(self):
+        top = tk.Frame(self)
+        top.pack(fill="x", padx=8, pady=6)
+
+        tk.Label(top, text="File:").pack(side="left")
+        self.path_var = tk.StringVar(value="")
+        path_entry = tk.Entry(top, textvariable=self.path_var, width=40)
+        path_entry.pack(side="left", padx=6)
+
+        tk.Button(top, text="Browse", command=self._browse).pack(side="left")
+        tk.Button(top, text="Create", command=self._create_room).pack(side="left", padx=4)
+        tk.Button(top, text="Load", command=self._load).pack(side="left", padx=4)
+        tk.Button(top, text="Save", command=self._save).pack(side="left", padx=4)
+        tk.Button(top, text="Save As", command=self._save_as).pack(side="left")
+        tk.Button(top, text="Undo", command=self._undo).pack(side="left", padx=(12, 4))
+        tk.Button(top, text="Redo", command=self._redo).pack(side="left")
+        tk.Button(top, text="Catalog", command=self._open_catalog).pack(side="left", padx=(12, 0))
+        self.bind("<Control-z>", self._undo)
+        self.bind("<Control-y>", self._redo)
+        self.bind("<Control-Z>", self._redo)
+
+        controls = tk.Frame(self)
+        controls.pack(fill="x", padx=8, pady=6)
+
+        self.mode_var = tk.StringVar(value="tile")
+        tk.Label(controls, text="Mode:").pack(side="left")
+        tk.Radiobutton(controls, text="Tile", variable=self.mode_var, value="tile", command=self._on_mode_change).pack(side="left")
+        tk.Radiobutton(controls, text="Entity", variable=self.mode_var, value="entity", command=self._on_mode_change).pack(side="left")
+
+        def_row = tk.Frame(self)
+        def_row.pack(fill="x", padx=8, pady=(0, 4))
+        self.def_file_var = tk.StringVar(value=self.level.tiles_file)
+        tk.Entry(def_row, textvariable=self.def_file_var, width=20, state="readonly").pack(side="left", padx=(0, 6))
+        tk.Button(def_row, text="Change", command=self._change_def_file).pack(side="left")
+
+        self.tile_var = tk.IntVar(value=0)
+        self.entity_id_var = tk.StringVar(value="")
+        self.entity_extra_var = tk.StringVar(value="0")
+        self.entity_spawn_type_var = tk.StringVar(value="fixed")
+        self.entity_roll_index_var = tk.StringVar(value="0")
+        self.pool_weight_var = tk.StringVar(value="1")
+        self.random_pool = []
+        self.preview_active = False
+        self.preview_map = {}
+
+        self.entity_controls = tk.Frame(self)
+        self.entity_controls.pack(fill="x", padx=8, pady=(0, 6))
+        tk.Label(self.entity_controls, text="ID").pack(side="left")
+        tk.Entry(self.entity_controls, textvariable=self.entity_id_var, width=8).pack(side="left", padx=(4, 10))
+        tk.Label(self.entity_controls, text="Wave").pack(side="left")
+        tk.Entry(self.entity_controls, textvariable=self.entity_extra_var, width=5).pack(side="left", padx=(4, 10))
+        tk.Radiobutton(
+            self.entity_controls,
+            text="Fixed",
+            variable=self.entity_spawn_type_var,
+            value="fixed",
+            command=self._on_spawn_type_change,
+        ).pack(side="left")
+        tk.Radiobutton(
+            self.entity_controls,
+            text="Random",
+            variable=self.entity_spawn_type_var,
+            value="random",
+            command=self._on_spawn_type_change,
+        ).pack(side="left", padx=(4, 10))
+
+        self.random_controls = tk.Frame(self)
+        self.random_controls.pack(fill="x", padx=8, pady=(0, 6))
+        tk.Label(self.random_controls, text="Roll Index").pack(side="left")
+        tk.Entry(self.random_controls, textvariable=self.entity_roll_index_var, width=5).pack(side="left", padx=(4, 10))
+        tk.Label(self.random_controls, text="Weight").pack(side="left")
+        tk.Entry(self.random_controls, textvariable=self.pool_weight_var, width=6).pack(side="left", padx=(4, 10))
+        tk.Button(self.random_controls, text="Add", command=self._pool_add).pack(side="left")
+        tk.Button(self.random_controls, text="Remove", command=self._pool_remove).pack(side="left", padx=(4, 0))
+        tk.Button(self.random_controls, text="Clear", command=self._pool_clear).pack(side="left", padx=(4, 0))
+
+        self.pool_list = tk.Listbox(self, height=5, exportselection=False)
+        self.pool_list.pack(fill="x", padx=8, pady=(0, 6))
+
+        self.random_tools = tk.Frame(self)
+        self.random_tools.pack(fill="x", padx=8, pady=(0, 6))
+        tk.Button(self.random_tools, text="Preview Randomization", command=self._preview_randomization).pack(side="left", padx=(8, 0))
+        tk.Button(self.random_tools, text="Reset Preview", command=self._reset_preview).pack(side="left", padx=(4, 0))
+        tk.Label(self.random_tools, text="Seed").pack(side="left", padx=(12, 0))
+        self.roll_seed_var = tk.StringVar(value="")
+        tk.Entry(self.random_tools, textvariable=self.roll_seed_var, width=10).pack(side="left", padx=(4, 0))
+        tk.Button(self.random_tools, text="Simulate", command=self._simulate).pack(side="left", padx=(12, 0))
+        tk.Button(self.random_tools, text="Clear Heatmap", command=self._clear_heatmap).pack(side="left", padx=(4, 0))
+
+        content = tk.Frame(self)
+        content.pack(fill="both", expand=True, padx=8, pady=6)
+
+        sidebar = tk.Frame(content)
+        sidebar.pack(side="left", fill="y", padx=(0, 8))
+        self.sidebar_title = tk.Label(sidebar, text="Tiles")
+        self.sidebar_title.pack(anchor="w")
+
+        self.sidebar_search_var = tk.StringVar()
+        sidebar_search = tk.Entry(sidebar, textvariable=self.sidebar_search_var, width=24)
+        sidebar_search.pack(fill="x", pady=(4, 6))
+        sidebar_search.bind("<KeyRelease>", self._on_sidebar_search)
+
+        self.palette = tk.Canvas(
+            sidebar, width=220, height=16 * _PALETTE_ROW, bg="white",
+            highlightthickness=0, yscrollincrement=_PALETTE_ROW,
+        )
+        sidebar_scroll = tk.Scrollbar(sidebar, orient="vertical", command=self.palette.yview)
+        self.palette.configure(yscrollcommand=lambda *view: (sidebar_scroll.set(*view), self._schedule_palette()))
+        self.palette.pack(side="left", fill="y")
+        sidebar_scroll.pack(side="left", fill="y")
+        self.palette.bind("<Button-1>", self._on_palette_click)
+        self.palette.bind("<Configure>", lambda _e: self._schedule_palette())
+        self.palette.bind("<MouseWheel>", lambda e: self.palette.yview_scroll(-3 if e.delta > 0 else 3, "units"))
+        self.palette.bind("<Button-4>", lambda e: self.palette.yview_scroll(-3, "units"))
+        self.palette.bind("<Button-5>", lambda e: self.palette.yview_scroll(3, "units"))
+
+        self._populate_sidebar_list()
+
+        canvas_frame = tk.Frame(content)
+        canvas_frame.pack(side="left", fill="both", expand=True)
+        self.canvas = tk.Canvas(canvas_frame, width=self.canvas_size, height=self.canvas_size, bg="#f8fafc")
+        canvas_xscroll = tk.Scrollbar(canvas_frame, orient="horizontal", command=self.canvas.xview)
+        canvas_yscroll = tk.Scrollbar(canvas_frame, orient="vertical", command=self.canvas.yview)
+        # The canvas reports every view change (scrollbars, wheel, resize) here.
+        self.canvas.configure(
+            xscrollcommand=lambda *view: (canvas_xscroll.set(*view), self._schedule_viewport()),
+            yscrollcommand=lambda *view: (canvas_yscroll.set(*view), self._schedule_viewport()),
+        )
+        canvas_yscroll.pack(side="right", fill="y")
+        canvas_xscroll.pack(side="bottom", fill="x")
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.canvas.bind("<MouseWheel>", lambda e: self.canvas.yview_scroll(-1 if e.delta > 0 else 1, "units"))
+        self.canvas.bind("<Shift-MouseWheel>", lambda e: self.canvas.xview_scroll(-1 if e.delta > 0 else 1, "units"))
+        self.canvas.bind("<Button-4>", lambda e: self.canvas.yview_scroll(-1, "units"))
+        self.canvas.bind("<Button-5>", lambda e: self.canvas.yview_scroll(1, "units"))
+        self.canvas.bind("<Button-1>", self._on_left_click)
+        self.canvas.bind("<Button-3>", self._on_right_click)
+        self.canvas.bind("<B1-Motion>", self._on_drag)
+        self.canvas.bind("<B3-Motion>", self._on_drag)
+        self.canvas.bind("<ButtonRelease-1>", self._end_stroke)
+        self.canvas.bind("<ButtonRelease-3>", self._end_stroke)
+        self.canvas.bind("<Button-2>", self._pick_from_cell)
+        self.canvas.bind("<Shift-Button-1>", self._pick_from_cell)
+        self.canvas.bind("<Configure>", self._on_canvas_resize)
+
+        status_bar = tk.Frame(self)
+        status_bar.pack(fill="x", padx=8, pady=(6, 6))
+        self.profile_var = tk.StringVar(value="")
+        if self.profiler is not None:
+            tk.Label(status_bar, textvariable=self.profile_var, anchor="e", fg="#475569").pack(side="right")
+            self.after(_PROFILE_REFRESH_MS, self._profile_tick)
+        self.status_var = tk.StringVar(value="")
+        status = tk.Label(status_bar, textvariable=self.status_var, anchor="w")
+        status.pack(side="left", fill="x", expand=True)
+
+    def _load_defs(self, tiles_path, spawns_path):
+        """Load the def files and build their palette indexes. Kept as they
+        are when the same files are already loaded and unchanged on disk
+        (every level load lands here)."""
+        stamps = {path: _file_stamp(path) for path in (tiles_path, spawns_path)}
+        if (tiles_path, spawns_path) == (getattr(self, "tiles_path", None), getattr(self, "spawns_path", None)) \
+                and stamps == self._def_stamps:
+            return
+        self.tiles_path = tiles_path
+        self.spawns_path = spawns_path
+        self._def_stamps = stamps
+        self._def_pending = {}
+        self.tile_defs, tile_terms = _parse_gon_entry(tiles_path)
+        self.spawn_defs, spawn_terms = _parse_gon_entry(spawns_path)
+        self.tile_names = {k: v.get("name", f"Tile {k}") for k, v in self.tile_defs.items()}
+        self.spawn_names = {k: v.get("name", str(k)) for k, v in self.spawn_defs.items()}
+        self.tile_search = self._build_search_index(tile_terms, self.tile_defs, self.tile_names)
+        self.spawn_search = self._build_search_index(spawn_terms, self.spawn_defs, self.spawn_names)
+        self._palette = None
+
+    def _watch_defs(self):
+        """Poll the def files and apply edits made outside the editor. A new
+        size/mtime must hold for one poll before it is read, so a file still
+        being written is not picked up half-way."""
+        self.after(_DEF_WATCH_MS, self._watch_defs)
+        for kind, path in (("tiles", self.tiles_path), ("spawns", self.spawns_path)):
+            stamp = _file_stamp(path)
+            if stamp is None or stamp == self._def_stamps.get(path):
+                continue
+            if self._def_pending.get(path) != stamp:
+                self._def_pending[path] = stamp
+                continue
+            try:
+                doc, changed = reload_gon(path)
+            except (OSError, ValueError):
+                continue  # retried on the next poll
+            if changed is None:
+                self._load_defs(self.tiles_path, self.spawns_path)  # records the new stamp
+                self._refresh_icon_atlas()
+                self._populate_sidebar_list()
+                self._draw_grid()
+                self.status_var.set(f"Reloaded {os.path.basename(path)}")
+                continue
+            self._def_stamps[path] = stamp
+            if changed:
+                self._apply_def_changes(kind, path, doc, changed)
+
+    def _apply_def_changes(self, kind, path, doc, changed):
+        """Update the defs of the changed ids from doc, then redraw only what
+        depends on them: visible cells using those ids and the palette. Cached
+        icons are keyed by stem and tint, so only the images of pairs no def
+        draws any more are evicted; new pairs load (or join the atlas) on use."""
+        is_tiles = kind == "tiles"
+        defs = self.tile_defs if is_tiles else self.spawn_defs
+        names = self.tile_names if is_tiles else self.spawn_names
+        stems_for = self._icon_stems_for_tile if is_tiles else self._icon_stems_for_entity
+        old_pairs = {(stem, _tint_key(tint)) for def_id in changed for stem, tint in stems_for(def_id)}
+        for def_id in changed:
+            if def_id in doc:
+                data = defs[def_id] = doc.editor_fields(def_id)
+                names[def_id] = data.get("name", f"Tile {def_id}" if is_tiles else str(def_id))
+            else:
+                defs.pop(def_id, None)
+                names.pop(def_id, None)
+        self._evict_icons(old_pairs - icon_pairs_for_defs(self.tile_defs, self.spawn_defs))
+
+        old_index = self.tile_search if is_tiles else self.spawn_search
+        index = self._build_search_index(def_search_terms(doc), defs, names)
+        showing = self._palette is not None and self._palette[0] is old_index
+        if (index.keys, index.labels, index.groups) != (old_index.keys, old_index.labels, old_index.groups):
+            if is_tiles:
+                self.tile_search = index
+            else:
+                self.spawn_search = index
+            if showing:
+                self._populate_sidebar_list()
+        elif showing:
+            self._update_palette()
+
+        self._refresh_icon_atlas()
+        self._redraw_cells(self._cells_using(kind, changed))
+        self.status_var.set(f"Reloaded {os.path.basename(path)}: {len(changed)} def(s) changed")
+
+    def _evict_icons(self, pairs):
+        """Drop the cached images of (stem, tint_key) pairs."""
+        if not pairs:
+            return
+        in_use = {stem for stem, _tint in icon_pairs_for_defs(self.tile_defs, self.spawn_defs)}
+        stale_stems = {stem for stem, _tint in pairs} - in_use
+        self._icon_cache.evict(lambda key: key[:2] in pairs)
+        self._icon_tinted_cache.evict(lambda key: key in pairs)
+        self._icon_raw_cache.evict(lambda stem: stem in stale_stems)
+
+    def _cells_using(self, kind, ids):
+        """Visible cells that draw one of the given tile or spawn ids."""
+        if kind == "tiles":
+            return [cell for cell in self._cell_items if self.level.tile_at(*cell) in ids]
+        cells = set()
+        for def_id in ids:
+            cells |= self.level.entities.cells_with_id(def_id)
+        return [cell for cell in cells if cell in self._cell_items]
+
+    def _build_search_index(self, terms, defs, names):
+        """Index defs for the palette, grouped by editor category (named from
+        the def file's category notes) and by id within a category. terms is
+        def_search_terms() of the def file."""
+        objects, categories = terms
+        arrows = {15: "↑", 16: "↓", 17: "→", 18: "←"} if defs is self.tile_defs else {}
+        rows = []
+        for def_id, name in names.items():
+            try:
+                category = int(defs[def_id].get("category"))
+            except (TypeError, ValueError):
+                category = None
+            if category is None:
+                group, group_name = (1, 0), "Other"
+            else:
+                group, group_name = (0, category), categories.get(category, f"Category {category}")
+            label = f"{name} {arrows[def_id]}" if def_id in arrows else name
+            terms = (name, def_id, group_name if category is not None and category in categories else None,
+                     *objects.get(def_id, ()))
+            rows.append(((group, def_id, name.lower()), (def_id, label, group_name, terms)))
+        rows.sort(key=lambda row: row[0])
+        return SearchIndex(entry for _order, entry in rows)
+
+    def _resolve_local_path(self, filename):
+        local = os.path.join(self.base_dir, filename)
+        return local if os.path.exists(local) else filename
+
+    def _icons_dir(self):
+        return os.path.join(self.base_dir, "editor_icons")
+
+    def _icon_stems_for_tile(self, tile_id):
+        return icon_pairs(self.tile_defs.get(tile_id, {}), str(tile_id))
+
+    def _icon_stems_for_entity(self, ent_id):
+        return icon_pairs(self.spawn_defs.get(ent_id, {}))
+
+    def _refresh_icon_atlas(self):
+        """Use the cached icon atlas if it covers the current defs, else rebuild it in the background."""
+        pairs = icon_pairs_for_defs(self.tile_defs, self.spawn_defs)
+        if self._atlas_index is not None and pairs <= self._atlas_pairs:
+            return
+        index = load_atlas_index(self._icons_dir(), pairs)
+        if index is not None:
+            self._use_icon_atlas(index)
+            return
+        if self._atlas_build is not None:
+            return  # _poll_icon_atlas re-checks once the running build finishes
+        icons_dir = self._icons_dir()
+        result = {}
+
+        def work():
+            try:
+                result["index"] = build_icon_atlas(icons_dir, pairs)
+            except Exception as exc:
+                result["error"] = exc
+
+        thread = threading.Thread(target=work, name="icon-atlas", daemon=True)
+        thread.start()
+        self._atlas_build = (thread, result)
+        self.after(250, self._poll_icon_atlas)
+
+    def _poll_icon_atlas(self):
+        thread, result = self._atlas_build
+        if thread.is_alive():
+            self.after(250, self._poll_icon_atlas)
+            return
+        self._atlas_build = None
+        if "index" in result:
+            self._refresh_icon_atlas()
+            self._draw_grid()
+            self._update_palette()
+
+    def _use_icon_atlas(self, index):
+        try:
+            photo = tk.PhotoImage(file=index["png"])
+        except tk.TclError:
+            return
+        self._atlas_photo = photo
+        self._atlas_index = index
+        self._atlas_pairs = {(stem, tint or None) for stem, tint in index["pairs"]}
+        self._atlas_missing = set(index["missing"])
+        self._icon_cache.clear()
+
+    def _atlas_icon(self, stem, tint_key, size):
+        """Slice stem+tint at size out of the atlas, or None if it is not baked."""
+        rect = self._atlas_index["sprites"].get(_atlas_sprite_key(stem, tint_key, size))
+        if rect is None:
+            return None
+        x, y, w, h = rect
+        img = tk.PhotoImage(width=w, height=h)
+        img.tk.call(img, "copy", self._atlas_photo, "-from", x, y, x + w, y + h, "-to", 0, 0, "-compositingrule", "set")
+        return img
+
+    def _parse_tint_color(self, tint_str):
+        """Convert a tint string to an (r, g, b) tuple 0-255, or None."""
+        if not _tint_key(tint_str):
+            return None
+        rgb = parse_tint_rgb(tint_str)
+        if rgb is not None or tint_str.strip().startswith("["):
+            return rgb
+        try:
+            r16, g16, b16 = self.winfo_rgb(tint_str)
+            return (r16 // 256, g16 // 256, b16 // 256)
+        except Exception:
+            return None
+
+    def _get_raw_icon(self, stem):
+        """Return (PhotoImage, w, h, RGBA) for stem's full-size color-keyed icon, or None."""
+        raw = self._icon_raw_cache.get(stem, _NOT_CACHED)
+        if raw is not _NOT_CACHED:
+            return raw
+        path = os.path.join(self._icons_dir(), f"{stem}.png")
+        if not os.path.exists(path):
+            return self._icon_raw_cache.put(stem, None)
+        try:
+            try:
+                w, h, rgba = png_read_rgba(path)
+            except ValueError:
+                # A PNG flavour the Python decoder does not handle; let Tk read it.
+                img = tk.PhotoImage(file=path)
+                color_key_photo(img)
+                raw = (img, *photo_pixels(img))
+            else:
+                rgba_color_key(rgba)
+                raw = (photo_from_pixels(w, h, rgba), w, h, rgba)
+        except Exception:
+            return self._icon_raw_cache.put(stem, None)
+        return self._icon_raw_cache.put(stem, raw)
+
+    def _get_icon(self, stem, tint_str=None, size=None):
+        """Return a subsampled PhotoImage for stem+tint at size (default: the
+        current cell_size), or None."""
+        size = size or self.cell_size
+        tint_key = _tint_key(tint_str)
+        key = (stem, tint_key, size)
+        img = self._icon_cache.get(key, _NOT_CACHED)
+        if img is not _NOT_CACHED:
+            return img
+        if self._atlas_index is not None:
+            if stem in self._atlas_missing:
+                return self._icon_cache.put(key, None)
+            img = self._atlas_icon(stem, tint_key, size)
+            if img is not None:
+                return self._icon_cache.put(key, img)
+        raw = self._get_raw_icon(stem)
+        if raw is None:
+            return self._icon_cache.put(key, None)
+        source = raw[0]
+        if tint_key:
+            tc = (stem, tint_key)
+            source = self._icon_tinted_cache.get(tc)
+            if source is None:
+                tint_rgb = self._parse_tint_color(tint_key)
+                source = tint_photo(raw[0], tint_rgb, raw[1:]) if tint_rgb else raw[0]
+                self._icon_tinted_cache.put(tc, source)
+        try:
+            factor = _ICON_SIZE // size
             if factor > 1:
                 img = source.subsample(factor)
             elif factor < 1:
-                img = source.zoom(self.cell_size // self._ICON_SIZE)
+                img = source.zoom(size // _ICON_SIZE)
             else:
                 img = source
         except Exception:
-            self._icon_cache[key] = None
-            return None
-        self._icon_cache[key] = img
-        return img
+            return self._icon_cache.put(key, None)
+        return self._icon_cache.put(key, img)
+
+    def icon_cache_stats(self):
+        """Return IconCache.stats() for the raw, tinted and scaled icon caches."""
+        return {
+            "raw": self._icon_raw_cache.stats(),
+            "tinted": self._icon_tinted_cache.stats(),
+            "scaled": self._icon_cache.stats(),
+        }
 
     def _icon_draw_pos(self, img, x0, y0):
         """Return (draw_x, draw_y) anchor-nw to center img on the cell."""
@@ -526,41 +3319,119 @@ class LevelEditor(tk.Tk):
 
     def _reload_defs_for_level(self, level_path, spawn_file, tiles_file):
         level_dir = os.path.dirname(level_path)
+        self._load_defs(
+            resolve_def_path(level_dir, tiles_file, self.base_dir),
+            resolve_def_path(level_dir, spawn_file, self.base_dir),
+        )
+        self._refresh_icon_atlas()
 
-        def resolve(filename):
-            p = os.path.join(level_dir, filename)
-            if os.path.exists(p):
-                return p
-            return self._resolve_local_path(filename)
+    def _open_catalog(self):
+        """Search the level catalog; double-click a result to load it."""
+        dlg = tk.Toplevel(self)
+        dlg.title("Level Catalog")
+        catalog_db = catalog_path()
 
-        self._load_defs(resolve(tiles_file), resolve(spawn_file))
-        self._icon_raw_cache.clear()
-        self._icon_tinted_cache.clear()
-        self._icon_cache.clear()
+        filters = {}
+        for row, (key, label) in enumerate([
+            ("spawn", "Spawn (id or name):"),
+            ("tile", "Tile id:"),
+            ("area", "Area:"),
+            ("difficulty", "Difficulty:"),
+            ("min_enemies", "Min enemies:"),
+            ("max_enemies", "Max enemies:"),
+        ]):
+            filters[key] = tk.StringVar()
+            tk.Label(dlg, text=label, anchor="w").grid(row=row, column=0, padx=8, pady=2, sticky="w")
+            tk.Entry(dlg, textvariable=filters[key], width=30).grid(row=row, column=1, padx=4, sticky="w")
 
-    def _build_default_prefix(self, level):
-        spawn_file = (level.spawn_file or "spawns.gon").encode("utf-8", errors="ignore")
-        tiles_file = (level.tiles_file or "tiles.gon").encode("utf-8", errors="ignore")
-        header = struct.pack(
-            "<9i",
-            int(level.version),
-            int(level.width),
-            int(level.height),
-            int(level.mode),
-            0,  # entity count, patched later
-            0,  # cam x
-            0,  # cam y
-            int(level.width),  # cam w
-            int(level.height),  # cam h
-        )
-        return (
-            header
-            + struct.pack("<i", len(spawn_file))
-            + spawn_file
-            + struct.pack("<i", len(tiles_file))
-            + tiles_file
-            + struct.pack("<ii", 0, 0)
-        )
+        results = tk.Listbox(dlg, width=90, height=16)
+        results.grid(row=7, column=0, columnspan=3, padx=8, pady=4, sticky="nsew")
+        dlg.grid_rowconfigure(7, weight=1)
+        dlg.grid_columnconfigure(1, weight=1)
+        info_var = tk.StringVar(value=f"Catalog: {catalog_db}")
+        tk.Label(dlg, textvariable=info_var, anchor="w").grid(row=8, column=0, columnspan=3, padx=8, sticky="w")
+        paths = []
+
+        def search(_event=None):
+            query = {key: var.get().strip() or None for key, var in filters.items()}
+            try:
+                for key in ("min_enemies", "max_enemies"):
+                    if query[key] is not None:
+                        query[key] = float(query[key])
+                if query["tile"] is not None:
+                    int(query["tile"], 0)
+            except ValueError:
+                messagebox.showerror("Catalog", "Tile id and enemy counts must be numbers.", parent=dlg)
+                return
+            catalog = LevelCatalog(catalog_db)
+            try:
+                rows = catalog.query(**query)
+            finally:
+                catalog.close()
+            results.delete(0, "end")
+            paths[:] = [row["path"] for row in rows]
+            for row in rows:
+                where = "/".join(part for part in (row["area"], row["difficulty"]) if part)
+                results.insert("end", f"{row['enemies']:6.2f} enemies  {where:16} {row['name']}  ({row['mod_title'] or row['path']})")
+            info_var.set(f"{len(rows)} level(s) in {catalog_db}")
+
+        def scan():
+            if self._catalog_scan is not None:
+                return
+            mod_dir = filedialog.askdirectory(parent=dlg, title="Mod folder (contains levels/)")
+            if not mod_dir:
+                return
+            result = {}
+
+            def work():
+                # sqlite3 connections are per thread; the scan opens its own.
+                catalog = LevelCatalog(catalog_db)
+                try:
+                    result["stats"] = catalog.update([mod_dir])
+                except Exception as exc:
+                    result["error"] = exc
+                finally:
+                    catalog.close()
+
+            thread = threading.Thread(target=work, name="catalog-scan", daemon=True)
+            thread.start()
+            self._catalog_scan = thread
+            info_var.set(f"Scanning {mod_dir}...")
+
+            def poll():
+                if thread.is_alive():
+                    self.after(100, poll)
+                    return
+                self._catalog_scan = None
+                if not dlg.winfo_exists():
+                    return
+                if "error" in result:
+                    info_var.set(f"Scan failed: {result['error']}")
+                    return
+                stats = result["stats"]
+                search()
+                info_var.set(
+                    f"{info_var.get()}; scanned {stats['scanned']}, {stats['updated']} updated, "
+                    f"{stats['removed']} removed, {stats['errors']} unreadable"
+                )
+
+            self.after(100, poll)
+
+        def open_selected(_event=None):
+            sel = results.curselection()
+            if not sel:
+                return
+            self.path_var.set(self._normalize_input_path(paths[sel[0]]))
+            self._load()
+
+        results.bind("<Double-Button-1>", open_selected)
+        dlg.bind("<Return>", search)
+        btn_frame = tk.Frame(dlg)
+        btn_frame.grid(row=6, column=0, columnspan=3, pady=6, sticky="w", padx=8)
+        tk.Button(btn_frame, text="Search", command=search).pack(side="left")
+        tk.Button(btn_frame, text="Scan mod folder...", command=scan).pack(side="left", padx=6)
+        tk.Button(btn_frame, text="Open", command=open_selected).pack(side="left")
+        search()
 
     def _create_room(self):
         dlg = tk.Toplevel(self)
@@ -588,6 +3459,15 @@ class LevelEditor(tk.Tk):
         tk.Label(dlg, text="Level name:", anchor="w").grid(row=2, column=0, padx=8, pady=4, sticky="w")
         tk.Entry(dlg, textvariable=name_var, width=40).grid(row=2, column=1, padx=4)
 
+        width_var = tk.StringVar(value="10")
+        height_var = tk.StringVar(value="10")
+        tk.Label(dlg, text="Size:", anchor="w").grid(row=3, column=0, padx=8, pady=4, sticky="w")
+        size_frame = tk.Frame(dlg)
+        size_frame.grid(row=3, column=1, padx=4, sticky="w")
+        tk.Entry(size_frame, textvariable=width_var, width=5).pack(side="left")
+        tk.Label(size_frame, text="x").pack(side="left", padx=4)
+        tk.Entry(size_frame, textvariable=height_var, width=5).pack(side="left")
+
         def confirm():
             spawns_path = spawns_var.get().strip()
             tiles_path = tiles_var.get().strip()
@@ -595,11 +3475,24 @@ class LevelEditor(tk.Tk):
             if not level_name:
                 messagebox.showerror("Create", "Level name is required.", parent=dlg)
                 return
+            try:
+                width = int(width_var.get())
+                height = int(height_var.get())
+            except ValueError:
+                width = height = 0
+            # Entity positions are stored as int16.
+            if not (0 < width <= 0x7FFF and 0 < height <= 0x7FFF):
+                messagebox.showerror("Create", "Width and height must be between 1 and 32767.", parent=dlg)
+                return
             dlg.destroy()
             if self.preview_active:
                 self._reset_preview(silent=True)
             self._load_defs(tiles_path, spawns_path)
-            self.level = LevelData()
+            self._refresh_icon_atlas()
+            self.level = LevelData(width, height)
+            self._discard_recovery()
+            self.journal.clear()
+            self._heatmap = None
             self.level.spawn_file = os.path.basename(spawns_path)
             self.level.tiles_file = os.path.basename(tiles_path)
             self.random_pool = []
@@ -610,67 +3503,214 @@ class LevelEditor(tk.Tk):
             self.status_var.set(f"Created new level: {level_name}")
 
         btn_frame = tk.Frame(dlg)
-        btn_frame.grid(row=3, column=0, columnspan=3, pady=8)
+        btn_frame.grid(row=4, column=0, columnspan=3, pady=8)
         tk.Button(btn_frame, text="Create", command=confirm).pack(side="left", padx=8)
         tk.Button(btn_frame, text="Cancel", command=dlg.destroy).pack(side="left")
 
-    _ICON_SIZE = 128
-    _VALID_CELL_SIZES = [16, 32, 64]  # 128 // 8, 128 // 4, 128 // 2
-    _TRANSPARENT = (255, 0, 255)  # magenta background used in all editor icons
-
     def _snap_cell_size(self, raw):
         """Snap raw pixel size to the nearest icon-compatible cell size."""
-        return min(self._VALID_CELL_SIZES, key=lambda s: abs(s - raw))
+        return min(_VALID_CELL_SIZES, key=lambda s: abs(s - raw))
+
+    def _fit_cell_size(self, width, height):
+        """Largest snapped cell size that fits the level in width x height
+        pixels; bigger levels bottom out at the smallest size and scroll."""
+        raw = max(16, min((width - 20) // self.level.width, (height - 20) // self.level.height))
+        return self._snap_cell_size(raw)
 
     def _on_canvas_resize(self, event):
-        size = min(event.width, event.height)
-        raw = max(16, (size - 20) // 10)
-        cell = self._snap_cell_size(raw)
+        cell = self._fit_cell_size(event.width, event.height)
         if cell != self.cell_size:
             self.cell_size = cell
-            self._icon_tinted_cache.clear()
-            self._icon_cache.clear()
             self.grid_origin = (10, 10)
             self._draw_grid()
 
     def _draw_grid(self):
+        """Rebuild the canvas items of every visible cell. Only needed when the
+        cell size, defs or level change; edits go through _redraw_cells()."""
+        if self.canvas.winfo_ismapped():
+            self.cell_size = self._fit_cell_size(self.canvas.winfo_width(), self.canvas.winfo_height())
         self.canvas.delete("all")
-        # Pass 1: all backgrounds and tile icons
-        for y in range(10):
-            for x in range(10):
-                self._draw_cell_bg(x, y)
-        # Pass 2: all entity icons/text on top
-        for y in range(10):
-            for x in range(10):
-                self._draw_cell_fg(x, y)
+        self._cell_items = {}
+        self._viewport = None
+        ox, oy = self.grid_origin
+        self.canvas.configure(scrollregion=(
+            0, 0, ox * 2 + self.level.width * self.cell_size, oy * 2 + self.level.height * self.cell_size,
+        ))
+        self._update_viewport()
+        self._update_status()
+
+    def _schedule_viewport(self):
+        if self._viewport_job is None:
+            self._viewport_job = self.after_idle(self._update_viewport)
+
+    def _visible_bounds(self):
+        """Return the (x0, x1, y0, y1) cell range in view, plus a one-cell margin."""
+        ox, oy = self.grid_origin
+        cs = self.cell_size
+        left = self.canvas.canvasx(0)
+        top = self.canvas.canvasy(0)
+        if self.canvas.winfo_ismapped():
+            view_w, view_h = self.canvas.winfo_width(), self.canvas.winfo_height()
+        else:
+            view_w, view_h = int(self.canvas.cget("width")), int(self.canvas.cget("height"))
+        right = left + view_w
+        bottom = top + view_h
+        return (
+            max(0, int((left - ox) // cs) - 1),
+            min(self.level.width, int((right - ox) // cs) + 2),
+            max(0, int((top - oy) // cs) - 1),
+            min(self.level.height, int((bottom - oy) // cs) + 2),
+        )
+
+    def _update_viewport(self):
+        """Create items for cells that scrolled into view and drop the items
+        of cells that left it, so item count tracks the window, not the level."""
+        self._viewport_job = None
+        bounds = self._visible_bounds()
+        if bounds == self._viewport:
+            return
+        x0, x1, y0, y1 = bounds
+        for cell in [c for c in self._cell_items if not (x0 <= c[0] < x1 and y0 <= c[1] < y1)]:
+            self.canvas.delete(self._cell_tag(*cell))
+            del self._cell_items[cell]
+        self._viewport = bounds
+        for y in range(y0, y1):
+            for x in range(x0, x1):
+                if (x, y) not in self._cell_items:
+                    self._render_cell(x, y)
+        self._restack()
+
+    def _restack(self):
+        """Put entity items above tiles and the heatmap above everything."""
+        self.canvas.tag_raise("ent")
+        self.canvas.tag_raise("heat")
+
+    def _cell_tag(self, x, y):
+        return f"cell{x}_{y}"
+
+    def _redraw_cells(self, cells):
+        """Update the canvas items of just the given (x, y) cells in place.
+        Cells outside the viewport are skipped; they render when scrolled in."""
+        raise_ents = False
+        for x, y in cells:
+            if (x, y) in self._cell_items:
+                raise_ents |= self._render_cell(x, y)
+        if raise_ents:
+            self._restack()
         self._update_status()
 
+    def _random_cells(self):
+        """Cells whose drawing depends on the randomization preview."""
+        return self.level.entities.random_cells()
+
     def _cell_coords(self, x, y):
         ox, oy = self.grid_origin
         x0 = ox + x * self.cell_size
         y0 = oy + y * self.cell_size
         return x0, y0, x0 + self.cell_size, y0 + self.cell_size
 
-    def _draw_cell_bg(self, x, y):
+    def _render_cell(self, x, y):
+        """Create or update the items for cell (x, y): a background rectangle,
+        one image per tile icon layer, then entity images or a text label.
+
+        Items are reused with coords/itemconfigure; surplus ones are hidden.
+        Returns True if a tile image or heatmap item was created, so the
+        caller can restore the stacking order with _restack().
+        """
         x0, y0, x1, y1 = self._cell_coords(x, y)
-        tile_id = self.level.tiles[y * 10 + x]
-        self.canvas.create_rectangle(x0, y0, x1, y1, fill="#e5e7eb", outline="#cbd5e1")
+        cell_tag = self._cell_tag(x, y)
+        items = self._cell_items.get((x, y))
+        if items is None:
+            self.canvas.create_rectangle(x0, y0, x1, y1, fill="#e5e7eb", outline="#cbd5e1", tags=(cell_tag,))
+            items = self._cell_items[(x, y)] = {"tile": [], "ent": [], "text": None}
+        tile_id = self.level.tile_at(x, y)
+        tile_icons = []
+        if tile_id != 0:
+            for stem, tint in self._icon_stems_for_tile(tile_id):
+                tile_icon = self._get_icon(stem, tint)
+                if tile_icon:
+                    tile_icons.append(tile_icon)
+        created = self._place_cell_images(items["tile"], tile_icons, x0, y0, ("tile", cell_tag))
 
-        if tile_id == 0:
-            return
+        ent_icons, label = self._cell_entity_view(x, y)
+        self._place_cell_images(items["ent"], ent_icons, x0, y0, ("ent", cell_tag))
+        # The icon caches may evict these; keep the ones on screen alive.
+        items["images"] = tile_icons + ent_icons
+        text_id = items["text"]
+        if label is None:
+            if text_id is not None:
+                self.canvas.itemconfigure(text_id, state="hidden")
+        else:
+            font = ("Arial", max(6, self.cell_size // 7), "bold")
+            wrap = max(8, self.cell_size - 10)
+            if text_id is None:
+                items["text"] = self.canvas.create_text(
+                    (x0 + x1) / 2,
+                    (y0 + y1) / 2,
+                    text=label,
+                    fill="#111827",
+                    font=font,
+                    width=wrap,
+                    tags=("ent", cell_tag),
+                )
+            else:
+                self.canvas.coords(text_id, (x0 + x1) / 2, (y0 + y1) / 2)
+                self.canvas.itemconfigure(text_id, text=label, font=font, width=wrap, state="normal")
+        created |= self._render_cell_heat(items, x, y, cell_tag)
+        return created
 
-        for stem, tint in self._icon_stems_for_tile(tile_id):
-            tile_icon = self._get_icon(stem, tint)
-            if tile_icon:
-                ix, iy = self._icon_draw_pos(tile_icon, x0, y0)
-                self.canvas.create_image(ix, iy, image=tile_icon, anchor="nw")
+    def _render_cell_heat(self, items, x, y, cell_tag):
+        """Show the simulation heatmap value of (x, y) as a stippled overlay."""
+        heat = self._heatmap.get((x, y)) if self._heatmap else None
+        heat_ids = items.get("heat")
+        if heat is None:
+            if heat_ids:
+                for item in heat_ids:
+                    self.canvas.itemconfigure(item, state="hidden")
+            return False
+        x0, y0, x1, y1 = self._cell_coords(x, y)
+        color = f"#{int(255 * heat):02x}40{int(255 * (1 - heat)):02x}"
+        label = f"{heat * 100:.0f}%"
+        if heat_ids is None:
+            items["heat"] = (
+                self.canvas.create_rectangle(
+                    x0, y0, x1, y1, fill=color, stipple="gray50", outline="", tags=("heat", cell_tag),
+                ),
+                self.canvas.create_text(
+                    x1 - 2, y1 - 1, text=label, anchor="se", fill="#111827",
+                    font=("Arial", max(6, self.cell_size // 5)), tags=("heat", cell_tag),
+                ),
+            )
+            return True
+        rect_id, text_id = heat_ids
+        self.canvas.coords(rect_id, x0, y0, x1, y1)
+        self.canvas.itemconfigure(rect_id, fill=color, state="normal")
+        self.canvas.coords(text_id, x1 - 2, y1 - 1)
+        self.canvas.itemconfigure(text_id, text=label, state="normal")
+        return False
 
+    def _place_cell_images(self, ids, icons, x0, y0, tags):
+        """Show icons centered on the cell using the image items in ids,
+        creating items as needed. Returns True if any item was created."""
+        created = False
+        for i, icon in enumerate(icons):
+            ix, iy = self._icon_draw_pos(icon, x0, y0)
+            if i < len(ids):
+                self.canvas.coords(ids[i], ix, iy)
+                self.canvas.itemconfigure(ids[i], image=icon, state="normal")
+            else:
+                ids.append(self.canvas.create_image(ix, iy, image=icon, anchor="nw", tags=tags))
+                created = True
+        for item in ids[len(icons):]:
+            self.canvas.itemconfigure(item, state="hidden")
+        return created
 
-    def _draw_cell_fg(self, x, y):
-        x0, y0, x1, y1 = self._cell_coords(x, y)
+    def _cell_entity_view(self, x, y):
+        """Return (icons, label) for the entity in cell (x, y); label is set
+        only when no icon can be drawn."""
         ent_list = self.level.entities.get((x, y), [])
         if not ent_list:
-            return
+            return [], None
         ent = ent_list[0]
         ent_id = ent.id
         if ent.is_random:
@@ -688,62 +3728,23 @@ class LevelEditor(tk.Tk):
         if len(ent_list) > 1:
             label = f"{label}*"
 
-        drew_icon = False
+        icons = []
         for stem, tint in self._icon_stems_for_entity(display_id):
             ent_icon = self._get_icon(stem, tint)
             if ent_icon:
-                ix, iy = self._icon_draw_pos(ent_icon, x0, y0)
-                self.canvas.create_image(ix, iy, image=ent_icon, anchor="nw")
-                drew_icon = True
-        if not drew_icon:
-            self.canvas.create_text(
-                (x0 + x1) / 2,
-                (y0 + y1) / 2,
-                text=label,
-                fill="#111827",
-                font=("Arial", max(6, self.cell_size // 7), "bold"),
-                width=max(8, self.cell_size - 10),
-            )
-
+                icons.append(ent_icon)
+        return icons, (None if icons else label)
 
 
     def _populate_tile_list(self, filter_text=""):
-        self.sidebar_listbox.delete(0, tk.END)
-        self.tile_index_by_id = {}
-        self.tile_id_order = sorted(self.tile_names.keys())
-        if filter_text:
-            f = filter_text.lower()
-            self.tile_id_order = [tid for tid in self.tile_id_order if f in self.tile_names.get(tid, "").lower() or f in str(tid)]
-        for idx, tile_id in enumerate(self.tile_id_order):
-            self.tile_index_by_id[tile_id] = idx
-            display = self.tile_names.get(tile_id, f"Tile {tile_id}")
-            if tile_id in (15, 16, 17, 18):
-                arrow = {15: "↑", 16: "↓", 17: "→", 18: "←"}.get(tile_id, "")
-                if arrow:
-                    display = f"{display} {arrow}"
-            self.sidebar_listbox.insert(tk.END, display)
+        self._show_sidebar_rows(self.tile_search, filter_text)
         self._select_tile_in_list(self.tile_var.get())
 
     def _select_tile_in_list(self, tile_id):
-        idx = self.tile_index_by_id.get(tile_id)
-        if idx is None:
-            return
-        self.sidebar_listbox.selection_clear(0, tk.END)
-        self.sidebar_listbox.selection_set(idx)
-        self.sidebar_listbox.see(idx)
+        self._select_sidebar_key(self.tile_search, tile_id)
 
     def _populate_entity_list(self, filter_text=""):
-        self.sidebar_listbox.delete(0, tk.END)
-        items = []
-        for ent_id, name in self.spawn_names.items():
-            items.append((name, ent_id))
-        items.sort(key=lambda t: (t[1], t[0].lower()))
-        if filter_text:
-            f = filter_text.lower()
-            items = [it for it in items if f in it[0].lower()]
-        self.entity_items = items
-        for name, ent_id in items:
-            self.sidebar_listbox.insert(tk.END, name)
+        self._show_sidebar_rows(self.spawn_search, filter_text)
         self._select_entity_in_list()
 
     def _select_entity_in_list(self):
@@ -751,26 +3752,134 @@ class LevelEditor(tk.Tk):
             current_id = int(self.entity_id_var.get(), 0)
         except Exception:
             return
-        for idx, (_name, ent_id) in enumerate(self.entity_items):
-            if ent_id == current_id:
-                self.sidebar_listbox.selection_clear(0, tk.END)
-                self.sidebar_listbox.selection_set(idx)
-                self.sidebar_listbox.see(idx)
-                return
+        self._select_sidebar_key(self.spawn_search, current_id)
+
+    def _show_sidebar_rows(self, index, filter_text):
+        """Lay out the rows of index matching filter_text under their category
+        headers. Only the lines in view get canvas items (_update_palette)."""
+        lines = []  # SearchIndex row, or the group name for a header line
+        group = None
+        for row in index.search(filter_text):
+            if index.groups[row] != group:
+                group = index.groups[row]
+                lines.append(group)
+            lines.append(row)
+        positions = {line: pos for pos, line in enumerate(lines) if isinstance(line, int)}
+        selected = self._palette[3] if self._palette is not None and self._palette[0] is index else None
+        self._palette = [index, lines, positions, selected]
+        width = max(self.palette.winfo_width(), int(self.palette.cget("width")))
+        self.palette.configure(scrollregion=(0, 0, width, len(lines) * _PALETTE_ROW))
+        self._update_palette()
+
+    def _select_sidebar_key(self, index, key):
+        if self._palette is None or self._palette[0] is not index:
+            return
+        self._palette[3] = key
+        pos = self._palette[2].get(index.rows_by_key.get(key))
+        if pos is not None:
+            top = self.palette.canvasy(0)
+            height = self.palette.winfo_height()
+            y = pos * _PALETTE_ROW
+            if y < top or y + _PALETTE_ROW > top + height:
+                total = max(1, len(self._palette[1]) * _PALETTE_ROW)
+                self.palette.yview_moveto(max(0, y - height // 2) / total)
+        self._update_palette()
 
-    def _on_sidebar_select(self, _event):
-        selection = self.sidebar_listbox.curselection()
-        if not selection:
+    def _schedule_palette(self):
+        if self._palette_job is None:
+            self._palette_job = self.after_idle(self._update_palette)
+
+    def _update_palette(self):
+        """Point the pooled per-line items at the lines now in view; hide the rest.
+
+        Thumbnails already in the icon cache are drawn; missing ones are queued
+        for _load_thumbnails and filled in when they arrive.
+        """
+        if self._palette_job is not None:
+            self.after_cancel(self._palette_job)
+            self._palette_job = None
+        if self._palette is None:
+            return
+        index, lines, _positions, selected = self._palette
+        canvas = self.palette
+        top = canvas.canvasy(0)
+        first = max(0, int(top // _PALETTE_ROW))
+        last = min(len(lines), int((top + max(canvas.winfo_height(), _PALETTE_ROW)) // _PALETTE_ROW) + 1)
+        width = max(canvas.winfo_width(), int(canvas.cget("width")))
+        stems_for = self._icon_stems_for_tile if index is self.tile_search else self._icon_stems_for_entity
+        self._thumb_queue.clear()
+        while len(self._palette_slots) < last - first:
+            self._palette_slots.append({
+                "bg": canvas.create_rectangle(0, 0, 0, 0, width=0, tags=("palette",)),
+                "text": canvas.create_text(0, 0, anchor="w", tags=("palette",)),
+                "images": [],
+            })
+        for slot_no, slot in enumerate(self._palette_slots):
+            line_no = first + slot_no
+            if line_no >= last:
+                canvas.itemconfigure(slot["bg"], state="hidden")
+                canvas.itemconfigure(slot["text"], state="hidden")
+                for image_id in slot["images"]:
+                    canvas.itemconfigure(image_id, state="hidden")
+                continue
+            line = lines[line_no]
+            y0 = line_no * _PALETTE_ROW
+            canvas.coords(slot["bg"], 0, y0, width, y0 + _PALETTE_ROW)
+            icons = []
+            if isinstance(line, str):
+                canvas.itemconfigure(slot["bg"], fill="#e2e8f0", state="normal")
+                canvas.coords(slot["text"], 4, y0 + _PALETTE_ROW // 2)
+                canvas.itemconfigure(slot["text"], text=line, font=_PALETTE_HEADER_FONT, state="normal")
+            else:
+                key = index.keys[line]
+                canvas.itemconfigure(slot["bg"], fill="#bfdbfe" if key == selected else "", state="normal")
+                canvas.coords(slot["text"], _PALETTE_ICON + 8, y0 + _PALETTE_ROW // 2)
+                canvas.itemconfigure(slot["text"], text=index.labels[line], font=_PALETTE_FONT, state="normal")
+                for stem, tint in stems_for(key):
+                    icon = self._icon_cache.get((stem, _tint_key(tint), _PALETTE_ICON), _NOT_CACHED)
+                    if icon is _NOT_CACHED:
+                        self._thumb_queue[(stem, tint)] = None
+                    elif icon is not None:
+                        icons.append(icon)
+            while len(slot["images"]) < len(icons):
+                slot["images"].append(canvas.create_image(0, 0, anchor="nw", tags=("palette",)))
+            offset = (_PALETTE_ROW - _PALETTE_ICON) // 2
+            for image_id, icon in zip(slot["images"], icons):
+                canvas.coords(image_id, 4 + (_PALETTE_ICON - icon.width()) // 2, y0 + offset + (_PALETTE_ICON - icon.height()) // 2)
+                canvas.itemconfigure(image_id, image=icon, state="normal")
+            for image_id in slot["images"][len(icons):]:
+                canvas.itemconfigure(image_id, state="hidden")
+        if self._thumb_queue and self._thumb_job is None:
+            self._thumb_job = self.after_idle(self._load_thumbnails)
+
+    def _load_thumbnails(self):
+        """Load queued palette thumbnails for a few milliseconds, then yield to
+        the event loop and continue on the next idle pass."""
+        self._thumb_job = None
+        deadline = time.perf_counter() + 0.008
+        loaded = False
+        while self._thumb_queue and time.perf_counter() < deadline:
+            (stem, tint), _ = self._thumb_queue.popitem(last=False)
+            self._get_icon(stem, tint, size=_PALETTE_ICON)
+            loaded = True
+        if loaded:
+            self._update_palette()
+        elif self._thumb_queue:
+            self._thumb_job = self.after_idle(self._load_thumbnails)
+
+    def _on_palette_click(self, event):
+        if self._palette is None:
+            return
+        index, lines = self._palette[0], self._palette[1]
+        line_no = int(self.palette.canvasy(event.y) // _PALETTE_ROW)
+        if not 0 <= line_no < len(lines) or isinstance(lines[line_no], str):
             return
-        idx = selection[0]
+        key = index.keys[lines[line_no]]
         if self.mode_var.get() == "tile":
-            if idx < len(self.tile_id_order):
-                tile_id = self.tile_id_order[idx]
-                self.tile_var.set(tile_id)
+            self.tile_var.set(key)
         else:
-            if idx < len(self.entity_items):
-                _name, ent_id = self.entity_items[idx]
-                self.entity_id_var.set(str(ent_id))
+            self.entity_id_var.set(str(key))
+        self._select_sidebar_key(index, key)
 
     def _browse(self):
         path = filedialog.askopenfilename(filetypes=[("Level files", "*.lvl"), ("All files", "*.*")])
@@ -782,7 +3891,7 @@ class LevelEditor(tk.Tk):
         if not path:
             messagebox.showerror("Load", "Please choose a .lvl file.")
             return
-        if not os.path.exists(path):
+        if not os.path.exists(path) and split_bundle_path(path) is None:
             messagebox.showerror("Load", f"File not found:\n{path}")
             return
         try:
@@ -790,10 +3899,18 @@ class LevelEditor(tk.Tk):
         except Exception as exc:
             messagebox.showerror("Load failed", str(exc))
             return
+        self._show_level(loaded, path)
+        self.status_var.set(f"Loaded {path}")
+
+    def _show_level(self, loaded, path):
+        """Make loaded the level being edited, with a fresh history."""
         self._reload_defs_for_level(path, loaded.spawn_file, loaded.tiles_file)
         self.preview_active = False
         self.preview_map = {}
         self.level = loaded
+        self._discard_recovery()
+        self.journal.clear()
+        self._heatmap = None
         self.random_pool = []
         self._refresh_pool_list()
         self.path_var.set(path)
@@ -801,11 +3918,11 @@ class LevelEditor(tk.Tk):
         self.def_file_var.set(loaded.spawn_file if is_entity else loaded.tiles_file)
         self._populate_sidebar_list()
         self._draw_grid()
-        self.status_var.set(f"Loaded {path}")
 
     def _save(self):
         path = self._normalize_input_path(self.path_var.get())
-        if not path:
+        if not path or split_bundle_path(path) is not None:
+            # Bundle members are read-only; save them as a .lvl of their own.
             self._save_as()
             return
         if self.preview_active:
@@ -815,8 +3932,87 @@ class LevelEditor(tk.Tk):
         except Exception as exc:
             messagebox.showerror("Save failed", str(exc))
             return
+        self.journal.mark_saved()
+        self._discard_recovery()
         self.status_var.set(f"Saved {path}")
 
+    def _autosave_tick(self):
+        """Hand a snapshot of unsaved edits to the autosave thread, if there
+        are new ones since the last tick."""
+        self.after(int(self._autosave_interval * 1000), self._autosave_tick)
+        error = self.autosaver.error
+        if error is not None and error is not self._autosave_error:
+            self.status_var.set(f"Autosave failed: {error}")
+        self._autosave_error = error
+        if not self.journal.modified or self.journal.changes == self._autosaved_changes:
+            return
+        self._write_recovery()
+
+    def _write_recovery(self):
+        path = self.path_var.get().strip()
+        name = f"{os.getpid()}-{hashlib.blake2b(os.path.abspath(path or 'untitled').encode('utf-8'), digest_size=8).hexdigest()}"
+        if self._recovery_name not in (None, name):
+            self.autosaver.discard(self._recovery_name)
+        meta = {
+            "path": path,
+            "pid": os.getpid(),
+            "time": time.time(),
+            "entries": self.journal.unsaved_entries(),
+        }
+        self.autosaver.save(name, level_snapshot(self.level), meta)
+        self._recovery_name = name
+        self._autosaved_changes = self.journal.changes
+
+    def _discard_recovery(self):
+        if self.autosaver is not None and self._recovery_name is not None:
+            self.autosaver.discard(self._recovery_name)
+        self._recovery_name = None
+        self._autosaved_changes = 0
+
+    def _offer_recovery(self):
+        """Offer to restore levels autosaved by editor sessions that did not exit cleanly."""
+        try:
+            recoveries = list_recoveries(self.autosaver.directory)
+        except OSError:
+            return
+        for meta in recoveries:
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(meta.get("time", 0)))
+            target = meta.get("path") or "a new level"
+            restore = messagebox.askyesno(
+                "Recover unsaved edits",
+                f"The editor closed with unsaved edits to {target} (autosaved {when}).\n\n"
+                "Restore them? Choosing No deletes the recovery copy.",
+            )
+            if not restore:
+                self.autosaver.discard(meta["name"])
+                continue
+            try:
+                level = load_level_data(meta["lvl"])
+            except Exception as exc:
+                messagebox.showerror("Recovery failed", str(exc))
+                continue
+            level.path = meta.get("path") or None
+            self._show_level(level, meta.get("path", ""))
+            self.journal.restore_entries(meta.get("entries", []))
+            # Re-save under this session's name before dropping the old copy.
+            self._write_recovery()
+            self.autosaver.discard(meta["name"])
+            self.status_var.set(f"Recovered unsaved edits to {target}; save to keep them.")
+            return
+
+    def _on_close(self):
+        if self.autosaver is not None:
+            if self.journal.modified:
+                # Keep unsaved edits for the next session to offer back.
+                if self.journal.changes != self._autosaved_changes:
+                    self._write_recovery()
+            else:
+                self._discard_recovery()
+            self.autosaver.close()
+        if self.profiler is not None:
+            self.profiler.close()
+        self.destroy()
+
     def _save_as(self):
         path = filedialog.asksaveasfilename(defaultextension=".lvl", filetypes=[("Level files", "*.lvl")])
         if not path:
@@ -826,64 +4022,134 @@ class LevelEditor(tk.Tk):
 
     def _cell_from_event(self, event):
         ox, oy = self.grid_origin
-        x = (event.x - ox) // self.cell_size
-        y = (event.y - oy) // self.cell_size
-        if 0 <= x < 10 and 0 <= y < 10:
+        x = (self.canvas.canvasx(event.x) - ox) // self.cell_size
+        y = (self.canvas.canvasy(event.y) - oy) // self.cell_size
+        if 0 <= x < self.level.width and 0 <= y < self.level.height:
             return int(x), int(y)
         return None
 
     def _on_left_click(self, event):
+        self._start_stroke(event, self._make_brush())
+
+    def _on_right_click(self, event):
+        self._start_stroke(event, self._make_eraser())
+
+    def _on_drag(self, event):
+        """Continue the current stroke, filling any cells skipped by a fast drag."""
+        if self._stroke is None:
+            return
+        brush, last = self._stroke
+        cell = self._cell_from_event(event)
+        if not cell or cell == last:
+            return
+        cells = _grid_line(last, cell)[1:]
+        for x, y in cells:
+            brush(x, y)
+        self._stroke = (brush, cell)
+        self._queue_redraw(cells)
+
+    def _end_stroke(self, _event=None):
+        self._stroke = None
+        self.journal.commit()
+
+    def _start_stroke(self, event, make_brush):
+        self._stroke = None
         cell = self._cell_from_event(event)
         if not cell:
             return
         if self.preview_active:
             self._reset_preview(silent=True)
-        x, y = cell
+        brush = make_brush()
+        if brush is None:
+            return
+        self.journal.begin()
+        brush(*cell)
+        self._stroke = (brush, cell)
+        self._queue_redraw([cell])
+
+    def _make_brush(self):
+        """Validate the current tile/entity settings once per stroke and
+        return a function that paints them into cell (x, y), or None."""
         if self.mode_var.get() == "tile":
             tile_id = int(self.tile_var.get())
-            self.level.tiles[y * 10 + x] = tile_id
             self._select_tile_in_list(tile_id)
+
+            def paint_tile(x, y):
+                self.journal.set_tile(self.level, x, y, tile_id)
+            return paint_tile
+
+        try:
+            ent_extra = int(self.entity_extra_var.get(), 0) & 0xFF
+        except Exception:
+            self.status_var.set("Invalid entity id/extra.")
+            return None
+        if self.entity_spawn_type_var.get() == "random":
+            try:
+                roll_index = int(self.entity_roll_index_var.get(), 0) & 0xFF
+            except Exception:
+                self.status_var.set("Invalid roll index.")
+                return None
+            if not self.random_pool:
+                self.status_var.set("Random pool is empty.")
+                return None
+            pool = list(self.random_pool)
+
+            def paint_entity(x, y):
+                record = SpawnObject(id=0xFFFF, wave=ent_extra, roll_index=roll_index, options=pool)
+                self.journal.set_entities(self.level, (x, y), [record])
         else:
             try:
-                ent_extra = int(self.entity_extra_var.get(), 0) & 0xFF
+                ent_id = int(self.entity_id_var.get(), 0) & 0xFFFF
             except Exception:
-                self.status_var.set("Invalid entity id/extra.")
-                return
-            if self.entity_spawn_type_var.get() == "random":
-                try:
-                    roll_index = int(self.entity_roll_index_var.get(), 0) & 0xFF
-                except Exception:
-                    self.status_var.set("Invalid roll index.")
-                    return
-                if not self.random_pool:
-                    self.status_var.set("Random pool is empty.")
-                    return
-                record = SpawnObject(id=0xFFFF, wave=ent_extra, roll_index=roll_index, options=list(self.random_pool))
-            else:
-                try:
-                    ent_id = int(self.entity_id_var.get(), 0) & 0xFFFF
-                except Exception:
-                    self.status_var.set("Invalid entity id.")
-                    return
-                record = SpawnObject(id=ent_id, wave=ent_extra)
-            self.level.entities[(x, y)] = [record]
-        self._draw_grid()
+                self.status_var.set("Invalid entity id.")
+                return None
 
-    def _on_right_click(self, event):
-        cell = self._cell_from_event(event)
-        if not cell:
-            return
+            def paint_entity(x, y):
+                self.journal.set_entities(self.level, (x, y), [SpawnObject(id=ent_id, wave=ent_extra)])
+        return paint_entity
+
+    def _make_eraser(self):
+        if self.mode_var.get() == "tile":
+            def erase_tile(x, y):
+                self.journal.set_tile(self.level, x, y, 0)
+            return erase_tile
+
+        def erase_entity(x, y):
+            if (x, y) in self.level.entities:
+                self.journal.set_entities(self.level, (x, y), None)
+        return erase_entity
+
+    def _queue_redraw(self, cells):
+        """Mark cells dirty and redraw them all on the next idle tick, so a
+        burst of motion events costs one render."""
+        self._pending_cells.update(cells)
+        if self._redraw_job is None:
+            self._redraw_job = self.after_idle(self._flush_redraws)
+
+    def _flush_redraws(self):
+        self._redraw_job = None
+        cells, self._pending_cells = self._pending_cells, set()
+        self._redraw_cells(cells)
+
+    def _undo(self, _event=None):
+        self._replay(self.journal.undo, "Undo")
+
+    def _redo(self, _event=None):
+        self._replay(self.journal.redo, "Redo")
+
+    def _replay(self, step, label):
+        self._end_stroke()
         if self.preview_active:
             self._reset_preview(silent=True)
-        x, y = cell
-        if self.mode_var.get() == "tile":
-            self.level.tiles[y * 10 + x] = 0
-        else:
-            if (x, y) in self.level.entities:
-                del self.level.entities[(x, y)]
-        self._draw_grid()
+        cells = step(self.level)
+        if cells is None:
+            self.status_var.set(f"Nothing to {label.lower()}.")
+            return
+        self._queue_redraw(cells)
+        self.status_var.set(f"{label}: {len(cells)} cell(s).")
 
     def _pick_from_cell(self, event):
+        self._end_stroke()
         if self.mode_var.get() != "entity":
             return
         cell = self._cell_from_event(event)
@@ -905,8 +4171,40 @@ class LevelEditor(tk.Tk):
         self._on_spawn_type_change()
         self._refresh_pool_list()
 
-    def _update_status(self):
-        pass
+    def _instrument(self):
+        """Route the hot paths through the profiler: editor methods as
+        instance attributes, module functions by rebinding their globals
+        until the profiler is closed."""
+        for name in _PROFILED_METHODS:
+            setattr(self, name, self.profiler.wrap(name, getattr(self, name)))
+        self.profiler.wrap_globals(globals(), _PROFILED_FUNCTIONS)
+
+    def _profile_tick(self):
+        self._update_status(window=True)
+        self.after(_PROFILE_REFRESH_MS, self._profile_tick)
+
+    def _update_status(self, window=False):
+        """Refresh the profiling overlay. The stats window only advances on
+        the periodic tick, so redraw-triggered updates keep the last numbers."""
+        if self.profiler is None or not window:
+            return
+        icons = self.icon_cache_stats()
+        items = len(self.canvas.find_all()) + len(self.palette.find_all())
+        stats = self.profiler.window({"canvas_items": items, "icon_cache": icons})
+        frames = stats["frames"]
+        parts = []
+        if frames:
+            parts.append(f"frame {sum(frames) / len(frames) * 1e3:.1f}ms avg, {max(frames) * 1e3:.1f} max ({len(frames)})")
+        else:
+            parts.append("idle")
+        slowest = sorted(stats["calls"].items(), key=lambda item: item[1][1], reverse=True)[:2]
+        parts.extend(f"{name.lstrip('_')} {calls}x {total * 1e3:.1f}ms" for name, (calls, total, _worst) in slowest)
+        scaled = icons["scaled"]
+        lookups = scaled["hits"] + scaled["misses"]
+        hit_rate = f"{scaled['hits'] / lookups:.0%}" if lookups else "-"
+        parts.append(f"icons {hit_rate} hit, {scaled['misses']} miss, {icons['raw']['misses']} png")
+        parts.append(f"{items} items")
+        self.profile_var.set(" | ".join(parts))
 
     def _populate_sidebar_list(self):
         filter_text = self.sidebar_search_var.get().strip()
@@ -990,138 +4288,1567 @@ class LevelEditor(tk.Tk):
             self.pool_list.see(select_idx)
 
     def _roll_from_options(self, options, roll_value=None):
-        if not options:
-            return 0
-        total = sum(max(0, weight) for _pid, weight in options)
-        if total <= 0:
-            return options[0][0]
         if roll_value is None:
             roll_value = random.random()
-        if roll_value < 0.0:
-            roll_value = 0.0
-        if roll_value >= 1.0:
-            roll_value = 0.999999
-        target = roll_value * total
-        running = 0.0
-        for pid, weight in options:
-            running += max(0, weight)
-            if target < running:
-                return pid
-        return options[-1][0]
+        return roll_table(options).pick(roll_value)
+
+    def _roll_seed(self):
+        """The seed typed in the Seed box, or a fresh one if it is empty."""
+        text = self.roll_seed_var.get().strip()
+        if not text:
+            return new_roll_seed()
+        try:
+            return int(text, 0)
+        except ValueError:
+            return text  # random.Random accepts any str seed
 
     def _preview_randomization(self):
-        shared_rolls = {}
-        preview = {}
-        random_count = 0
-        for (x, y), ent_list in self.level.entities.items():
-            for idx, ent in enumerate(ent_list):
-                if not ent.is_random:
-                    continue
-                roll_index = ent.roll_index & 0xFF
-                roll_value = None
-                if roll_index != 0:
-                    if roll_index not in shared_rolls:
-                        shared_rolls[roll_index] = random.random()
-                    roll_value = shared_rolls[roll_index]
-                preview[(x, y, idx)] = self._roll_from_options(ent.options, roll_value=roll_value)
-                random_count += 1
+        seed = self._roll_seed()
+        preview = resolve_random_spawns(self.level.entities, seed)
         self.preview_map = preview
         self.preview_active = True
-        self._draw_grid()
-        self.status_var.set(f"Preview randomization: {random_count} random spawn(s) resolved.")
+        self._redraw_cells(self._random_cells())
+        self.status_var.set(f"Preview randomization: {len(preview)} random spawn(s) resolved (seed {seed}).")
 
     def _reset_preview(self, silent=False):
         self.preview_active = False
         self.preview_map = {}
-        self._draw_grid()
+        self._redraw_cells(self._random_cells())
         if not silent:
             self.status_var.set("Preview reset.")
 
+    def _simulate(self):
+        """Run simulate_spawns on a background thread and show the result as a heatmap."""
+        if self._simulation is not None:
+            return
+        try:
+            spawn_id = int(self.entity_id_var.get(), 0) & 0xFFFF
+        except ValueError:
+            spawn_id = None
+        # Snapshot the cell lists; the thread must not see edits made meanwhile.
+        entities = {cell: list(ent_list) for cell, ent_list in self.level.entities.items()}
+        spawns_path = self.spawns_path
+        seed = self._roll_seed()
+        result = {}
+
+        def work():
+            try:
+                values = spawn_values(spawns_path) if os.path.exists(spawns_path) else {}
+                result["values"] = values
+                result["sim"] = simulate_spawns(entities, values, runs=_SIM_RUNS, seed=seed)
+            except Exception as exc:
+                result["error"] = exc
+
+        thread = threading.Thread(target=work, name="spawn-simulation", daemon=True)
+        thread.start()
+        self._simulation = (thread, result, spawn_id)
+        self.status_var.set(f"Simulating {_SIM_RUNS} resolutions...")
+        self.after(100, self._poll_simulation)
+
+    def _poll_simulation(self):
+        thread, result, spawn_id = self._simulation
+        if thread.is_alive():
+            self.after(100, self._poll_simulation)
+            return
+        self._simulation = None
+        if "error" in result:
+            self.status_var.set(f"Simulation failed: {result['error']}")
+            return
+        sim = result["sim"]
+        if spawn_id is not None and not any(spawn_id in counts for counts in sim["cells"].values()):
+            spawn_id = None
+        self._heatmap = simulation_heat(sim, spawn_id, result["values"])
+        self._redraw_cells(list(self._cell_items))
+        value = sim["value"]
+        target = f"P({self.spawn_names.get(spawn_id, spawn_id)})" if spawn_id is not None else "relative value"
+        self.status_var.set(
+            f"Heatmap of {target} over {sim['runs']} runs: total value mean {value['mean']:.2f}, "
+            f"range {value['min']}..{value['max']} (seed {sim['seed']})."
+        )
+
+    def _clear_heatmap(self):
+        if self._heatmap is None:
+            return
+        self._heatmap = None
+        self._redraw_cells(list(self._cell_items))
+
     def _on_sidebar_search(self, _event):
+        # Filter once typing pauses rather than on every key.
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+        self._search_job = self.after(_SEARCH_DEBOUNCE_MS, self._run_sidebar_search)
+
+    def _run_sidebar_search(self):
+        self._search_job = None
         self._populate_sidebar_list()
 
     def _load_level(self, path):
-        lvl_data = load_level_file(path)
-        
-        if lvl_data["width"] != 10 or lvl_data["height"] != 10:
-            raise ValueError("This editor supports only 10x10 levels.")
-        
-        data = LevelData()
-        data.path = path
-        data.version = lvl_data["version"]
-        data.width = lvl_data["width"]
-        data.height = lvl_data["height"]
-        data.mode = lvl_data["mode"]
-        data.spawn_file = lvl_data.get("spawn_file", "spawns.gon") or "spawns.gon"
-        data.tiles_file = lvl_data.get("tiles_file", "tiles.gon") or "tiles.gon"
-        # Flip vertically to match editor origin (0,0 at bottom-left).
-        tiles = [0] * (data.width * data.height)
-        for y in range(data.height):
-            for x in range(data.width):
-                src_y = data.height - 1 - y
-                tiles[y * data.width + x] = lvl_data["tile_grid"][src_y * data.width + x]
-        data.tiles = tiles
-        data.original_tiles = list(tiles)
-        data.tail = lvl_data["tail"]
-        data.raw_prefix = lvl_data["data"][:lvl_data["tiles_start"]]
-        data.raw_tiles = lvl_data["raw_tiles"]
-        data.raw_spawns = lvl_data["raw_spawns"]
-
-        # Flip entities vertically to match editor origin (0,0 at bottom-left).
-        ent_map = {}
-        for x, y, spawn in lvl_data["entities"]:
-            ny = data.height - 1 - y
-            ent_map.setdefault((x, ny), []).append(spawn)
-        data.entities = ent_map
-        data.original_entities = []
-        return data
+        return load_level_data(path)
 
     def _save_level(self, path):
-        if len(self.level.tiles) != 100:
-            raise ValueError("Tile grid must be 10x10.")
-
-        # Flatten entities
-        entities = []
-        for (x, y) in sorted(self.level.entities.keys(), key=lambda p: (p[1], p[0])):
-            for ent in self.level.entities[(x, y)]:
-                ny = 10 - 1 - y
-                entities.append((x, ny, ent))
-
-        entity_count = len(entities)
-        if self.level.original_tiles == self.level.tiles and self.level.raw_tiles:
-            tile_bytes = self.level.raw_tiles
+        save_level(self.level, path)
+
+
+def _find_levels(paths, bundles=False):
+    """Expand files and directories into a sorted list of .lvl paths. With
+    bundles, .lvlpack files (given or found) expand to their member paths."""
+    found = []
+    for p in paths:
+        if os.path.isdir(p):
+            for root, _dirs, files in os.walk(p):
+                found.extend(os.path.join(root, f) for f in files if f.lower().endswith(".lvl"))
+                if bundles:
+                    found.extend(
+                        path for f in files if f.lower().endswith(_BUNDLE_EXT)
+                        for path in _bundle_members(os.path.join(root, f))
+                    )
+        elif bundles and p.lower().endswith(_BUNDLE_EXT):
+            found.extend(_bundle_members(p))
         else:
-            # Inverse of load transform: flip vertically back to file order.
-            tiles_out = [0] * 100
-            for y in range(10):
-                for x in range(10):
-                    src_y = 9 - y
-                    tiles_out[y * 10 + x] = self.level.tiles[src_y * 10 + x]
-            tile_bytes = struct.pack("<100H", *tiles_out)
-
-        chunks = []
-        for x, y, ent in entities:
-            ent_id = ent.id
-            wave = ent.wave & 0xFF
-            chunks.append(struct.pack("<hhHBB", x, y, ent_id, wave, 0))
-            if ent.is_random:
-                options = list(ent.options)
-                if len(options) > 255:
-                    raise ValueError("Random spawn has more than 255 options.")
-                chunks.append(struct.pack("<BB", len(options) & 0xFF, ent.roll_index & 0xFF))
-                for pid, weight in options:
-                    chunks.append(struct.pack("<HH", pid & 0xFFFF, weight & 0xFFFF))
-                    
-        entity_bytes = b"".join(chunks)
+            found.append(p)
+    return sorted(found)
+
+
+def _bundle_members(path):
+    bundle = open_bundle(path)
+    return [bundle.member_path(name) for name in bundle]
+
+
+def _time_call(fn, *args, repeat=1):
+    """Return the best-of-`repeat` wall time of fn(*args) in seconds."""
+    best = None
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        fn(*args)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_load(paths, repeat=20):
+    """Time load_level_file against the reference loader on each path."""
+    results = []
+    for path in paths:
+        new = load_level_file(path)
+        ref = _load_level_file_reference(path)
+        # The reference only knows layer 0; compare the keys it produces.
+        if {key: new[key] for key in ref} != ref:
+            raise AssertionError(f"{path}: decoder output differs from reference loader")
+        results.append({
+            "path": path,
+            "reference_s": _time_call(_load_level_file_reference, path, repeat=repeat),
+            "decoder_s": _time_call(load_level_file, path, repeat=repeat),
+        })
+    return results
+
+
+def bench_gon(paths, repeat=20):
+    """Time GonDocument against the reference line parser on each .gon path."""
+    results = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        if GonDocument(text).editor_defs() != _parse_gon_text_reference(text):
+            raise AssertionError(f"{path}: GonDocument output differs from reference parser")
+        results.append({
+            "path": path,
+            "reference_s": _time_call(_parse_gon_text_reference, text, repeat=repeat),
+            "decoder_s": _time_call(lambda t: GonDocument(t).editor_defs(), text, repeat=repeat),
+        })
+    return results
+
+
+def bench_icons(icons_dir, limit=8, repeat=3, tint_rgb=(255, 128, 0)):
+    """Time the per-pixel Tk color key + tint against the bulk pipeline on up to
+    `limit` icons. Needs a display; returns None when Tk cannot start."""
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        return None
+    root.withdraw()
+
+    def reference(path):
+        img = tk.PhotoImage(file=path)
+        _apply_color_key_reference(img)
+        return img, _tint_image_reference(img, tint_rgb)
+
+    def bulk(path):
+        w, h, rgba = png_read_rgba(path)
+        rgba_color_key(rgba)
+        return photo_from_pixels(w, h, rgba), tint_photo(None, tint_rgb, (w, h, rgba))
+
+    results = []
+    try:
+        names = sorted(n for n in os.listdir(icons_dir) if n.lower().endswith(".png"))[:limit]
+        for name in names:
+            path = os.path.join(icons_dir, name)
+            for ref_img, new_img in zip(reference(path), bulk(path)):
+                if photo_pixels(ref_img) != photo_pixels(new_img):
+                    raise AssertionError(f"{path}: bulk icon pipeline differs from per-pixel reference")
+            results.append({
+                "path": path,
+                "reference_s": _time_call(reference, path, repeat=repeat),
+                "decoder_s": _time_call(bulk, path, repeat=repeat),
+            })
+    finally:
+        root.destroy()
+    return results
+
+
+def _roll_from_options_reference(options, roll_value):
+    """The original linear-scan roll; kept for bench_rolls."""
+    if not options:
+        return 0
+    total = sum(max(0, weight) for _pid, weight in options)
+    if total <= 0:
+        return options[0][0]
+    if roll_value < 0.0:
+        roll_value = 0.0
+    if roll_value >= 1.0:
+        roll_value = 0.999999
+    target = roll_value * total
+    running = 0.0
+    for pid, weight in options:
+        running += max(0, weight)
+        if target < running:
+            return pid
+    return options[-1][0]
+
+
+def bench_rolls(paths, rolls=20000, repeat=3):
+    """Time the per-roll option scan against cached RollTables on the random
+    spawns of each level. Levels without random spawns are skipped."""
+    results = []
+    for path in paths:
+        pools = [ent.options for ents in load_level_data(path).entities.values() for ent in ents if ent.is_random]
+        if not pools:
+            continue
+        rng = random.Random(0)
+        draws = [(pools[i % len(pools)], rng.random()) for i in range(rolls)]
+        reference = [_roll_from_options_reference(options, u) for options, u in draws]
+        if [roll_table(options).pick(u) for options, u in draws] != reference:
+            raise AssertionError(f"{path}: RollTable picks differ from reference roll")
+        results.append({
+            "path": path,
+            "reference_s": _time_call(lambda: [_roll_from_options_reference(o, u) for o, u in draws], repeat=repeat),
+            "decoder_s": _time_call(lambda: [roll_table(o).pick(u) for o, u in draws], repeat=repeat),
+        })
+    return results
+
+
+def _print_bench(title, results):
+    ref_total = sum(r["reference_s"] for r in results)
+    new_total = sum(r["decoder_s"] for r in results)
+    print(f"{title}:")
+    for r in results:
+        print(f"{r['reference_s'] * 1e6:10.1f}us {r['decoder_s'] * 1e6:10.1f}us  {r['path']}")
+    speedup = ref_total / new_total if new_total else float("inf")
+    print(f"{len(results)} file(s): reference {ref_total * 1e3:.3f}ms, new {new_total * 1e3:.3f}ms ({speedup:.1f}x)")
+
+
+def _cmd_bench(args):
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    paths = _find_levels(args.paths or [base_dir])
+    if not paths:
+        print("No .lvl files found.", file=sys.stderr)
+        return 1
+    _print_bench("Level loader", bench_load(paths, repeat=args.repeat))
+    roll_results = bench_rolls(paths)
+    if roll_results:
+        _print_bench("Random spawn rolls", roll_results)
+    gon_paths = [p for p in (os.path.join(base_dir, "spawns.gon"), os.path.join(base_dir, "tiles.gon")) if os.path.exists(p)]
+    if gon_paths:
+        _print_bench("GON parser", bench_gon(gon_paths, repeat=args.repeat))
+    icons_dir = os.path.join(base_dir, "editor_icons")
+    if os.path.isdir(icons_dir):
+        icon_results = bench_icons(icons_dir)
+        if icon_results is None:
+            print("Icon pipeline: skipped (no display)")
+        else:
+            _print_bench("Icon pipeline (color key + tint)", icon_results)
+    return 0
+
+
+def synthetic_level(seed=0, width=10, height=10, layers=1, entities=20, random_tiles=0.1,
+                    random_entities=0.3, max_options=6, tail=b"\0\0\0\0"):
+    """Return random .lvl bytes: tiles and random tile pools on every layer,
+    fixed and random spawns (pools of up to max_options, at most 255) and
+    the given tail.
+
+    Records are laid out exactly as encode_level writes them, so a full
+    re-encode of the result must reproduce it byte for byte.
+    """
+    rng = random.Random(seed)
+    spawn_file, tiles_file = b"spawns.gon", b"tiles.gon"
+    camera = (rng.randrange(width), rng.randrange(height), width, height)
+    out = bytearray(_HEADER.pack(2, width, height, layers, entities, *camera))
+    out += _I32.pack(len(spawn_file)) + spawn_file + _I32.pack(len(tiles_file)) + tiles_file + bytes(8)
+
+    def pool():
+        options = [(rng.randrange(0x10000), rng.randrange(1, 1000)) for _ in range(rng.randint(1, max_options))]
+        return _POOL_HEAD.pack(len(options), rng.randrange(256)) + b"".join(_POOL_OPTION.pack(*o) for o in options)
+
+    for _layer in range(layers):
+        for _index in range(width * height):
+            if rng.random() < random_tiles:
+                out += _U16.pack(0xFFFF) + pool()
+            else:
+                out += _U16.pack(rng.randrange(0xFFFF))
+    cells = {}
+    for _ in range(entities):
+        cells.setdefault((rng.randrange(width), rng.randrange(height)), []).append(None)
+    # encode_level order: editor rows bottom-up, i.e. file rows top-down.
+    for x, y in sorted(cells, key=lambda cell: (-cell[1], cell[0])):
+        for _record in cells[(x, y)]:
+            if rng.random() < random_entities:
+                out += _SPAWN_HEAD.pack(x, y, 0xFFFF, rng.randrange(256), 0) + pool()
+            else:
+                out += _SPAWN_HEAD.pack(x, y, rng.randrange(0xFFFF), rng.randrange(256), 0)
+    return bytes(out + tail)
+
+
+def _level_fields(level):
+    """Everything a LevelData means, as plain values for comparison."""
+    return (
+        level.version, level.width, level.height, tuple(level.camera), level.spawn_file, level.tiles_file,
+        [layer.tolist() for layer in level.layers],
+        {key: (tile.roll_index, list(tile.options)) for key, tile in level.random_tiles.items()},
+        {cell: [(e.id, e.wave, e.roll_index, e.options) for e in ents] for cell, ents in level.entities.items()},
+        bytes(level.tail),
+    )
+
+
+# synthetic_level() options for the shapes the format round trip must survive.
+_SYNTHETIC_LEVELS = {
+    "small": dict(width=10, height=10),
+    "many_entities": dict(width=64, height=64, entities=20000, random_entities=0.5),
+    "random_tiles": dict(width=48, height=32, random_tiles=0.5),
+    "layers": dict(width=40, height=40, layers=4, random_tiles=0.05),
+    "long_tail": dict(tail=bytes(range(256)) * 4),
+    "pools_255": dict(entities=200, random_entities=1.0, random_tiles=0.2, max_options=255),
+    "empty": dict(width=1, height=1, entities=0, tail=b""),
+}
+
+
+def _force_full_encode(level):
+    """Make encode_level rebuild every section of level instead of reusing raw bytes."""
+    level.dirty_layers.update(range(len(level.layers)))
+    level.raw_prefix_key = level.raw_spawns_key = None
+    return level
+
+
+def _filled_level(width, height, defs, seed=0):
+    """A width x height level with a random def tile in every cell and a
+    spawn on about one cell in ten, for drawing benchmarks."""
+    rng = random.Random(seed)
+    level = LevelData(width, height)
+    tile_ids = sorted(defs["tiles"]) or [0]
+    spawn_ids = sorted(defs["spawns"]) or [0]
+    level.layers[0] = array("H", (rng.choice(tile_ids) for _ in range(width * height)))
+    for _ in range(width * height // 10):
+        level.entities[(rng.randrange(width), rng.randrange(height))] = [SpawnObject(id=rng.choice(spawn_ids))]
+    return level
+
+
+def check_bundle(bundle_path, levels_dir):
+    """Check a bundle packed from levels_dir: every member matches its file
+    byte for byte and decodes to the same level, digests verify, and
+    unpacking reproduces the files. Returns a list of failures."""
+    failures = []
+    with LevelBundle(bundle_path) as bundle:
+        if bundle.verify():
+            failures.append(f"digest mismatch: {', '.join(bundle.verify())}")
+        for name in bundle:
+            path = os.path.join(levels_dir, *name.split("/"))
+            with open(path, "rb") as f:
+                if bytes(bundle.data(name)) != f.read():
+                    failures.append(f"{name}: bundled bytes differ from the file")
+                    continue
+            if _level_fields(load_level_data(bundle.member_path(name))) != _level_fields(load_level_data(path)):
+                failures.append(f"{name}: decodes differently from the bundle")
+        with tempfile.TemporaryDirectory() as out:
+            bundle.unpack(out)
+            for name in bundle:
+                with open(os.path.join(out, *name.split("/")), "rb") as f:
+                    if f.read() != bytes(bundle.data(name)):
+                        failures.append(f"{name}: unpacked file differs")
+    close_bundle(bundle_path)  # the shared mapping the member loads opened
+    return failures
+
+
+def check_round_trip(path, exact_reencode=False):
+    """Return the failures (strings) of the round trips of one level file:
+    load -> encode -> same bytes, save_level -> same file, and a full
+    re-encode (no raw sections reused) -> the same level on reload, or with
+    exact_reencode the same bytes."""
+    failures = []
+    with open(path, "rb") as f:
+        original = f.read()
+    level = load_level_data(path)
+    if encode_level(level) != original:
+        failures.append(f"{path}: load -> encode changed the bytes")
+    with tempfile.TemporaryDirectory() as tmp:
+        copy = os.path.join(tmp, "copy.lvl")
+        save_level(level, copy)
+        with open(copy, "rb") as f:
+            if f.read() != original:
+                failures.append(f"{path}: save_level changed the bytes")
+        reencoded = encode_level(_force_full_encode(level))
+        if exact_reencode and reencoded != original:
+            failures.append(f"{path}: full re-encode changed the bytes")
+        with open(copy, "wb") as f:
+            f.write(reencoded)
+        if _level_fields(load_level_data(copy)) != _level_fields(load_level_data(path)):
+            failures.append(f"{path}: full re-encode changed the level")
+    return failures
+
+
+def fuzz_decode(data, cases=300, seed=0, time_limit=1.0):
+    """Decode truncated and corrupted copies of data. Clean rejections
+    (ValueError, struct.error) are fine; return any other exception, or a
+    decode slower than time_limit seconds, as failures."""
+    rng = random.Random(seed)
+    header_ints = [i * 4 for i in range(_HEADER.size // 4 + 1)]
+    failures = []
+    for case in range(cases):
+        mutated = bytearray(data)
+        kind = case % 3
+        if kind == 0:
+            mutated = mutated[:rng.randrange(len(mutated))]
+        elif kind == 1:
+            for _ in range(rng.randint(1, 8)):
+                mutated[rng.randrange(len(mutated))] = rng.randrange(256)
+        else:
+            for offset in rng.sample(header_ints, rng.randint(1, 3)):
+                value = rng.choice((-1, 0, 1, 0x7FFF, 0x7FFFFFFF, -0x80000000, rng.randrange(1 << 31)))
+                struct.pack_into("<i", mutated, offset, value)
+        t0 = time.perf_counter()
+        try:
+            decode_level(bytes(mutated))
+        except (ValueError, struct.error):
+            pass
+        except Exception as exc:
+            failures.append(f"case {case} ({('truncate', 'flip', 'header')[kind]}): {type(exc).__name__}: {exc}")
+        elapsed = time.perf_counter() - t0
+        if elapsed > time_limit:
+            failures.append(f"case {case}: decode took {elapsed:.2f}s")
+    return failures
+
+
+_GON_EDIT_SNIPPETS = ("{", "}", "[", "]", '"', "\n", " ", "7", "// note\n", ' name "X" ', "\n12 { editor { name \"Y\" } }\n")
+
+
+def check_gon_edits(text, cases=200, seed=0):
+    """Apply random edits to a .gon text in a chain and check that
+    GonDocument.edited() agrees with a full scan on the blocks, editor
+    fields and changed ids. Returns the disagreements as failures."""
+    rng = random.Random(seed)
+    doc = GonDocument(text)
+    failures = []
+    for case in range(cases):
+        if doc.blocks and rng.random() < 0.5:
+            start, end, _children = doc.blocks[rng.choice(list(doc.blocks))]
+            a = rng.randint(start, end)
+        else:
+            a = rng.randint(0, len(doc.text))
+        b = min(len(doc.text), a + rng.randint(0, 40))
+        new_text = doc.text[:a] + "".join(rng.choice(_GON_EDIT_SNIPPETS) for _ in range(rng.randint(0, 3))) + doc.text[b:]
+        got, changed = doc.edited(new_text)
+        full, expected = doc._rescanned(new_text)
+        if got.blocks != full.blocks or got.editor_defs() != full.editor_defs() or changed != expected:
+            failures.append(f"case {case}: edit at {a}..{b} differs from a full scan")
+        doc = GonDocument(text) if rng.random() < 0.3 else got
+    return failures
+
+
+class _StubImage:
+    def __init__(self, size):
+        self.size = size
+
+    def width(self):
+        return self.size
+
+    def height(self):
+        return self.size
+
+
+class _StubCanvas:
+    """The part of tk.Canvas the grid drawing uses, keeping items in a dict,
+    so _draw_grid can be timed without a display."""
+
+    def __init__(self, width=800, height=600):
+        self.width, self.height = width, height
+        self.items = {}
+        self.tags = {}
+        self._next = 0
+
+    def _create(self, coords, options):
+        self._next += 1
+        self.items[self._next] = [coords, options]
+        for tag in options.get("tags", ()):
+            self.tags.setdefault(tag, set()).add(self._next)
+        return self._next
+
+    def create_rectangle(self, *coords, **options):
+        return self._create(coords, options)
+
+    create_image = create_text = create_rectangle
+
+    def coords(self, item, *coords):
+        self.items[item][0] = coords
+
+    def itemconfigure(self, item, **options):
+        self.items[item][1].update(options)
+
+    def delete(self, tag):
+        if tag == "all":
+            self.items.clear()
+            self.tags.clear()
+            return
+        for item in self.tags.pop(tag, ()):
+            self.items.pop(item, None)
+
+    def tag_raise(self, tag):
+        pass
+
+    def canvasx(self, x):
+        return x
+
+    canvasy = canvasx
+
+    def winfo_ismapped(self):
+        return True
+
+    def winfo_width(self):
+        return self.width
+
+    def winfo_height(self):
+        return self.height
+
+    def cget(self, option):
+        return {"width": self.width, "height": self.height}[option]
+
+    def configure(self, **options):
+        pass
+
+
+class _HeadlessEditor:
+    """LevelEditor's drawing methods on a _StubCanvas, with stub icons."""
+
+    def __init__(self, level, tile_defs, spawn_defs):
+        self.canvas = _StubCanvas()
+        self.level = level
+        self.tile_defs = tile_defs
+        self.spawn_defs = spawn_defs
+        self.spawn_names = {k: v.get("name", str(k)) for k, v in spawn_defs.items()}
+        self.cell_size = 32
+        self.grid_origin = (10, 10)
+        self.preview_active = False
+        self.preview_map = {}
+        self._cell_items = {}
+        self._viewport = None
+        self._viewport_job = None
+        self._pending_cells = set()
+        self._redraw_job = None
+        self._heatmap = None
+
+    def _get_icon(self, stem, tint_str=None, size=None):
+        return _StubImage(size or self.cell_size)
+
+    def _update_status(self):
+        pass
+
+    # The grid drawing path, borrowed one by one: a LevelEditor method it
+    # starts calling that is not listed fails loudly in selftest.
+    _draw_grid = LevelEditor._draw_grid
+    _fit_cell_size = LevelEditor._fit_cell_size
+    _snap_cell_size = LevelEditor._snap_cell_size
+    _update_viewport = LevelEditor._update_viewport
+    _visible_bounds = LevelEditor._visible_bounds
+    _render_cell = LevelEditor._render_cell
+    _render_cell_heat = LevelEditor._render_cell_heat
+    _place_cell_images = LevelEditor._place_cell_images
+    _restack = LevelEditor._restack
+    _cell_coords = LevelEditor._cell_coords
+    _cell_tag = LevelEditor._cell_tag
+    _cell_entity_view = LevelEditor._cell_entity_view
+    _icon_draw_pos = LevelEditor._icon_draw_pos
+    _icon_stems_for_tile = LevelEditor._icon_stems_for_tile
+    _icon_stems_for_entity = LevelEditor._icon_stems_for_entity
+
+
+_FUZZ_MAX_BYTES = 64 << 10  # bigger files only make each fuzz case slower
+
+
+def run_selftest(paths, base_dir, repeat=5, fuzz_cases=300, seed=0):
+    """Round-trip, fuzz and time the format code, GON parser, icon pipeline
+    and grid drawing. Returns a JSON-ready dict; "ok" is False if any check failed."""
+    checks = {}
+
+    def record(name, failures, cases):
+        check = checks.setdefault(name, {"passed": 0, "failed": 0, "failures": []})
+        check["failed"] += len(failures)
+        check["passed"] += cases - len(failures)
+        check["failures"].extend(failures[:10 - len(check["failures"])])
+
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        synthetic_paths = []
+        for name, options in _SYNTHETIC_LEVELS.items():
+            path = os.path.join(tmp, f"{name}.lvl")
+            with open(path, "wb") as f:
+                f.write(synthetic_level(seed=seed, **options))
+            synthetic_paths.append(path)
+            failures = check_round_trip(path, exact_reencode=True)
+            record("synthetic_round_trip", [f.replace(path, name) for f in failures], 1)
+        for path in paths:
+            record("round_trip", check_round_trip(path), 1)
+        bundle_path = os.path.join(tmp, "levels" + _BUNDLE_EXT)
+        pack_levels(tmp, bundle_path)
+        record("bundle", check_bundle(bundle_path, tmp), len(synthetic_paths))
+        for i, path in enumerate(paths + synthetic_paths):
+            with open(path, "rb") as f:
+                data = f.read()
+            if len(data) <= _FUZZ_MAX_BYTES:
+                record("fuzz", fuzz_decode(data, cases=fuzz_cases, seed=seed + i), fuzz_cases)
+
+        def per_file(fn, files):
+            return sum(_time_call(fn, p, repeat=repeat) for p in files) * 1e3
+
+        loaded = {p: load_level_data(p) for p in paths + synthetic_paths}
+        timings["level.load"] = per_file(load_level_data, paths)
+        timings["level.encode"] = per_file(lambda p: encode_level(loaded[p]), paths)
+        big = os.path.join(tmp, "many_entities.lvl")
+        timings["synthetic.load"] = per_file(load_level_data, [big])
+        full = _force_full_encode(load_level_data(big))
+        timings["synthetic.encode_full"] = _time_call(encode_level_parts, full, repeat=repeat) * 1e3
+        timings["synthetic.save"] = per_file(lambda p: save_level(loaded[p], os.path.join(tmp, "save.lvl")), [big])
+        bundle = open_bundle(bundle_path)
+        timings["bundle.load_all"] = _time_call(
+            lambda: [load_level_data(bundle.member_path(name)) for name in bundle], repeat=repeat) * 1e3
+        timings["loose.load_all"] = _time_call(lambda: [load_level_data(p) for p in synthetic_paths], repeat=repeat) * 1e3
+        close_bundle(bundle_path)  # unmap before the directory is removed
+
+    for stem in ("spawns", "tiles"):
+        gon_path = os.path.join(base_dir, f"{stem}.gon")
+        if os.path.exists(gon_path):
+            with open(gon_path, "r", encoding="utf-8") as f:
+                text = f.read()
+            timings[f"gon.{stem}"] = _time_call(lambda t: GonDocument(t).editor_defs(), text, repeat=repeat) * 1e3
+            record("gon_edits", check_gon_edits(text, seed=seed), 200)
+            doc = GonDocument(text)
+            if doc.blocks:
+                start, end, _children = doc.blocks[sorted(doc.blocks)[len(doc.blocks) // 2]]
+                edited = text[:start] + " " + text[start:]
+                timings[f"gon.{stem}_edit"] = _time_call(doc.edited, edited, repeat=repeat) * 1e3
+
+    icons_dir = os.path.join(base_dir, "editor_icons")
+    if os.path.isdir(icons_dir):
+        icon_paths = [os.path.join(icons_dir, n) for n in sorted(os.listdir(icons_dir)) if n.lower().endswith(".png")][:16]
+        decoded = [png_read_rgba(p) for p in icon_paths]
+        timings["icons.png_decode"] = sum(_time_call(png_read_rgba, p, repeat=repeat) for p in icon_paths) * 1e3
+        timings["icons.color_key"] = _time_call(
+            lambda: [rgba_color_key(bytearray(rgba)) for _w, _h, rgba in decoded], repeat=repeat) * 1e3
+        timings["icons.tint"] = _time_call(
+            lambda: [rgba_tint(rgba, (255, 128, 0)) for _w, _h, rgba in decoded], repeat=repeat) * 1e3
+
+    defs = load_defs(os.path.join(base_dir, "tiles.gon"), os.path.join(base_dir, "spawns.gon"))
+    draw_level = load_level_data(paths[0]) if paths else LevelData()
+    for name, level in (("level", draw_level), ("256x256", _filled_level(256, 256, defs, seed))):
+        editor = _HeadlessEditor(level, defs["tiles"], defs["spawns"])
+        timings[f"draw_grid.{name}"] = _time_call(editor._draw_grid, repeat=repeat) * 1e3
+    if os.path.isdir(icons_dir):
+        timings["thumbnail.level"] = _time_call(
+            render_level_rgba, draw_level, defs["tiles"], defs["spawns"], icons_dir, repeat=repeat) * 1e3
+
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "levels": len(paths),
+        "ok": not any(check["failed"] for check in checks.values()),
+        "checks": checks,
+        "timings_ms": {name: round(ms, 4) for name, ms in timings.items()},
+    }
+
+
+def _cmd_selftest(args):
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    paths = _find_levels(args.paths or [base_dir])
+    result = run_selftest(paths, base_dir, repeat=args.repeat, fuzz_cases=args.fuzz, seed=args.seed)
+    if args.json:
+        # One JSON object per line, so runs can be appended and compared over time.
+        with open(args.json, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result, sort_keys=True) + "\n")
+    for name, check in sorted(result["checks"].items()):
+        print(f"{name}: {check['passed']} passed, {check['failed']} failed")
+        for failure in check["failures"]:
+            print(f"  {failure}")
+    for name, ms in sorted(result["timings_ms"].items()):
+        print(f"{ms:12.3f}ms  {name}")
+    return 0 if result["ok"] else 1
+
+
+_BATCH_DEFS = {}  # (tiles_path, spawns_path) -> defs, per worker process
+
+
+def _batch_def_paths(level_path, level):
+    """The (tiles_path, spawns_path) a level's defs resolve to."""
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    level_dir = os.path.dirname(level_path)
+    return (
+        resolve_def_path(level_dir, level.tiles_file, base_dir),
+        resolve_def_path(level_dir, level.spawn_file, base_dir),
+    )
+
+
+def _batch_defs(level_path, level):
+    key = _batch_def_paths(level_path, level)
+    if key not in _BATCH_DEFS:
+        _BATCH_DEFS[key] = load_defs(*key)
+    return _BATCH_DEFS[key]
+
+
+def batch_process_level(path, write=True):
+    """Load, validate and normalize one level without Tk; return a report dict.
+
+    Saving from the editor reuses the sections it did not touch, so here
+    every section is re-encoded instead (_force_full_encode). The report
+    names the sections that came out different ("header", "layer N",
+    "spawns", "tail"), and with write the file is replaced by the result.
+    """
+    report = {"path": path, "ok": False, "changed": False, "changed_sections": [], "written": False,
+              "errors": [], "warnings": []}
+    timing = report["timing_ms"] = {}
+    t_start = time.perf_counter()
+    try:
+        t0 = time.perf_counter()
+        level = load_level_data(path)
+        timing["load"] = (time.perf_counter() - t0) * 1e3
+
+        t0 = time.perf_counter()
+        defs = _batch_defs(path, level)
+        timing["defs"] = (time.perf_counter() - t0) * 1e3
+
+        t0 = time.perf_counter()
+        errors, warnings = validate_level(level, defs["tiles"], defs["spawns"])
+        report["errors"].extend(errors)
+        report["warnings"].extend(warnings)
+        timing["validate"] = (time.perf_counter() - t0) * 1e3
+
+        if not errors:
+            t0 = time.perf_counter()
+            names = ["header", *(f"layer {i}" for i in range(len(level.layers))), "spawns", "tail"]
+            loaded = encode_level_parts(level)  # the file's own sections
+            rebuilt = encode_level_parts(_force_full_encode(level))
+            report["changed_sections"] = [
+                name for name, old, new in zip(names, loaded, rebuilt) if bytes(old) != bytes(new)
+            ]
+            report["changed"] = bool(report["changed_sections"])
+            if write and report["changed"]:
+                _atomic_write(path, rebuilt, durable=True)
+                report["written"] = True
+            timing["save"] = (time.perf_counter() - t0) * 1e3
+        report["ok"] = not report["errors"]
+    except Exception as exc:
+        report["errors"].append(f"{type(exc).__name__}: {exc}")
+    timing["total"] = (time.perf_counter() - t_start) * 1e3
+    return report
+
+
+def _batch_worker(args):
+    path, write = args
+    return batch_process_level(path, write=write)
+
+
+def run_batch(mod_dir, jobs=None, write=True):
+    """Round-trip every level under <mod_dir>/levels across a process pool."""
+    levels_dir = os.path.join(mod_dir, "levels")
+    if not os.path.isdir(levels_dir):
+        raise FileNotFoundError(f"No levels/ directory in {mod_dir}")
+    paths = _find_levels([levels_dir])
+    t0 = time.perf_counter()
+    work = [(p, write) for p in paths]
+    if jobs == 1 or len(paths) <= 1:
+        files = [_batch_worker(w) for w in work]
+    else:
+        workers = jobs or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            files = list(pool.map(_batch_worker, work, chunksize=max(1, len(work) // (4 * workers))))
+    for r in files:
+        r["path"] = os.path.relpath(r["path"], mod_dir)
+    return {
+        "mod_dir": os.path.abspath(mod_dir),
+        "write": write,
+        "summary": {
+            "files": len(files),
+            "ok": sum(1 for r in files if r["ok"]),
+            "failed": sum(1 for r in files if not r["ok"]),
+            "changed": sum(1 for r in files if r["changed"]),
+            "written": sum(1 for r in files if r["written"]),
+            "warnings": sum(len(r["warnings"]) for r in files),
+            "wall_ms": (time.perf_counter() - t0) * 1e3,
+        },
+        "files": files,
+    }
+
+
+def _cmd_batch(args):
+    try:
+        report = run_batch(args.mod_dir, jobs=args.jobs, write=not args.check)
+    except FileNotFoundError as exc:
+        print(exc, file=sys.stderr)
+        return 2
+    text = json.dumps(report, indent=2)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0 if report["summary"]["failed"] == 0 else 1
+
+
+# Headless thumbnails: levels composited from editor_icons in pure Python,
+# cached by content so unchanged rooms are never rendered twice.
+_THUMB_VERSION = 1
+_THUMB_BG = bytes((229, 231, 235, 255))      # the canvas cell fill, #e5e7eb
+_THUMB_GRID = bytes((203, 213, 225, 255))    # the canvas cell outline, #cbd5e1
+_THUMB_MARKER = bytes((245, 158, 11, 255))   # stands in for an entity label when it has no icon
+
+_THUMB_KEYED = {}    # (icons_dir, stem) -> (w, h, color-keyed RGBA) or None, per process
+_THUMB_SPRITES = {}  # (icons_dir, stem, tint_key, size) -> sprite or None, per process
+_THUMB_DEF_DIGESTS = {}  # (tiles_path, spawns_path) -> _thumb_defs_digest(), per process
+
+
+def _thumb_sprite(icons_dir, stem, tint_key, size):
+    """Return an icon baked like the atlas (color key, subsample, tint) as
+    (w, h, rows, band) for compositing, or None. Each row is (kind, pixels,
+    mask): kind 0 is fully transparent, 1 fully opaque, 2 mixed, with pixels
+    pre-masked so a row blits as (dst & ~mask) | pixels. band is (top,
+    bottom, pixels, keep) for the visible rows as single ints, so an
+    unclipped sprite blits in one operation. Tints that need Tk to resolve
+    are drawn untinted."""
+    key = (icons_dir, stem, tint_key, size)
+    if key in _THUMB_SPRITES:
+        return _THUMB_SPRITES[key]
+    keyed = _THUMB_KEYED.get((icons_dir, stem), _NOT_CACHED)
+    if keyed is _NOT_CACHED:
+        try:
+            w, h, rgba = png_read_rgba(os.path.join(icons_dir, f"{stem}.png"))
+        except (OSError, ValueError, zlib.error):
+            keyed = None
+        else:
+            keyed = (w, h, rgba_color_key(rgba))
+        _THUMB_KEYED[(icons_dir, stem)] = keyed
+    sprite = None
+    if keyed is not None:
+        w, h, rgba = rgba_subsample(*keyed, max(1, _ICON_SIZE // size))
+        tint_rgb = parse_tint_rgb(tint_key) if tint_key else None
+        if tint_rgb:
+            rgba = rgba_tint(rgba, tint_rgb)
+        alpha = rgba[3::4].translate(_VISIBLE_TO_OPAQUE)
+        mask = bytearray(len(rgba))
+        for ch in range(4):
+            mask[ch::4] = alpha
+        stride = w * 4
+        rows = []
+        for y in range(h):
+            row_mask = bytes(mask[y * stride:(y + 1) * stride])
+            if not any(row_mask):
+                rows.append((0, b"", b""))
+            elif row_mask.count(255) == stride:
+                rows.append((1, bytes(rgba[y * stride:(y + 1) * stride]), row_mask))
+            else:
+                pixels = int.from_bytes(rgba[y * stride:(y + 1) * stride], "big") & int.from_bytes(row_mask, "big")
+                rows.append((2, pixels.to_bytes(stride, "big"), row_mask))
+        visible = [y for y, row in enumerate(rows) if row[0]]
+        band = None
+        if visible:
+            top, bottom = visible[0], visible[-1] + 1
+            band_mask = int.from_bytes(mask[top * stride:bottom * stride], "big")
+            band_pixels = int.from_bytes(rgba[top * stride:bottom * stride], "big") & band_mask
+            band = (top, bottom, band_pixels, ~band_mask)
+        sprite = (w, h, rows, band)
+    _THUMB_SPRITES[key] = sprite
+    return sprite
+
+
+def _blit(canvas, width, height, x0, y0, sprite):
+    """Composite sprite onto the RGBA canvas with its top-left at (x0, y0), clipped."""
+    w, h, rows, band = sprite
+    if band is None:
+        return
+    top, bottom, band_pixels, keep = band
+    if x0 >= 0 and x0 + w <= width and y0 + top >= 0 and y0 + bottom <= height:
+        stride, step = w * 4, width * 4
+        starts = range(((y0 + top) * width + x0) * 4, ((y0 + bottom) * width + x0) * 4, step)
+        dst = int.from_bytes(b"".join([canvas[start:start + stride] for start in starts]), "big")
+        out = memoryview(((dst & keep) | band_pixels).to_bytes(len(starts) * stride, "big"))
+        for i, start in enumerate(starts):
+            canvas[start:start + stride] = out[i * stride:(i + 1) * stride]
+        return
+    a, b = max(0, -x0), min(w, width - x0)
+    if a >= b:
+        return
+    for y, (kind, pixels, mask) in enumerate(rows):
+        py = y0 + y
+        if kind == 0 or not 0 <= py < height:
+            continue
+        start = (py * width + x0 + a) * 4
+        end = start + (b - a) * 4
+        if kind == 1 and a == 0 and b == w:
+            canvas[start:end] = pixels
+            continue
+        src = int.from_bytes(pixels[a * 4:b * 4], "big")
+        m = int.from_bytes(mask[a * 4:b * 4], "big")
+        dst = int.from_bytes(canvas[start:end], "big")
+        canvas[start:end] = ((dst & ~m) | src).to_bytes(end - start, "big")
+
+
+def render_level_rgba(level, tile_defs, spawn_defs, icons_dir, cell=16):
+    """Draw level like the editor canvas (layer 0 tiles, then the first
+    entity of each cell; random spawns show their first option) without Tk.
+    Returns (width, height, RGBA bytearray)."""
+    cols, rows = level.width, level.height
+    width, height = cols * cell, rows * cell
+    grid_row = _THUMB_GRID * width
+    cell_row = (_THUMB_GRID + _THUMB_BG * (cell - 1)) * cols
+    canvas = bytearray((grid_row + cell_row * (cell - 1)) * rows)
+
+    def draw(pairs, x, y):
+        drawn = False
+        for stem, tint in pairs:
+            sprite = _thumb_sprite(icons_dir, stem, _tint_key(tint), cell)
+            if sprite is not None:
+                _blit(canvas, width, height, x * cell + (cell - sprite[0]) // 2, y * cell + (cell - sprite[1]) // 2, sprite)
+                drawn = True
+        return drawn
+
+    for y in range(rows):
+        for x in range(cols):
+            tile_id = level.tile_at(x, y)
+            if tile_id:
+                draw(icon_pairs(tile_defs.get(tile_id, {}), str(tile_id)), x, y)
+    marker = max(2, cell // 2)
+    marker_rows = [(1, _THUMB_MARKER * marker, b"\xff" * (marker * 4))] * marker
+    marker_sprite = (marker, marker, marker_rows, (0, marker, int.from_bytes(b"".join(r[1] for r in marker_rows), "big"), 0))
+    for (x, y), ent_list in level.entities.items():
+        if not ent_list or not (0 <= x < cols and 0 <= y < rows):
+            continue
+        ent = ent_list[0]
+        spawn_id = (ent.options[0][0] if ent.options else 0) if ent.is_random else ent.id
+        if not draw(icon_pairs(spawn_defs.get(spawn_id, {})), x, y):
+            _blit(canvas, width, height, x * cell + (cell - marker) // 2, y * cell + (cell - marker) // 2, marker_sprite)
+    return width, height, canvas
+
+
+def _thumb_defs_digest(def_paths, defs):
+    """Hash of what thumbnails use from the load_defs() result for def_paths
+    (see _batch_defs()): each id's icon pairs."""
+    digest = _THUMB_DEF_DIGESTS.get(def_paths)
+    if digest is None:
+        icons = [
+            (kind, def_id, icon_pairs(data, str(def_id) if kind == "tiles" else None))
+            for kind in ("tiles", "spawns") for def_id, data in sorted(defs[kind].items())
+        ]
+        # repr, not marshal: marshal output depends on object identity, so
+        # equal defs parsed fresh and read from the defs cache hash differently.
+        text = repr(icons).encode("utf-8")
+        digest = _THUMB_DEF_DIGESTS[def_paths] = hashlib.blake2b(text, digest_size=16).hexdigest()
+    return digest
+
+
+def render_thumbnail(path, icons_dir, icons_signature, cell=16):
+    """Render one level to the thumbnail cache unless an entry already exists
+    for the same level bytes, def icons, icon files and cell size. Returns a
+    report dict with the cached PNG path."""
+    report = {"path": path, "png": None, "cached": False, "error": None}
+    t0 = time.perf_counter()
+    try:
+        level = load_level_data(path)
+        defs = _batch_defs(path, level)
+        key = hashlib.blake2b(
+            f"{_THUMB_VERSION}\0{cell}\0{level_digest(path).hex()}\0{_thumb_defs_digest(_batch_def_paths(path, level), defs)}\0{icons_signature}".encode("utf-8"),
+            digest_size=16,
+        ).hexdigest()
+        png_path = os.path.join(_cache_dir("thumbs", key[:2]), f"{key}.png")
+        if os.path.exists(png_path):
+            report["cached"] = True
+        else:
+            width, height, rgba = render_level_rgba(level, defs["tiles"], defs["spawns"], icons_dir, cell)
+            _atomic_write(png_path, png_encode_rgba(width, height, rgba))
+        report["png"] = png_path
+    except Exception as exc:
+        report["error"] = f"{type(exc).__name__}: {exc}"
+    report["ms"] = (time.perf_counter() - t0) * 1e3
+    return report
+
+
+def _thumb_worker(args):
+    return render_thumbnail(*args)
+
+
+def build_thumbnails(paths, icons_dir, cell=16, jobs=None):
+    """Render thumbnails for paths (loose levels or bundle members) across a
+    process pool; returns the per-level reports in path order."""
+    signature = _icons_signature(icons_dir)
+    work = [(p, icons_dir, signature, cell) for p in paths]
+    if jobs == 1 or len(work) <= 1:
+        return [_thumb_worker(w) for w in work]
+    workers = jobs or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_thumb_worker, work, chunksize=max(1, len(work) // (4 * workers))))
+
+
+def write_contact_sheet(reports, out_dir, root):
+    """Copy the rendered thumbnails under out_dir (named after each level's
+    path relative to root) and write an index.html showing them all."""
+    figures = []
+    for report in reports:
+        name = os.path.relpath(report["path"], root).replace(os.sep, "/")
+        if report["png"] is None:
+            figures.append(f'<figure class="error"><figcaption>{html.escape(name)}<br>{html.escape(report["error"])}</figcaption></figure>')
+            continue
+        rel = os.path.splitext(name)[0] + ".png"
+        target = os.path.join(out_dir, *rel.split("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(report["png"], "rb") as f:
+            _atomic_write(target, f.read())
+        figures.append(
+            f'<figure><img src="{html.escape(rel)}" loading="lazy"><figcaption>{html.escape(name)}</figcaption></figure>'
+        )
+    page = (
+        "<!doctype html><meta charset=\"utf-8\"><title>Levels</title>\n"
+        "<style>body{font:13px sans-serif;display:flex;flex-wrap:wrap;gap:12px}"
+        "figure{margin:0;max-width:320px}img{max-width:320px;image-rendering:pixelated}"
+        ".error{color:#b91c1c}</style>\n"
+        + "\n".join(figures) + "\n"
+    )
+    _atomic_write(os.path.join(out_dir, "index.html"), page.encode("utf-8"))
+
+
+def _cmd_thumbs(args):
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    paths = _find_levels(args.paths, bundles=True)
+    if not paths:
+        print("No levels found", file=sys.stderr)
+        return 2
+    icons_dir = args.icons or os.path.join(base_dir, "editor_icons")
+    t0 = time.perf_counter()
+    reports = build_thumbnails(paths, icons_dir, cell=args.cell, jobs=args.jobs)
+    wall_ms = (time.perf_counter() - t0) * 1e3
+    if args.out:
+        root = args.paths[0] if len(args.paths) == 1 and os.path.isdir(args.paths[0]) else os.path.commonpath(
+            [os.path.dirname(os.path.abspath(p)) for p in paths])
+        write_contact_sheet(reports, args.out, root)
+    failed = [r for r in reports if r["error"]]
+    for report in failed:
+        print(f"{report['path']}: {report['error']}", file=sys.stderr)
+    if args.out is None:
+        for report in reports:
+            if report["png"]:
+                print(f"{report['png']}  {report['path']}")
+    cached = sum(1 for r in reports if r["cached"])
+    print(f"{len(reports)} level(s): {len(reports) - cached - len(failed)} rendered, {cached} cached, "
+          f"{len(failed)} failed in {wall_ms:.0f}ms", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def _cmd_pack(args):
+    source = args.source
+    levels_dir = os.path.join(source, "levels")
+    if not os.path.isdir(levels_dir):
+        levels_dir = source
+    if not os.path.isdir(levels_dir):
+        print(f"No levels/ directory in {source}", file=sys.stderr)
+        return 2
+    out = args.output or os.path.join(os.path.dirname(os.path.abspath(levels_dir)), "levels" + _BUNDLE_EXT)
+    t0 = time.perf_counter()
+    count = pack_levels(levels_dir, out)
+    print(f"Packed {count} level(s) into {out} ({os.path.getsize(out)} bytes) in {(time.perf_counter() - t0) * 1e3:.1f}ms")
+    return 0
+
+
+def _cmd_unpack(args):
+    try:
+        bundle = LevelBundle(args.bundle)
+    except (OSError, ValueError) as exc:
+        print(exc, file=sys.stderr)
+        return 2
+    with bundle:
+        if args.list:
+            for name in bundle:
+                offset, length, digest = bundle.entries[name]
+                print(f"{digest.hex()} {length:9d} {name}")
+            return 0
+        bad = bundle.verify()
+        for name in bad:
+            print(f"{name}: data does not match its digest", file=sys.stderr)
+        if bad or args.verify:
+            if not bad:
+                print(f"{len(bundle)} level(s) OK")
+            return 1 if bad else 0
+        out = args.output or os.path.splitext(args.bundle)[0]
+        count = bundle.unpack(out)
+        print(f"Unpacked {count} level(s) into {out}")
+        return 0
+
+
+# Spawn categories 2..99 are enemies in spawns.gon (1 is player spawns,
+# 105+ pickups and inanimate objects).
+_ENEMY_CATEGORIES = range(2, 100)
+
+_CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS levels (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mod_dir TEXT NOT NULL,
+    mod_title TEXT,
+    area TEXT,
+    difficulty TEXT,
+    name TEXT,
+    mtime_ns INTEGER,
+    size INTEGER,
+    hash BLOB,
+    spawn_file TEXT,
+    spawns_hash BLOB,
+    width INTEGER,
+    height INTEGER,
+    layers INTEGER,
+    spawns INTEGER,
+    enemies REAL,
+    random_spawns INTEGER,
+    value REAL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS level_spawns (
+    level_id INTEGER NOT NULL REFERENCES levels(id) ON DELETE CASCADE,
+    spawn_id INTEGER NOT NULL,
+    wave INTEGER NOT NULL,
+    fixed INTEGER NOT NULL,
+    expected REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS level_tiles (
+    level_id INTEGER NOT NULL REFERENCES levels(id) ON DELETE CASCADE,
+    tile_id INTEGER NOT NULL,
+    cells INTEGER NOT NULL,
+    pooled INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS spawn_names (
+    spawn_id INTEGER PRIMARY KEY,
+    name TEXT,
+    category INTEGER
+);
+CREATE INDEX IF NOT EXISTS level_spawns_by_id ON level_spawns(spawn_id);
+CREATE INDEX IF NOT EXISTS level_spawns_by_level ON level_spawns(level_id);
+CREATE INDEX IF NOT EXISTS level_tiles_by_id ON level_tiles(tile_id);
+CREATE INDEX IF NOT EXISTS level_tiles_by_level ON level_tiles(level_id);
+"""
+
+
+def _def_digest(path, cache):
+    """Digest of a def file's bytes (None if it can't be read), memoized in cache."""
+    if path not in cache:
+        try:
+            with open(path, "rb") as f:
+                cache[path] = hashlib.blake2b(f.read(), digest_size=16).digest()
+        except OSError:
+            cache[path] = None
+    return cache[path]
+
+
+def catalog_path():
+    return os.path.join(_cache_dir(), "catalog.sqlite3")
+
+
+def catalog_facts(path, spawn_defs, values):
+    """Per-level facts for the catalog: size, spawn and tile counts, expected
+    enemies and total `value`. Random pools count by probability (weight
+    share), so a pool of Rat 1 / Fly 3 adds 0.25 Rat and 0.75 Fly."""
+    level = load_level_data(path)
+    spawns = {}  # (spawn_id, wave) -> [fixed, expected]
+    random_spawns = 0
+    for ent_list in level.entities.values():
+        for ent in ent_list:
+            if not ent.is_random:
+                spawns.setdefault((ent.id, ent.wave), [0, 0.0])[0] += 1
+                continue
+            random_spawns += 1
+            total = sum(max(0, weight) for _pid, weight in ent.options)
+            for pid, weight in ent.options:
+                if total > 0 and weight > 0:
+                    spawns.setdefault((pid, ent.wave), [0, 0.0])[1] += weight / total
+    tiles = {}  # tile_id -> [cells, pooled]
+    for layer in level.layers:
+        for tile_id in set(layer):
+            if tile_id != 0xFFFF:
+                tiles.setdefault(tile_id, [0, 0])[0] += layer.count(tile_id)
+    for tile in level.random_tiles.values():
+        for tile_id, _weight in tile.options:
+            tiles.setdefault(tile_id, [0, 0])[1] += 1
+
+    def category(spawn_id):
+        try:
+            return int(spawn_defs.get(spawn_id, {}).get("category"))
+        except (TypeError, ValueError):
+            return None
+
+    enemies = value = 0.0
+    for (spawn_id, _wave), (fixed, expected) in spawns.items():
+        count = fixed + expected
+        if category(spawn_id) in _ENEMY_CATEGORIES:
+            enemies += count
+        value += count * values.get(spawn_id, 0)
+    return {
+        "width": level.width,
+        "height": level.height,
+        "layers": len(level.layers),
+        "spawns": level.entities.record_count(),
+        "enemies": round(enemies, 6),
+        "random_spawns": random_spawns,
+        "value": round(value, 6),
+        "spawn_rows": [(sid, wave, fixed, round(expected, 6)) for (sid, wave), (fixed, expected) in sorted(spawns.items())],
+        "tile_rows": [(tid, cells, pooled) for tid, (cells, pooled) in sorted(tiles.items())],
+    }
+
+
+class LevelCatalog:
+    """SQLite index of per-level facts across mod directories.
+
+    update() rescans mod trees (`<mod>/levels/<area>/<difficulty>/*.lvl`,
+    and the members of `.lvlpack` bundles in the mod or its levels/),
+    re-reading only files whose mtime or size changed (bundle members:
+    whose digest changed) or whose spawns.gon changed, since enemy counts,
+    values and names come from it, and dropping files that are gone; query()
+    answers from the index without opening levels. A connection belongs
+    to the thread that opened the catalog.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or catalog_path()
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(_CATALOG_SCHEMA)
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(levels)")}
+        with self.db:
+            for column, kind in (("hash", "BLOB"), ("spawn_file", "TEXT"), ("spawns_hash", "BLOB")):
+                if column not in columns:
+                    self.db.execute(f"ALTER TABLE levels ADD COLUMN {column} {kind}")
+            if "spawns_hash" not in columns:
+                # Rows from before spawns.gon was tracked: re-index them once.
+                self.db.execute("UPDATE levels SET size = NULL")
+
+    def close(self):
+        self.db.close()
+
+    def update(self, mod_dirs, progress=None):
+        """Index every level under mod_dirs; return {"scanned", "updated", "removed", "errors"}."""
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        stats = {"scanned": 0, "updated": 0, "removed": 0, "errors": 0}
+        defs_cache = {}
+        digests = {}  # spawns.gon path -> digest, read once per update
+        with self.db:
+            for mod_dir in mod_dirs:
+                mod_dir = os.path.abspath(mod_dir)
+                levels_dir = os.path.join(mod_dir, "levels")
+                sources = [levels_dir] if os.path.isdir(levels_dir) else []
+                sources.extend(
+                    os.path.join(mod_dir, name) for name in sorted(os.listdir(mod_dir))
+                    if name.lower().endswith(_BUNDLE_EXT)
+                )
+                if not sources:
+                    raise FileNotFoundError(f"No levels/ directory or level bundle in {mod_dir}")
+                mod_title = None
+                try:
+                    with open(os.path.join(mod_dir, "description.json"), "r", encoding="utf-8") as f:
+                        mod_title = json.load(f).get("title")
+                except (OSError, ValueError, AttributeError):
+                    pass
+                known = {
+                    path: (row_id, mtime_ns, size, digest, spawn_file, spawns_hash)
+                    for row_id, path, mtime_ns, size, digest, spawn_file, spawns_hash in self.db.execute(
+                        "SELECT id, path, mtime_ns, size, hash, spawn_file, spawns_hash FROM levels WHERE mod_dir = ?",
+                        (mod_dir,))
+                }
+                paths = _find_levels(sources, bundles=True)
+                for path in paths:
+                    stats["scanned"] += 1
+                    member = split_bundle_path(path)
+                    if member is None:
+                        st = os.stat(path)
+                        stamp = (st.st_mtime_ns, st.st_size, None)
+                        name = os.path.relpath(path, levels_dir).replace(os.sep, "/")
+                    else:
+                        bundle = open_bundle(member[0])
+                        name = member[1]
+                        stamp = (None, bundle.entries[name][1], bundle.digest(name))
+                    row = known.get(path)
+                    if row and row[1:4] == stamp and (row[4] is None or row[5] == _def_digest(
+                            resolve_def_path(os.path.dirname(path), row[4], base_dir), digests)):
+                        continue
+                    if progress:
+                        progress(path)
+                    error = self._index_level(path, name, stamp, mod_dir, mod_title, base_dir, defs_cache, digests, row)
+                    stats["updated"] += 1
+                    stats["errors"] += error is not None
+                gone = set(known) - set(paths)
+                for path in gone:
+                    self.db.execute("DELETE FROM levels WHERE id = ?", (known[path][0],))
+                stats["removed"] += len(gone)
+        return stats
 
-        raw_prefix = self._build_default_prefix(self.level)
-        new_data = bytearray(raw_prefix + tile_bytes + entity_bytes + self.level.tail)
-        struct.pack_into("<I", new_data, 16, entity_count)
+    def _index_level(self, path, name, stamp, mod_dir, mod_title, base_dir, defs_cache, digests, row):
+        """(Re)write the catalog rows of one level; returns its read error, or None."""
+        parts = name.split("/")
+        area = parts[0] if len(parts) > 1 else None
+        difficulty = parts[1] if len(parts) > 2 else None
+        facts = None
+        spawn_file = spawns_hash = error = None
+        try:
+            level = load_level_data(path)
+            spawn_file = level.spawn_file
+            spawns_path = resolve_def_path(os.path.dirname(path), spawn_file, base_dir)
+            spawns_hash = _def_digest(spawns_path, digests)
+            if spawns_path not in defs_cache:
+                spawn_defs = _parse_gon(spawns_path)
+                defs_cache[spawns_path] = (spawn_defs, spawn_values(spawns_path) if os.path.exists(spawns_path) else {})
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO spawn_names (spawn_id, name, category) VALUES (?, ?, ?)",
+                    [(sid, d.get("name"), _int_or_none(d.get("category"))) for sid, d in spawn_defs.items()],
+                )
+            facts = catalog_facts(path, *defs_cache[spawns_path])
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+        if row:
+            self.db.execute("DELETE FROM levels WHERE id = ?", (row[0],))
+        facts = facts or {}
+        cur = self.db.execute(
+            "INSERT INTO levels (path, mod_dir, mod_title, area, difficulty, name, mtime_ns, size, hash, spawn_file,"
+            " spawns_hash, width, height, layers, spawns, enemies, random_spawns, value, error)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, mod_dir, mod_title, area, difficulty, os.path.splitext(parts[-1])[0],
+             *stamp, spawn_file, spawns_hash, facts.get("width"), facts.get("height"), facts.get("layers"),
+             facts.get("spawns"), facts.get("enemies"), facts.get("random_spawns"), facts.get("value"),
+             error),
+        )
+        level_id = cur.lastrowid
+        self.db.executemany(
+            "INSERT INTO level_spawns (level_id, spawn_id, wave, fixed, expected) VALUES (?, ?, ?, ?, ?)",
+            [(level_id, *r) for r in facts.get("spawn_rows", ())],
+        )
+        self.db.executemany(
+            "INSERT INTO level_tiles (level_id, tile_id, cells, pooled) VALUES (?, ?, ?, ?)",
+            [(level_id, *r) for r in facts.get("tile_rows", ())],
+        )
+        return error
+
+    def spawn_ids(self, spawn):
+        """Spawn ids matching an id ("62", "0x3e") or a case-insensitive name fragment."""
+        try:
+            return [int(str(spawn), 0)]
+        except ValueError:
+            rows = self.db.execute("SELECT spawn_id FROM spawn_names WHERE name LIKE ?", (f"%{spawn}%",))
+            return [spawn_id for (spawn_id,) in rows]
+
+    def query(self, spawn=None, tile=None, area=None, difficulty=None, mod=None,
+              min_enemies=None, max_enemies=None, min_value=None, max_value=None, wave=None):
+        """Return matching levels as dicts, sorted by path. spawn matches
+        levels that place it or can roll it from a pool (see spawn_ids())."""
+        where, params = ["error IS NULL"], []
+        if spawn is not None:
+            ids = self.spawn_ids(spawn)
+            if not ids:
+                return []
+            clause = f"SELECT level_id FROM level_spawns WHERE spawn_id IN ({', '.join('?' * len(ids))})"
+            params.extend(ids)
+            if wave is not None:
+                clause += " AND wave = ?"
+                params.append(wave)
+            where.append(f"id IN ({clause})")
+        if tile is not None:
+            where.append("id IN (SELECT level_id FROM level_tiles WHERE tile_id = ?)")
+            params.append(int(str(tile), 0))
+        for column, op, value in (
+            ("area", "=", area), ("difficulty", "=", difficulty),
+            ("enemies", ">=", min_enemies), ("enemies", "<=", max_enemies),
+            ("value", ">=", min_value), ("value", "<=", max_value),
+        ):
+            if value is not None:
+                where.append(f"{column} {op} ?")
+                params.append(value)
+        if mod is not None:
+            where.append("(mod_title = ? OR mod_dir = ? OR mod_dir LIKE ?)")
+            params.extend((mod, os.path.abspath(mod), f"%{os.sep}{mod}"))
+        cursor = self.db.execute(
+            "SELECT path, mod_title, area, difficulty, name, width, height, spawns, enemies, random_spawns, value"
+            f" FROM levels WHERE {' AND '.join(where)} ORDER BY path", params)
+        columns = [d[0] for d in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def errors(self):
+        return self.db.execute("SELECT path, error FROM levels WHERE error IS NOT NULL ORDER BY path").fetchall()
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _cmd_catalog(args):
+    catalog = LevelCatalog(args.db)
+    try:
+        if args.mod_dirs:
+            try:
+                stats = catalog.update(args.mod_dirs)
+            except FileNotFoundError as exc:
+                print(exc, file=sys.stderr)
+                return 2
+            print(f"Catalog {catalog.path}: {stats['scanned']} level(s), {stats['updated']} updated, "
+                  f"{stats['removed']} removed, {stats['errors']} unreadable", file=sys.stderr)
+        rows = catalog.query(
+            spawn=args.spawn, tile=args.tile, area=args.area, difficulty=args.difficulty, mod=args.mod,
+            min_enemies=args.min_enemies, max_enemies=args.max_enemies,
+            min_value=args.min_value, max_value=args.max_value, wave=args.wave,
+        )
+    finally:
+        catalog.close()
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return 0
+    for row in rows:
+        where = "/".join(part for part in (row["area"], row["difficulty"]) if part)
+        print(f"{row['enemies']:7.2f} enemies {row['value']:8.2f} value  {where:16} {row['path']}")
+    print(f"{len(rows)} level(s)", file=sys.stderr)
+    return 0
 
-        with open(path, "wb") as f:
-            f.write(new_data)
+
+def _cmd_simulate(args):
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    level = load_level_data(args.level)
+    spawns_path = args.spawns or resolve_def_path(os.path.dirname(args.level), level.spawn_file, base_dir)
+    values = spawn_values(spawns_path) if os.path.exists(spawns_path) else {}
+    t0 = time.perf_counter()
+    result = simulate_spawns(level.entities, values, runs=args.runs, seed=args.seed)
+    result["elapsed_ms"] = (time.perf_counter() - t0) * 1e3
+    # JSON keys must be strings: cells become "x,y".
+    result["cells"] = {f"{x},{y}": counts for (x, y), counts in sorted(result["cells"].items())}
+    print(json.dumps(result, indent=2, sort_keys=True, default=str))
+    return 0
+
+
+def _cmd_atlas(args):
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    icons_dir = args.icons or os.path.join(base_dir, "editor_icons")
+    defs = load_defs(
+        args.tiles or resolve_def_path(base_dir, "tiles.gon", base_dir),
+        args.spawns or resolve_def_path(base_dir, "spawns.gon", base_dir),
+    )
+    pairs = icon_pairs_for_defs(defs["tiles"], defs["spawns"])
+    index = None if args.force else load_atlas_index(icons_dir, pairs)
+    if index is not None:
+        print(f"Atlas is up to date: {index['png']}")
+        return 0
+    t0 = time.perf_counter()
+    index = build_icon_atlas(icons_dir, pairs)
+    print(
+        f"Built {len(index['sprites'])} sprite(s) for {len(pairs)} icon/tint pair(s) "
+        f"in {time.perf_counter() - t0:.2f}s: {index['png']} ({index['width']}x{index['height']})"
+    )
+    if index["missing"]:
+        print(f"Missing icons: {', '.join(index['missing'])}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="level_editor.py", description="Mewgenics level editor.")
+    parser.add_argument("--profile", action="store_true", help="show hot-path timings and cache stats in the status bar")
+    parser.add_argument("--trace", metavar="FILE", help="write a session trace (implies --profile): JSON lines, or cProfile stats if FILE ends in .prof")
+    sub = parser.add_subparsers(dest="command")
+
+    bench = sub.add_parser("bench", help="benchmark the level loader and GON parser against the reference implementations")
+    bench.add_argument("paths", nargs="*", help=".lvl files or directories to scan (default: next to this script)")
+    bench.add_argument("--repeat", type=int, default=20, help="best-of-N timing repeats")
+    bench.set_defaults(func=_cmd_bench)
+
+    selftest = sub.add_parser("selftest", help="check .lvl round trips and decoder robustness, and time the hot paths")
+    selftest.add_argument("paths", nargs="*", help=".lvl files or directories to scan (default: next to this script)")
+    selftest.add_argument("--repeat", type=int, default=5, help="best-of-N timing repeats")
+    selftest.add_argument("--fuzz", type=int, default=300, help="corrupted inputs to decode per level")
+    selftest.add_argument("--seed", type=int, default=0, help="seed for synthetic levels and fuzzing")
+    selftest.add_argument("--json", help="append the results as one JSON line to this file")
+    selftest.set_defaults(func=_cmd_selftest)
+
+    batch = sub.add_parser("batch", help="validate and normalize (fully re-encode) every level in a mod without the GUI")
+    batch.add_argument("mod_dir", help="mod directory containing a levels/ tree")
+    batch.add_argument("--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    batch.add_argument("--check", action="store_true", help="report what would change without writing files")
+    batch.add_argument("--report", help="write the JSON report to this file instead of stdout")
+    batch.set_defaults(func=_cmd_batch)
+
+    pack = sub.add_parser("pack", help=f"pack a levels/ tree into one {_BUNDLE_EXT} bundle")
+    pack.add_argument("source", help="mod directory (packs its levels/) or a levels directory")
+    pack.add_argument("-o", "--output", help=f"bundle to write (default: levels{_BUNDLE_EXT} beside the levels directory)")
+    pack.set_defaults(func=_cmd_pack)
+
+    unpack = sub.add_parser("unpack", help=f"extract, list or verify a {_BUNDLE_EXT} bundle")
+    unpack.add_argument("bundle")
+    unpack.add_argument("-o", "--output", help="directory to extract into (default: the bundle path without its extension)")
+    unpack.add_argument("--list", action="store_true", help="print digest, size and name of every member")
+    unpack.add_argument("--verify", action="store_true", help="only check every member against its digest")
+    unpack.set_defaults(func=_cmd_unpack)
+
+    thumbs = sub.add_parser("thumbs", help="render level thumbnails (PNG) without a display, with a contact sheet")
+    thumbs.add_argument("paths", nargs="+", help=f".lvl files, {_BUNDLE_EXT} bundles or directories (e.g. a mod)")
+    thumbs.add_argument("--out", help="copy the thumbnails here and write an index.html contact sheet")
+    thumbs.add_argument("--cell", type=int, choices=_VALID_CELL_SIZES, default=16, help="pixels per cell (default: 16)")
+    thumbs.add_argument("--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    thumbs.add_argument("--icons", help="editor_icons directory (default: the one next to the editor)")
+    thumbs.set_defaults(func=_cmd_thumbs)
+
+    catalog = sub.add_parser("catalog", help="index mod levels in SQLite and query them (which levels use spawn X, ...)")
+    catalog.add_argument("mod_dirs", nargs="*", help="mod directories to (re)index first; unchanged files are skipped")
+    catalog.add_argument("--db", help="catalog database (default: catalog.sqlite3 in the editor cache)")
+    catalog.add_argument("--spawn", help="spawn id or name fragment the level places or can roll")
+    catalog.add_argument("--wave", type=int, help="with --spawn, only in this wave")
+    catalog.add_argument("--tile", help="tile id the level uses")
+    catalog.add_argument("--area", help="area directory, e.g. alley")
+    catalog.add_argument("--difficulty", help="difficulty directory, e.g. easy")
+    catalog.add_argument("--mod", help="mod title or directory")
+    catalog.add_argument("--min-enemies", type=float, help="at least this many (expected) enemies")
+    catalog.add_argument("--max-enemies", type=float)
+    catalog.add_argument("--min-value", type=float, help="expected total `value` at least this")
+    catalog.add_argument("--max-value", type=float)
+    catalog.add_argument("--json", action="store_true", help="print matches as JSON")
+    catalog.set_defaults(func=_cmd_catalog)
+
+    simulate = sub.add_parser("simulate", help="Monte Carlo the random spawns of a level and report outcome odds")
+    simulate.add_argument("level", help=".lvl file")
+    simulate.add_argument("--runs", type=int, default=_SIM_RUNS, help="number of resolutions (default: %(default)s)")
+    simulate.add_argument("--seed", type=int, default=None, help="seed for reproducible runs")
+    simulate.add_argument("--spawns", help="spawns.gon to read `value` from (default: the level's spawn file)")
+    simulate.set_defaults(func=_cmd_simulate)
+
+    atlas = sub.add_parser("atlas", help="prebuild the color-keyed, tinted icon atlas the editor draws from")
+    atlas.add_argument("--icons", help="icon directory (default: editor_icons next to this script)")
+    atlas.add_argument("--tiles", help="tiles.gon to collect icon/tint pairs from")
+    atlas.add_argument("--spawns", help="spawns.gon to collect icon/tint pairs from")
+    atlas.add_argument("--force", action="store_true", help="rebuild even if the cached atlas is current")
+    atlas.set_defaults(func=_cmd_atlas)
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        profiler = Profiler(args.trace) if args.profile or args.trace else None
+        app = LevelEditor(profiler=profiler)
+        try:
+            app.mainloop()
+        finally:
+            if profiler is not None:
+                profiler.close()
+        return 0
+    return args.func(args)
 
 
 if __name__ == "__main__":
-    app = LevelEditor()
-    app.mainloop()
+    sys.exit(main())
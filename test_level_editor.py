@@ -0,0 +1,167 @@
+"""Format and parser checks from `level_editor.py selftest`, as unit tests.
+
+Run with `python -m pytest` or `python -m unittest` from this directory.
+"""
+import marshal
+import os
+import tempfile
+import unittest
+
+import level_editor as le
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+EXAMPLE_LEVELS = le._find_levels([BASE_DIR])
+
+
+class RoundTripTest(unittest.TestCase):
+    def test_example_levels(self):
+        self.assertTrue(EXAMPLE_LEVELS, "no example levels found")
+        for path in EXAMPLE_LEVELS:
+            with self.subTest(level=os.path.relpath(path, BASE_DIR)):
+                self.assertEqual(le.check_round_trip(path), [])
+
+    def test_synthetic_levels(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, options in le._SYNTHETIC_LEVELS.items():
+                with self.subTest(level=name):
+                    path = os.path.join(tmp, f"{name}.lvl")
+                    with open(path, "wb") as f:
+                        f.write(le.synthetic_level(**options))
+                    self.assertEqual(le.check_round_trip(path, exact_reencode=True), [])
+
+    def test_synthetic_levels_other_seeds(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "level.lvl")
+            for seed in range(1, 6):
+                with self.subTest(seed=seed):
+                    with open(path, "wb") as f:
+                        f.write(le.synthetic_level(seed=seed, width=24, height=16, layers=2, random_tiles=0.3,
+                                                   random_entities=0.5))
+                    self.assertEqual(le.check_round_trip(path, exact_reencode=True), [])
+
+
+class FuzzTest(unittest.TestCase):
+    def test_example_levels(self):
+        for i, path in enumerate(EXAMPLE_LEVELS):
+            with open(path, "rb") as f:
+                data = f.read()
+            if len(data) > le._FUZZ_MAX_BYTES:
+                continue
+            with self.subTest(level=os.path.relpath(path, BASE_DIR)):
+                self.assertEqual(le.fuzz_decode(data, cases=150, seed=i), [])
+
+    def test_synthetic_levels(self):
+        for name in ("small", "random_tiles", "layers", "pools_255"):
+            with self.subTest(level=name):
+                data = le.synthetic_level(**le._SYNTHETIC_LEVELS[name])
+                self.assertEqual(le.fuzz_decode(data, cases=150), [])
+
+
+class BundleTest(unittest.TestCase):
+    def test_pack_load_unpack(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ("small", "random_tiles", "pools_255"):
+                os.makedirs(os.path.join(tmp, "area", "easy"), exist_ok=True)
+                with open(os.path.join(tmp, "area", "easy", f"{name}.lvl"), "wb") as f:
+                    f.write(le.synthetic_level(**le._SYNTHETIC_LEVELS[name]))
+            bundle_path = os.path.join(tmp, "levels" + le._BUNDLE_EXT)
+            self.assertEqual(le.pack_levels(tmp, bundle_path), 3)
+            self.assertEqual(le.check_bundle(bundle_path, tmp), [])
+
+            level = le.load_level_data(le.open_bundle(bundle_path).member_path("area/easy/small.lvl"))
+            le.close_bundle(bundle_path)  # still viewed by level: unmapped once it goes
+            del level
+            bundle = le.open_bundle(bundle_path)
+            le.close_bundle(bundle_path)
+            with self.assertRaises(ValueError):
+                bundle.data("area/easy/small.lvl")  # unmapped, so the directory can go
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.level = le.LevelData(8, 8)
+        self.journal = le.EditJournal(max_bytes=1 << 20)
+
+    def test_stroke_undoes_in_one_step(self):
+        original = le._level_fields(self.level)
+        self.journal.begin()
+        for x in range(5):
+            self.journal.set_tile(self.level, x, 0, 7)
+        self.journal.set_entities(self.level, (2, 2), [le.SpawnObject(id=5, wave=1)])
+        self.journal.commit()
+        self.assertEqual(self.level.tile_at(4, 0), 7)
+        cells = self.journal.undo(self.level)
+        self.assertEqual(cells, {(x, 0) for x in range(5)} | {(2, 2)})
+        self.assertEqual(le._level_fields(self.level), original)
+        self.assertFalse(self.journal.can_undo)
+        self.journal.redo(self.level)
+        self.assertEqual([self.level.tile_at(x, 0) for x in range(5)], [7] * 5)
+        self.assertEqual(self.level.entities.get((2, 2))[0].id, 5)
+
+    def test_new_edit_clears_redo(self):
+        self.journal.set_tile(self.level, 1, 1, 3)
+        self.journal.set_tile(self.level, 1, 1, 4)
+        self.journal.undo(self.level)
+        self.assertTrue(self.journal.can_redo)
+        self.journal.set_tile(self.level, 2, 2, 9)
+        self.assertFalse(self.journal.can_redo)
+        self.assertIsNone(self.journal.redo(self.level))
+        self.assertEqual((self.level.tile_at(1, 1), self.level.tile_at(2, 2)), (3, 9))
+
+    def test_eviction_keeps_saved_point(self):
+        one_entry = le._delta_bytes(("tile", 0, 0, (0, None), (1, None)))
+        journal = le.EditJournal(max_bytes=3 * one_entry)
+        for x in range(2):
+            journal.set_tile(self.level, x, 0, 1)
+        journal.mark_saved()
+        self.assertFalse(journal.modified)
+        for x in range(3):
+            journal.set_tile(self.level, x, 1, 2)
+        self.assertEqual(len(journal._undo), 3)  # the two saved entries were evicted
+        self.assertEqual(journal._saved_depth, 0)
+        self.assertTrue(journal.modified)
+        self.assertEqual(len(journal.unsaved_entries()), 3)
+        for _ in range(3):
+            journal.undo(self.level)
+        self.assertEqual(journal._saved_depth, 0)
+        self.assertEqual(journal.unsaved_entries(), [])
+        self.assertEqual([self.level.tile_at(x, 1) for x in range(3)], [0, 0, 0])
+        self.assertEqual([self.level.tile_at(x, 0) for x in range(2)], [1, 1])
+
+    def test_unsaved_entries_restore_round_trip(self):
+        self.journal.set_tile(self.level, 0, 0, 2)
+        self.journal.mark_saved()
+        saved = le._level_fields(self.level)
+        self.journal.begin()
+        self.journal.set_tile(self.level, 1, 0, 6)
+        self.journal.set_entities(self.level, (3, 3), [le.SpawnObject(id=0xFFFF, wave=2, roll_index=1,
+                                                                         options=[(5, 1), (6, 3)])])
+        self.journal.commit()
+        self.journal.set_tile(self.level, 0, 0, 8)
+        packed = marshal.loads(marshal.dumps(self.journal.unsaved_entries()))  # as recovery stores them
+        self.assertEqual(len(packed), 2)
+
+        restored = le.EditJournal(max_bytes=1 << 20)
+        restored.restore_entries(packed)
+        self.assertTrue(restored.modified)
+        edited = le._level_fields(self.level)
+        restored.undo(self.level)
+        restored.undo(self.level)
+        self.assertFalse(restored.can_undo)
+        self.assertEqual(le._level_fields(self.level), saved)
+        restored.redo(self.level)
+        restored.redo(self.level)
+        self.assertEqual(le._level_fields(self.level), edited)
+
+
+class GonEditTest(unittest.TestCase):
+    def test_incremental_reparse(self):
+        for stem in ("spawns", "tiles"):
+            with self.subTest(file=f"{stem}.gon"):
+                with open(os.path.join(BASE_DIR, f"{stem}.gon"), "r", encoding="utf-8") as f:
+                    text = f.read()
+                self.assertEqual(le.check_gon_edits(text, cases=100), [])
+
+
+if __name__ == "__main__":
+    unittest.main()